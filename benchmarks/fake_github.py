@@ -0,0 +1,887 @@
+"""A local stand-in for the GitHub REST and GraphQL apis, for benchmarking repo_manager
+
+It implements just the endpoints repo_manager calls, against in-memory FakeRepos, with configurable latency, page
+sizes, and rate limit. Every request is recorded so a benchmark can report how many requests, to which endpoints,
+and how long they took.
+"""
+
+import json
+import re
+import threading
+import time
+from base64 import b64encode
+from dataclasses import dataclass
+from dataclasses import field
+from hashlib import sha1
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlencode
+from urllib.parse import urlparse
+
+# A valid curve25519 public key, so secrets can be encrypted against it
+PUBLIC_KEY = b64encode(bytes(range(32))).decode("ascii")
+
+
+def git_sha(kind: str, contents: bytes) -> str:
+    return sha1(b"%s %d\0" % (kind.encode("ascii"), len(contents)) + contents, usedforsecurity=False).hexdigest()
+
+
+@dataclass
+class FakeRepo:
+    """A repo's state, as the fake api serves it"""
+
+    owner: str
+    name: str
+    settings: dict[str, Any] = field(default_factory=dict)
+    topics: list[str] = field(default_factory=list)
+    # name -> {"name", "color", "description"}
+    labels: dict[str, dict[str, Any]] = field(default_factory=dict)
+    # branch name -> its protection, in the REST api's shape, or None if unprotected
+    branches: dict[str, dict[str, Any] | None] = field(default_factory=lambda: {"main": None})
+    # secret type, actions, dependabot or environments/<name> -> secret names
+    secrets: dict[str, set[str]] = field(default_factory=lambda: {"actions": set(), "dependabot": set()})
+    # (secret type, secret name) -> when the secret was last set, for secrets set through the api
+    secrets_updated_at: dict[tuple[str, str], str] = field(default_factory=dict)
+    # path -> contents of the files on every branch
+    files: dict[str, bytes] = field(default_factory=dict)
+    # bumped like GitHub does, updated_at when the repo is edited and pushed_at when a branch is pushed to
+    updated_at: str = "2024-01-01T00:00:00Z"
+    pushed_at: str = "2024-01-01T00:00:00Z"
+    revision: int = 0
+
+    def __post_init__(self):
+        self.lock = threading.Lock()
+        self.blobs = {git_sha("blob", contents): contents for contents in self.files.values()}
+        self.trees = {}
+        self.commits = {}
+        self.parents = {}
+        head = self.commit(self.tree(dict(self.files)), "Initial commit")
+        self.heads = {branch: head for branch in self.branches}
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.owner}/{self.name}"
+
+    def tree(self, files: dict[str, bytes]) -> str:
+        tree_sha = git_sha("tree", json.dumps(sorted((path, git_sha("blob", c)) for path, c in files.items())).encode())
+        self.trees[tree_sha] = files
+        return tree_sha
+
+    def commit(self, tree_sha: str, message: str, parents: list[str] | None = None) -> str:
+        commit_sha = git_sha("commit", f"{tree_sha}\n{message}\n{len(self.commits)}".encode())
+        self.commits[commit_sha] = tree_sha
+        self.parents[commit_sha] = parents or []
+        return commit_sha
+
+    def touch(self, pushed: bool = False):
+        # a second per change, so every change moves the markers however fast the changes come
+        self.revision += 1
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1704067200 + self.revision))
+        self.updated_at = stamp
+        if pushed:
+            self.pushed_at = stamp
+
+    def is_ancestor(self, ancestor: str, commit_sha: str) -> bool:
+        pending = [commit_sha]
+        while pending:
+            commit_sha = pending.pop()
+            if commit_sha == ancestor:
+                return True
+            pending.extend(self.parents.get(commit_sha, []))
+        return False
+
+
+class NotFound(Exception): ...
+
+
+class FakeGithub:
+    """The fake api's routes and state, served by FakeGithubServer"""
+
+    def __init__(
+        self,
+        repos: list[FakeRepo],
+        latency: float = 0.0,
+        page_size: int = 30,
+        rate_limit: int = 5000,
+        rate_limit_window: float = 3600.0,
+        graphql: bool = True,
+        etags: bool = True,
+    ):
+        self.repos = {repo.full_name.lower(): repo for repo in repos}
+        self.latency = latency
+        self.page_size = page_size
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.graphql = graphql
+        self.etags = etags
+        self._lock = threading.Lock()
+        self.reset_stats()
+        self.routes = [
+            (method, re.compile(f"^{pattern}$"), template, handler)
+            for method, pattern, template, handler in [
+                ("POST", r"/api/graphql", "POST /graphql", self.post_graphql),
+                ("GET", r"/api/v3/orgs/([^/]+)", "GET /orgs/{org}", self.get_org),
+                ("GET", r"/api/v3/orgs/([^/]+)/repos", "GET /orgs/{org}/repos", self.get_org_repos),
+                ("GET", r"/api/v3/search/repositories", "GET /search/repositories", self.search_repos),
+                ("GET", r"/api/v3/repos/([^/]+)/([^/]+)", "GET /repos/{repo}", self.get_repo),
+                ("PATCH", r"/api/v3/repos/([^/]+)/([^/]+)", "PATCH /repos/{repo}", self.patch_repo),
+                ("GET", r"/api/v3/repos/([^/]+)/([^/]+)/topics", "GET /repos/{repo}/topics", self.get_topics),
+                ("PUT", r"/api/v3/repos/([^/]+)/([^/]+)/topics", "PUT /repos/{repo}/topics", self.put_topics),
+                (
+                    "PUT|DELETE",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/(automated-security-fixes|vulnerability-alerts)",
+                    "{method} /repos/{repo}/{security}",
+                    self.no_content,
+                ),
+                ("GET", r"/api/v3/repos/([^/]+)/([^/]+)/labels", "GET /repos/{repo}/labels", self.get_labels),
+                ("POST", r"/api/v3/repos/([^/]+)/([^/]+)/labels", "POST /repos/{repo}/labels", self.post_label),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/labels/(.+)",
+                    "GET /repos/{repo}/labels/{name}",
+                    self.get_label,
+                ),
+                (
+                    "PATCH",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/labels/(.+)",
+                    "PATCH /repos/{repo}/labels/{name}",
+                    self.patch_label,
+                ),
+                (
+                    "DELETE",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/labels/(.+)",
+                    "DELETE /repos/{repo}/labels/{name}",
+                    self.delete_label,
+                ),
+                ("GET", r"/api/v3/repos/([^/]+)/([^/]+)/branches", "GET /repos/{repo}/branches", self.get_branches),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/branches/([^/]+)",
+                    "GET /repos/{repo}/branches/{branch}",
+                    self.get_branch,
+                ),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/branches/([^/]+)/protection",
+                    "GET /repos/{repo}/branches/{branch}/protection",
+                    self.get_protection,
+                ),
+                (
+                    "PUT",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/branches/([^/]+)/protection",
+                    "PUT /repos/{repo}/branches/{branch}/protection",
+                    self.put_protection,
+                ),
+                (
+                    "DELETE",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/branches/([^/]+)/protection",
+                    "DELETE /repos/{repo}/branches/{branch}/protection",
+                    self.delete_protection,
+                ),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/branches/([^/]+)/protection/([a-z_]+)",
+                    "GET /repos/{repo}/branches/{branch}/protection/{setting}",
+                    self.protection_setting,
+                ),
+                (
+                    "PATCH",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/branches/([^/]+)/protection/([a-z_]+)",
+                    "PATCH /repos/{repo}/branches/{branch}/protection/{setting}",
+                    self.patch_protection_setting,
+                ),
+                (
+                    "POST",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/branches/([^/]+)/protection/([a-z_]+)",
+                    "POST /repos/{repo}/branches/{branch}/protection/{setting}",
+                    self.enable_protection_setting,
+                ),
+                (
+                    "DELETE",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/branches/([^/]+)/protection/([a-z_]+)",
+                    "DELETE /repos/{repo}/branches/{branch}/protection/{setting}",
+                    self.disable_protection_setting,
+                ),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/(actions|dependabot|environments/[^/]+)/secrets/public-key",
+                    "GET /repos/{repo}/{type}/secrets/public-key",
+                    self.get_public_key,
+                ),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/(actions|dependabot|environments/[^/]+)/secrets",
+                    "GET /repos/{repo}/{type}/secrets",
+                    self.get_secrets,
+                ),
+                (
+                    "PUT",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/(actions|dependabot|environments/[^/]+)/secrets/([^/]+)",
+                    "PUT /repos/{repo}/{type}/secrets/{name}",
+                    self.put_secret,
+                ),
+                (
+                    "DELETE",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/(actions|dependabot|environments/[^/]+)/secrets/([^/]+)",
+                    "DELETE /repos/{repo}/{type}/secrets/{name}",
+                    self.delete_secret,
+                ),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/contents/(.+)",
+                    "GET /repos/{repo}/contents/{path}",
+                    self.get_contents,
+                ),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/git/ref/heads/(.+)",
+                    "GET /repos/{repo}/git/ref/heads/{branch}",
+                    self.get_ref,
+                ),
+                (
+                    "PATCH",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/git/refs/heads/(.+)",
+                    "PATCH /repos/{repo}/git/refs/heads/{branch}",
+                    self.patch_ref,
+                ),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/git/commits/([^/]+)",
+                    "GET /repos/{repo}/git/commits/{sha}",
+                    self.get_commit,
+                ),
+                (
+                    "POST",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/git/commits",
+                    "POST /repos/{repo}/git/commits",
+                    self.post_commit,
+                ),
+                (
+                    "GET",
+                    r"/api/v3/repos/([^/]+)/([^/]+)/git/trees/([^/]+)",
+                    "GET /repos/{repo}/git/trees/{sha}",
+                    self.get_tree,
+                ),
+                ("POST", r"/api/v3/repos/([^/]+)/([^/]+)/git/trees", "POST /repos/{repo}/git/trees", self.post_tree),
+            ]
+        ]
+
+    # Bookkeeping
+
+    def reset_stats(self):
+        """Clear the request log and refill the rate limit"""
+        with self._lock:
+            # (method and route template, status, seconds to handle)
+            self.requests: list[tuple[str, int, float]] = []
+            # connections accepted, each can carry many requests with keep-alive
+            self.connections = 0
+            # perf_counter of the first request, to time how long a process took to start making them
+            self.first_request_at: float | None = None
+            self.remaining = {"core": self.rate_limit, "graphql": self.rate_limit}
+            self.reset_at = time.time() + self.rate_limit_window
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def _rate_limit_headers(self, resource: str, cost: int) -> tuple[dict[str, str], bool]:
+        with self._lock:
+            if time.time() >= self.reset_at:
+                self.remaining = {"core": self.rate_limit, "graphql": self.rate_limit}
+                self.reset_at = time.time() + self.rate_limit_window
+            limited = self.remaining[resource] < cost
+            if not limited:
+                self.remaining[resource] -= cost
+            headers = {
+                "X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(self.remaining[resource]),
+                "X-RateLimit-Used": str(self.rate_limit - self.remaining[resource]),
+                "X-RateLimit-Reset": str(int(self.reset_at)),
+                "X-RateLimit-Resource": resource,
+            }
+        return headers, limited
+
+    def repo(self, owner: str, name: str) -> FakeRepo:
+        repo = self.repos.get(f"{owner}/{name}".lower(), None)
+        if repo is None:
+            raise NotFound()
+        return repo
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/api/v3{path}"
+
+    def page(self, items: list[Any], query: dict[str, list[str]], path: str) -> tuple[list[Any], dict[str, str]]:
+        """Paginate items like GitHub does, with a Link header to the next page"""
+        per_page = min(int(query.get("per_page", [self.page_size])[0]), 100)
+        page = int(query.get("page", ["1"])[0])
+        start = (page - 1) * per_page
+        headers = {}
+        if start + per_page < len(items):
+            next_query = {key: values[0] for key, values in query.items()}
+            next_query.update({"page": page + 1, "per_page": per_page})
+            last_query = dict(next_query, page=(len(items) - 1) // per_page + 1)
+            headers["Link"] = (
+                f'<{self.url(path)}?{urlencode(next_query)}>; rel="next", '
+                + f'<{self.url(path)}?{urlencode(last_query)}>; rel="last"'
+            )
+        return items[start : start + per_page], headers
+
+    def handle(
+        self, method: str, raw_path: str, headers: dict[str, str], body: bytes
+    ) -> tuple[int, dict[str, str], bytes]:
+        """Route a request, returning its status, headers and body"""
+        started = time.perf_counter()
+        with self._lock:
+            if self.first_request_at is None:
+                self.first_request_at = started
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        parsed = urlparse(raw_path)
+        query = parse_qs(parsed.query)
+        path = parsed.path
+        data = json.loads(body) if body else {}
+
+        template = f"{method} {path}"
+        status, response_headers, payload = 404, {}, {"message": "Not Found"}
+        for route_methods, pattern, route_template, handler in self.routes:
+            match = pattern.match(path)
+            if match is None or method not in route_methods.split("|"):
+                continue
+            template = route_template.replace("{method}", method)
+            if handler == self.post_graphql and not self.graphql:
+                break
+            try:
+                status, response_headers, payload = handler(*[unquote(g) for g in match.groups()], query, data)
+            except NotFound:
+                status, response_headers, payload = 404, {}, {"message": "Not Found"}
+            break
+
+        resource = "graphql" if template == "POST /graphql" else "core"
+        response_body = json.dumps(payload).encode() if payload is not None else b""
+        etag = f'"{sha256(response_body).hexdigest()}"'
+        if self.etags and method == "GET" and status == 200:
+            response_headers["ETag"] = etag
+        not_modified = self.etags and method == "GET" and status == 200 and headers.get("If-None-Match") == etag
+        # Conditional requests that come back 304 don't count against the rate limit
+        rate_limit_headers, limited = self._rate_limit_headers(resource, 0 if not_modified else 1)
+        response_headers.update(rate_limit_headers)
+        if limited:
+            status, response_body = 403, json.dumps({"message": "API rate limit exceeded"}).encode()
+        elif not_modified:
+            status, response_body = 304, b""
+
+        with self._lock:
+            self.requests.append((template, status, time.perf_counter() - started))
+        return status, response_headers, response_body
+
+    # Handlers. Each takes the route's groups, the query string and the json body, and returns
+    # (status, headers, json payload)
+
+    def repo_json(self, repo: FakeRepo) -> dict[str, Any]:
+        return {
+            "id": abs(hash(repo.full_name)) % 10**8,
+            "name": repo.name,
+            "full_name": repo.full_name,
+            "owner": {"login": repo.owner, "type": "Organization"},
+            "organization": {"login": repo.owner},
+            "url": self.url(f"/repos/{repo.full_name}"),
+            "topics": list(repo.topics),
+            "archived": False,
+            "visibility": "private" if repo.settings.get("private", False) else "public",
+            "updated_at": repo.updated_at,
+            "pushed_at": repo.pushed_at,
+            **repo.settings,
+        }
+
+    def get_org(self, org, query, data):
+        if not any(repo.owner.lower() == org.lower() for repo in self.repos.values()):
+            raise NotFound()
+        return 200, {}, {"login": org, "url": self.url(f"/orgs/{org}")}
+
+    def get_org_repos(self, org, query, data):
+        repos = [self.repo_json(repo) for repo in self.repos.values() if repo.owner.lower() == org.lower()]
+        items, headers = self.page(repos, query, f"/orgs/{org}/repos")
+        return 200, headers, items
+
+    def search_repos(self, query, data):
+        """Repository search, supporting the user:, topic:, is:, archived: and fork: qualifiers"""
+        matches = list(self.repos.values())
+        for qualifier in query.get("q", [""])[0].split():
+            key, _, value = qualifier.partition(":")
+            if key == "user":
+                matches = [repo for repo in matches if repo.owner.lower() == value.lower()]
+            elif key == "topic":
+                matches = [repo for repo in matches if value in repo.topics]
+            elif key == "is":
+                matches = [repo for repo in matches if self.repo_json(repo)["visibility"] == value]
+            elif key == "archived":
+                matches = [repo for repo in matches if repo.settings.get("archived", False) == (value == "true")]
+        items, headers = self.page([self.repo_json(repo) for repo in matches], query, "/search/repositories")
+        return 200, headers, {"total_count": len(matches), "incomplete_results": False, "items": items}
+
+    def get_repo(self, owner, name, query, data):
+        return 200, {}, self.repo_json(self.repo(owner, name))
+
+    def patch_repo(self, owner, name, query, data):
+        repo = self.repo(owner, name)
+        with repo.lock:
+            repo.settings.update({key: value for key, value in data.items() if key != "name"})
+            repo.touch()
+        return 200, {}, self.repo_json(repo)
+
+    def get_topics(self, owner, name, query, data):
+        return 200, {}, {"names": list(self.repo(owner, name).topics)}
+
+    def put_topics(self, owner, name, query, data):
+        repo = self.repo(owner, name)
+        with repo.lock:
+            repo.topics = list(data["names"])
+            repo.touch()
+        return 200, {}, {"names": repo.topics}
+
+    def no_content(self, owner, name, setting, query, data):
+        self.repo(owner, name)
+        return 204, {}, None
+
+    def label_json(self, repo: FakeRepo, label: dict[str, Any]) -> dict[str, Any]:
+        return {**label, "url": self.url(f"/repos/{repo.full_name}/labels/{label['name']}")}
+
+    def get_labels(self, owner, name, query, data):
+        repo = self.repo(owner, name)
+        labels = [self.label_json(repo, label) for label in repo.labels.values()]
+        items, headers = self.page(labels, query, f"/repos/{repo.full_name}/labels")
+        return 200, headers, items
+
+    def get_label(self, owner, name, label_name, query, data):
+        repo = self.repo(owner, name)
+        if label_name not in repo.labels:
+            raise NotFound()
+        return 200, {}, self.label_json(repo, repo.labels[label_name])
+
+    def post_label(self, owner, name, query, data):
+        repo = self.repo(owner, name)
+        label = {"name": data["name"], "color": data["color"], "description": data.get("description", None)}
+        with repo.lock:
+            repo.labels[label["name"]] = label
+        return 201, {}, self.label_json(repo, label)
+
+    def patch_label(self, owner, name, label_name, query, data):
+        repo = self.repo(owner, name)
+        with repo.lock:
+            if label_name not in repo.labels:
+                raise NotFound()
+            label = repo.labels.pop(label_name)
+            label.update(data)
+            repo.labels[label["name"]] = label
+        return 200, {}, self.label_json(repo, label)
+
+    def delete_label(self, owner, name, label_name, query, data):
+        repo = self.repo(owner, name)
+        with repo.lock:
+            if repo.labels.pop(label_name, None) is None:
+                raise NotFound()
+        return 204, {}, None
+
+    def branch_json(self, repo: FakeRepo, branch: str) -> dict[str, Any]:
+        url = self.url(f"/repos/{repo.full_name}/branches/{branch}")
+        return {
+            "name": branch,
+            "commit": {"sha": repo.heads[branch]},
+            "protected": repo.branches[branch] is not None,
+            "protection_url": f"{url}/protection",
+            "_links": {"self": url},
+        }
+
+    def get_branches(self, owner, name, query, data):
+        repo = self.repo(owner, name)
+        branches = [
+            self.branch_json(repo, branch)
+            for branch, protection in repo.branches.items()
+            if query.get("protected", ["false"])[0] != "true" or protection is not None
+        ]
+        items, headers = self.page(branches, query, f"/repos/{repo.full_name}/branches")
+        return 200, headers, items
+
+    def get_branch(self, owner, name, branch, query, data):
+        repo = self.repo(owner, name)
+        if branch not in repo.branches:
+            raise NotFound()
+        return 200, {}, self.branch_json(repo, branch)
+
+    def protection_json(self, repo: FakeRepo, branch: str) -> dict[str, Any]:
+        protection = repo.branches.get(branch, None)
+        if protection is None:
+            raise NotFound()
+        return {"url": self.url(f"/repos/{repo.full_name}/branches/{branch}/protection"), **protection}
+
+    def get_protection(self, owner, name, branch, query, data):
+        return 200, {}, self.protection_json(self.repo(owner, name), branch)
+
+    def put_protection(self, owner, name, branch, query, data):
+        repo = self.repo(owner, name)
+        if branch not in repo.branches:
+            raise NotFound()
+        protection = dict(repo.branches[branch] or make_protection())
+        for setting, value in data.items():
+            if setting in ("required_status_checks", "required_pull_request_reviews", "restrictions"):
+                # like GitHub, a disabled section is left out of the protection rather than set to null
+                if value is not None and setting == "required_pull_request_reviews":
+                    protection[setting] = {
+                        "dismiss_stale_reviews": False,
+                        "require_code_owner_reviews": False,
+                        "required_approving_review_count": 0,
+                        "dismissal_restrictions": {"users": [], "teams": []},
+                        **value,
+                    }
+                elif value is not None and setting == "restrictions":
+                    url = self.url(f"/repos/{repo.full_name}/branches/{branch}/protection/restrictions")
+                    protection[setting] = {
+                        "users_url": f"{url}/users",
+                        "teams_url": f"{url}/teams",
+                        "users": [{"login": user} for user in value.get("users", [])],
+                        "teams": [{"slug": team} for team in value.get("teams", [])],
+                    }
+                elif value is not None:
+                    protection[setting] = value
+                else:
+                    protection.pop(setting, None)
+            elif value is not None:
+                protection[setting] = {"enabled": value}
+        repo.branches[branch] = protection
+        return 200, {}, self.protection_json(repo, branch)
+
+    def delete_protection(self, owner, name, branch, query, data):
+        repo = self.repo(owner, name)
+        if repo.branches.get(branch, None) is None:
+            raise NotFound()
+        repo.branches[branch] = None
+        return 204, {}, None
+
+    def protection_setting(self, owner, name, branch, setting, query, data):
+        protection = self.protection_json(self.repo(owner, name), branch)
+        return 200, {}, protection.get(setting, {})
+
+    def patch_protection_setting(self, owner, name, branch, setting, query, data):
+        repo = self.repo(owner, name)
+        protection = self.protection_json(repo, branch)
+        if protection.get(setting, None) is None:
+            raise NotFound()
+        # only the fields sent are changed
+        repo.branches[branch][setting] = {**protection[setting], **data}
+        return 200, {}, repo.branches[branch][setting]
+
+    def enable_protection_setting(self, owner, name, branch, setting, query, data):
+        repo = self.repo(owner, name)
+        self.protection_json(repo, branch)
+        repo.branches[branch][setting] = {"enabled": True}
+        return 200, {}, repo.branches[branch][setting]
+
+    def disable_protection_setting(self, owner, name, branch, setting, query, data):
+        repo = self.repo(owner, name)
+        self.protection_json(repo, branch)
+        repo.branches[branch][setting] = {"enabled": False}
+        return 204, {}, None
+
+    def secrets(self, owner: str, name: str, secret_type: str) -> tuple[FakeRepo, set[str]]:
+        """A repo, and its secrets of secret_type. Environments that don't exist are a 404, like GitHub"""
+        repo = self.repo(owner, name)
+        if secret_type not in repo.secrets:
+            raise NotFound()
+        return repo, repo.secrets[secret_type]
+
+    def get_public_key(self, owner, name, secret_type, query, data):
+        self.secrets(owner, name, secret_type)
+        return 200, {}, {"key_id": "1234", "key": PUBLIC_KEY}
+
+    def get_secrets(self, owner, name, secret_type, query, data):
+        repo, repo_secrets = self.secrets(owner, name, secret_type)
+        secrets = [
+            {"name": secret, "updated_at": repo.secrets_updated_at.get((secret_type, secret), "2024-01-01T00:00:00Z")}
+            for secret in sorted(repo_secrets)
+        ]
+        items, headers = self.page(secrets, query, f"/repos/{repo.full_name}/{secret_type}/secrets")
+        return 200, headers, {"total_count": len(secrets), "secrets": items}
+
+    def put_secret(self, owner, name, secret_type, secret_name, query, data):
+        repo, repo_secrets = self.secrets(owner, name, secret_type)
+        with repo.lock:
+            existed = secret_name in repo_secrets
+            repo_secrets.add(secret_name)
+            repo.secrets_updated_at[(secret_type, secret_name)] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        return 204 if existed else 201, {}, None
+
+    def delete_secret(self, owner, name, secret_type, secret_name, query, data):
+        repo, repo_secrets = self.secrets(owner, name, secret_type)
+        with repo.lock:
+            if secret_name not in repo_secrets:
+                raise NotFound()
+            repo_secrets.discard(secret_name)
+        return 204, {}, None
+
+    def get_contents(self, owner, name, path, query, data):
+        repo = self.repo(owner, name)
+        ref = query.get("ref", [None])[0]
+        commit = repo.heads.get(ref, ref) if ref is not None else next(iter(repo.heads.values()))
+        files = repo.trees[repo.commits[commit]]
+        if path not in files:
+            raise NotFound()
+        return (
+            200,
+            {},
+            {
+                "type": "file",
+                "name": path.rsplit("/", 1)[-1],
+                "path": path,
+                "sha": git_sha("blob", files[path]),
+                "encoding": "base64",
+                "content": b64encode(files[path]).decode("ascii"),
+                "url": self.url(f"/repos/{repo.full_name}/contents/{path}"),
+            },
+        )
+
+    def get_ref(self, owner, name, branch, query, data):
+        repo = self.repo(owner, name)
+        if branch not in repo.heads:
+            raise NotFound()
+        return (
+            200,
+            {},
+            {
+                "ref": f"refs/heads/{branch}",
+                "url": self.url(f"/repos/{repo.full_name}/git/refs/heads/{branch}"),
+                "object": {"sha": repo.heads[branch], "type": "commit"},
+            },
+        )
+
+    def patch_ref(self, owner, name, branch, query, data):
+        repo = self.repo(owner, name)
+        with repo.lock:
+            if not data.get("force", False) and not repo.is_ancestor(repo.heads[branch], data["sha"]):
+                return 422, {}, {"message": "Update is not a fast forward"}
+            repo.heads[branch] = data["sha"]
+            repo.touch(pushed=True)
+        return self.get_ref(owner, name, branch, query, data)
+
+    def commit_json(self, repo: FakeRepo, commit_sha: str) -> dict[str, Any]:
+        return {
+            "sha": commit_sha,
+            "url": self.url(f"/repos/{repo.full_name}/git/commits/{commit_sha}"),
+            "tree": {"sha": repo.commits[commit_sha], "url": self.url(f"/repos/{repo.full_name}/git/trees/x")},
+        }
+
+    def get_commit(self, owner, name, commit_sha, query, data):
+        repo = self.repo(owner, name)
+        if commit_sha not in repo.commits:
+            raise NotFound()
+        return 200, {}, self.commit_json(repo, commit_sha)
+
+    def post_commit(self, owner, name, query, data):
+        repo = self.repo(owner, name)
+        with repo.lock:
+            commit_sha = repo.commit(data["tree"], data["message"], data.get("parents", None))
+        return 201, {}, self.commit_json(repo, commit_sha)
+
+    def get_tree(self, owner, name, tree_sha, query, data):
+        repo = self.repo(owner, name)
+        # like GitHub, a branch name or commit sha resolve to their tree
+        tree_sha = repo.heads.get(tree_sha, tree_sha)
+        tree_sha = repo.commits.get(tree_sha, tree_sha)
+        if tree_sha not in repo.trees:
+            raise NotFound()
+        return (
+            200,
+            {},
+            {
+                "sha": tree_sha,
+                "url": self.url(f"/repos/{repo.full_name}/git/trees/{tree_sha}"),
+                "truncated": False,
+                "tree": [
+                    {"path": path, "mode": "100644", "type": "blob", "sha": git_sha("blob", contents)}
+                    for path, contents in sorted(repo.trees[tree_sha].items())
+                ],
+            },
+        )
+
+    def post_tree(self, owner, name, query, data):
+        repo = self.repo(owner, name)
+        with repo.lock:
+            files = dict(repo.trees[data["base_tree"]]) if "base_tree" in data else {}
+            for element in data["tree"]:
+                if "content" in element:
+                    contents = element["content"].encode("utf-8")
+                    repo.blobs[git_sha("blob", contents)] = contents
+                    files[element["path"]] = contents
+                elif element.get("sha", None) is None:
+                    files.pop(element["path"], None)
+                else:
+                    files[element["path"]] = repo.blobs[element["sha"]]
+            tree_sha = repo.tree(files)
+        return 201, {}, {"sha": tree_sha, "url": self.url(f"/repos/{repo.full_name}/git/trees/{tree_sha}"), "tree": []}
+
+    def post_graphql(self, query, data):
+        variables = data.get("variables", {})
+        if data["query"].lstrip().startswith("query RepoLabels"):
+            repo = self.repo(variables["owner"], variables["name"])
+            return 200, {}, {"data": {"repository": {"labels": self.graphql_labels(repo, variables["after"])}}}
+
+        results = {}
+        branch_count = len([key for key in variables if key.startswith("branch")])
+        i = 0
+        while f"owner{i}" in variables:
+            try:
+                repo = self.repo(variables[f"owner{i}"], variables[f"name{i}"])
+            except NotFound:
+                results[f"repo{i}"] = None
+                i += 1
+                continue
+            results[f"repo{i}"] = {
+                "nameWithOwner": repo.full_name,
+                "description": repo.settings.get("description", None),
+                "homepageUrl": repo.settings.get("homepage", None),
+                "isPrivate": repo.settings.get("private", False),
+                "hasIssuesEnabled": repo.settings.get("has_issues", True),
+                "hasProjectsEnabled": repo.settings.get("has_projects", True),
+                "hasWikiEnabled": repo.settings.get("has_wiki", True),
+                "defaultBranchRef": {"name": repo.settings.get("default_branch", "main")},
+                "squashMergeAllowed": repo.settings.get("allow_squash_merge", True),
+                "mergeCommitAllowed": repo.settings.get("allow_merge_commit", True),
+                "rebaseMergeAllowed": repo.settings.get("allow_rebase_merge", True),
+                "deleteBranchOnMerge": repo.settings.get("delete_branch_on_merge", False),
+                "repositoryTopics": {"nodes": [{"topic": {"name": topic}} for topic in repo.topics]},
+                "labels": self.graphql_labels(repo, None),
+            }
+            for j in range(branch_count):
+                branch = variables[f"branch{j}"].removeprefix("refs/heads/")
+                results[f"repo{i}"][f"branch{j}"] = (
+                    {"name": branch, "branchProtectionRule": graphql_rule(repo.branches[branch])}
+                    if branch in repo.branches
+                    else None
+                )
+            i += 1
+        return 200, {}, {"data": results}
+
+    @staticmethod
+    def graphql_labels(repo: FakeRepo, after: str | None) -> dict[str, Any]:
+        labels = list(repo.labels.values())
+        start = int(after) if after is not None else 0
+        return {
+            "pageInfo": {"hasNextPage": start + 100 < len(labels), "endCursor": str(start + 100)},
+            "nodes": [
+                {"name": label["name"], "color": label["color"], "description": label["description"]}
+                for label in labels[start : start + 100]
+            ],
+        }
+
+
+def make_protection(
+    required_approving_review_count: int = 2, checks: list[str] | None = None, enforce_admins: bool = True
+) -> dict[str, Any]:
+    """A branch's protection in the REST api's shape"""
+    return {
+        "required_status_checks": {"strict": True, "contexts": checks or ["test"]},
+        "enforce_admins": {"enabled": enforce_admins},
+        "required_pull_request_reviews": {
+            "dismiss_stale_reviews": True,
+            "require_code_owner_reviews": False,
+            "required_approving_review_count": required_approving_review_count,
+            "dismissal_restrictions": {"users": [], "teams": []},
+        },
+        "required_linear_history": {"enabled": False},
+        "allow_force_pushes": {"enabled": False},
+        "allow_deletions": {"enabled": False},
+        "block_creations": {"enabled": False},
+        "required_conversation_resolution": {"enabled": False},
+        "required_signatures": {"enabled": False},
+    }
+
+
+def graphql_rule(protection: dict[str, Any] | None) -> dict[str, Any] | None:
+    """Convert a REST shaped protection to the GraphQL branchProtectionRule that would have made it"""
+    if protection is None:
+        return None
+    reviews = protection.get("required_pull_request_reviews", None)
+    status_checks = protection.get("required_status_checks", None)
+    restrictions = protection.get("restrictions", None)
+    return {
+        "requiresApprovingReviews": reviews is not None,
+        "requiredApprovingReviewCount": (reviews or {}).get("required_approving_review_count", None),
+        "dismissesStaleReviews": (reviews or {}).get("dismiss_stale_reviews", False),
+        "requiresCodeOwnerReviews": (reviews or {}).get("require_code_owner_reviews", False),
+        "restrictsReviewDismissals": False,
+        "reviewDismissalAllowances": {"nodes": []},
+        "restrictsPushes": restrictions is not None,
+        "pushAllowances": {
+            "nodes": [
+                {"actor": {"__typename": "User", "login": user["login"]}}
+                for user in (restrictions or {}).get("users", [])
+            ]
+            + [
+                {"actor": {"__typename": "Team", "slug": team["slug"]}}
+                for team in (restrictions or {}).get("teams", [])
+            ]
+        },
+        "requiresStatusChecks": status_checks is not None,
+        "requiresStrictStatusChecks": (status_checks or {}).get("strict", False),
+        "requiredStatusCheckContexts": (status_checks or {}).get("contexts", []),
+        "isAdminEnforced": protection["enforce_admins"]["enabled"],
+        "requiresLinearHistory": protection["required_linear_history"]["enabled"],
+        "allowsForcePushes": protection["allow_force_pushes"]["enabled"],
+        "allowsDeletions": protection["allow_deletions"]["enabled"],
+        "blocksCreations": protection["block_creations"]["enabled"],
+        "requiresConversationResolution": protection["required_conversation_resolution"]["enabled"],
+        "requiresCommitSignatures": protection["required_signatures"]["enabled"],
+    }
+
+
+class FakeGithubServer:
+    """Serve a FakeGithub over http on localhost, from a background thread
+
+    Use as a context manager. The api's base url is server.url + "/api/v3", which is what repo_manager derives when
+    its github_server_url input is server.url
+    """
+
+    def __init__(self, api: FakeGithub):
+        self.api = api
+        api_handle = api.handle
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                api.count_connection()
+
+            def _handle(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+                status, headers, response_body = api_handle(self.command, self.path, dict(self.headers), body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(response_body)))
+                for header, value in headers.items():
+                    self.send_header(header, value)
+                self.end_headers()
+                self.wfile.write(response_body)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        api.base_url = self.url
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-github", daemon=True)
+
+    def __enter__(self) -> "FakeGithubServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,251 @@
+"""Benchmark repo_manager's main() in validate, check, apply, apply-plan and incremental modes against a local fake
+GitHub api
+
+Each scenario starts a FakeGithubServer with fresh synthetic repos, runs main() in a subprocess pointed at it, and
+reports the requests it made, their latency percentiles, and throughput. apply-plan scenarios run a check that
+writes a plan first, and only report the requests of applying it. incremental scenarios apply and check with
+incremental set first, and report the requests of a check with nothing changed since. Request counts are
+deterministic, so comparing them to a baseline catches changes that make more api calls:
+
+    python -m benchmarks.run --sizes small,medium --latency 0.01 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+from .fake_github import FakeGithub
+from .fake_github import FakeGithubServer
+from .synthetic import make_repo
+from .synthetic import SIZES
+from .synthetic import write_settings
+
+ROOT = Path(__file__).parent.parent
+OWNER = "bench-org"
+MODES = ("validate", "check", "apply", "apply-plan", "incremental")
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest rank percentile of values"""
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))]
+
+
+def main_env(
+    server_url: str,
+    settings_file: Path,
+    action: str,
+    repo_count: int,
+    work_dir: Path,
+    trace_file: Path | None = None,
+    org: bool = False,
+    plan_file: Path | None = None,
+    cache_dir: Path | None = None,
+) -> dict[str, str]:
+    """The inputs to run repo_manager's main() with, as the env vars the action would set"""
+    (work_dir / "github_output").touch()
+    return {
+        "GITHUB_OUTPUT": str(work_dir / "github_output"),
+        "INPUT_ACTION": action,
+        "INPUT_SETTINGS_FILE": str(settings_file),
+        "INPUT_REPO": f"{OWNER}/repo-000" if repo_count == 1 else "self",
+        "INPUT_REPOS": f"{OWNER}/*" if repo_count > 1 and not org else "",
+        "INPUT_ORG": OWNER if repo_count > 1 and org else "",
+        "INPUT_GITHUB_SERVER_URL": server_url,
+        "INPUT_TOKEN": "benchmark-token",
+        "INPUT_MAX_WORKERS": "8",
+        "INPUT_CACHE_DIR": str(cache_dir) if cache_dir is not None else "",
+        "INPUT_INCREMENTAL": "true" if cache_dir is not None else "false",
+        "INPUT_SECRET_FINGERPRINT_KEY": "benchmark-key" if cache_dir is not None else "",
+        "INPUT_TRACE_FILE": str(trace_file) if trace_file is not None else "",
+        "INPUT_PLAN_FILE": str(plan_file) if plan_file is not None else "",
+    }
+
+
+def local_env(inputs: dict[str, str]) -> dict[str, str]:
+    """Our env, with inputs in place of any action inputs or github env vars it has, and this checkout importable"""
+    env = {key: value for key, value in os.environ.items() if not key.startswith(("INPUT_", "GITHUB_"))}
+    env["PYTHONPATH"] = os.pathsep.join([str(ROOT), env.get("PYTHONPATH", "")])
+    env.update(inputs)
+    return env
+
+
+def run_main(
+    server_url: str,
+    settings_file: Path,
+    action: str,
+    repo_count: int,
+    work_dir: Path,
+    trace_file: Path | None = None,
+    org: bool = False,
+    plan_file: Path | None = None,
+    cache_dir: Path | None = None,
+) -> tuple[int, str]:
+    """Run repo_manager's main() in a subprocess, returning its exit code and output"""
+    env = local_env(
+        main_env(server_url, settings_file, action, repo_count, work_dir, trace_file, org, plan_file, cache_dir)
+    )
+    result = subprocess.run(  # nosec B603
+        [sys.executable, "-m", "repo_manager.main"], cwd=work_dir, env=env, capture_output=True, text=True
+    )
+    return result.returncode, result.stdout + result.stderr
+
+
+def run_scenario(size_name: str, action: str, repo_count: int, args: argparse.Namespace) -> dict[str, Any]:
+    size = SIZES[size_name]
+    api = FakeGithub(
+        [make_repo(OWNER, f"repo-{i:03d}", size) for i in range(repo_count)],
+        latency=args.latency,
+        page_size=args.page_size,
+        rate_limit=args.rate_limit,
+        rate_limit_window=args.rate_limit_window,
+        graphql=not args.no_graphql,
+    )
+    with tempfile.TemporaryDirectory(prefix="repo-manager-bench-") as tmp, FakeGithubServer(api) as server:
+        work_dir = Path(tmp)
+        settings_file = write_settings(size, work_dir)
+        trace_file = None
+        if args.trace_dir is not None:
+            trace_file = args.trace_dir.absolute() / f"{size_name}-{action}-{repo_count}.json"
+        plan_file = None
+        cache_dir = None
+        main_action = action
+        if action == "apply-plan":
+            plan_file = work_dir / "plan.json"
+            run_main(server.url, settings_file, "check", repo_count, work_dir, org=args.org, plan_file=plan_file)
+            api.reset_stats()
+        elif action == "incremental":
+            # the apply moves the repos' markers, so the check after it is the one that records them
+            cache_dir = work_dir / "cache"
+            main_action = "check"
+            for setup_action in ("apply", "check"):
+                run_main(
+                    server.url, settings_file, setup_action, repo_count, work_dir, org=args.org, cache_dir=cache_dir
+                )
+            api.reset_stats()
+        started = time.perf_counter()
+        exit_code, output = run_main(
+            server.url,
+            settings_file,
+            main_action,
+            repo_count,
+            work_dir,
+            trace_file,
+            org=args.org,
+            plan_file=plan_file,
+            cache_dir=cache_dir,
+        )
+        wall_seconds = time.perf_counter() - started
+
+    latencies = [seconds * 1000 for _, _, seconds in api.requests]
+    report = {
+        "scenario": f"{size_name}/{action}/{repo_count}" + ("/org" if args.org and repo_count > 1 else ""),
+        "size": size_name,
+        "action": action,
+        "repos": repo_count,
+        "exit_code": exit_code,
+        "wall_seconds": round(wall_seconds, 3),
+        "requests": len(api.requests),
+        "connections": api.connections,
+        "by_endpoint": dict(sorted(Counter(template for template, _, _ in api.requests).items())),
+        "by_status": dict(sorted(Counter(str(status) for _, status, _ in api.requests).items())),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p90": round(percentile(latencies, 90), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(max(latencies, default=0.0), 2),
+        },
+        "requests_per_second": round(len(api.requests) / wall_seconds, 1),
+        "repos_per_second": round(repo_count / wall_seconds, 2),
+    }
+    if args.verbose:
+        report["output"] = output
+    return report
+
+
+def compare(reports: list[dict[str, Any]], baseline: dict[str, dict[str, Any]], args: argparse.Namespace) -> list[str]:
+    """Regressions of reports from the baseline"""
+    regressions = []
+    for report in reports:
+        expected = baseline.get(report["scenario"], None)
+        if expected is None:
+            continue
+        if report["exit_code"] != expected["exit_code"]:
+            regressions.append(f"{report['scenario']}: exit code {report['exit_code']}, was {expected['exit_code']}")
+        if report["requests"] > expected["requests"] * (1 + args.request_tolerance):
+            regressions.append(f"{report['scenario']}: {report['requests']} requests, was {expected['requests']}")
+        if args.max_slowdown is not None and report["wall_seconds"] > expected["wall_seconds"] * args.max_slowdown:
+            regressions.append(f"{report['scenario']}: took {report['wall_seconds']}s, was {expected['wall_seconds']}s")
+    return regressions
+
+
+def print_table(reports: list[dict[str, Any]]):
+    columns = ("exit", "requests", "conns", "p50 ms", "p90 ms", "p99 ms", "wall s", "req/s")
+    print(f"{'scenario':<24} " + " ".join(f"{column:>8}" if column != "exit" else "exit" for column in columns))
+    for report in reports:
+        print(
+            f"{report['scenario']:<24} {report['exit_code']:>4} {report['requests']:>8} {report['connections']:>8} "
+            + f"{report['latency_ms']['p50']:>8} {report['latency_ms']['p90']:>8} {report['latency_ms']['p99']:>8} "
+            + f"{report['wall_seconds']:>8} {report['requests_per_second']:>8}"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="small,medium", help=f"Comma separated repo sizes, of {', '.join(SIZES)}")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma separated actions to run main() with")
+    parser.add_argument("--repos", default="1", help="Comma separated repo counts. More than 1 runs in fleet mode")
+    parser.add_argument("--org", action="store_true", help="Run fleet mode with org, rather than a repos glob")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake api waits before each response")
+    parser.add_argument("--page-size", type=int, default=30, help="Default page size of the fake api's lists")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="Requests allowed per rate limit window")
+    parser.add_argument("--rate-limit-window", type=float, default=3600.0, help="Seconds until the rate limit resets")
+    parser.add_argument("--no-graphql", action="store_true", help="Answer GraphQL queries with a 404")
+    parser.add_argument("--output", type=Path, help="Write the reports to this json file")
+    parser.add_argument("--baseline", type=Path, help="Fail if any scenario regressed from this baseline json")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the reports to --baseline instead")
+    parser.add_argument(
+        "--request-tolerance", type=float, default=0.0, help="Allowed fraction of extra requests over the baseline"
+    )
+    parser.add_argument("--max-slowdown", type=float, help="Fail if a scenario is this many times slower than baseline")
+    parser.add_argument("--trace-dir", type=Path, help="Write each scenario's trace_file to this directory")
+    parser.add_argument("--verbose", action="store_true", help="Include main()'s output in the reports")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for size_name in args.sizes.split(","):
+        for repo_count in [int(count) for count in args.repos.split(",")]:
+            for action in args.modes.split(","):
+                reports.append(run_scenario(size_name, action, repo_count, args))
+    print_table(reports)
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(reports, indent=2) + "\n")
+
+    if args.baseline is not None:
+        if args.update_baseline:
+            baseline = {
+                report["scenario"]: {key: report[key] for key in ("exit_code", "requests", "wall_seconds")}
+                for report in reports
+            }
+            args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+            return 0
+        regressions = compare(reports, json.loads(args.baseline.read_text()), args)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Benchmark how long repo_manager takes to start, from launching it to its first request to a local fake GitHub api
+
+Each run launches the command fresh and times it until the fake api sees its first request, which covers starting
+the interpreter, unpacking the binary if it is a onefile build, importing, and reading the inputs. The
+command defaults to running main() from this checkout. Built images are benchmarked by passing a docker run command,
+where {env_file} is the action inputs as a docker env file and {work_dir} the directory the settings file is in:
+
+    python -m benchmarks.startup --target 2.0 \\
+        --command "docker run --rm --network host --env-file {env_file} -v {work_dir}:{work_dir} gha-repo-manager"
+
+The median of the runs has to be under --target seconds, if it is set.
+"""
+
+import argparse
+import json
+import shlex
+import statistics
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from .fake_github import FakeGithub
+from .fake_github import FakeGithubServer
+from .run import local_env
+from .run import main_env
+from .run import OWNER
+from .synthetic import make_repo
+from .synthetic import SIZES
+from .synthetic import write_settings
+
+LOCAL_COMMAND = f"{shlex.quote(sys.executable)} -m repo_manager.main"
+
+
+def time_start(command: list[str], env: dict[str, str], work_dir: Path, api: FakeGithub) -> dict[str, Any]:
+    """Run command once, timing it to the api's first request and to its exit"""
+    api.reset_stats()
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=work_dir, env=env, capture_output=True, text=True)  # nosec B603
+    exited = time.perf_counter()
+    return {
+        "exit_code": result.returncode,
+        "first_request_seconds": (
+            round(api.first_request_at - started, 3) if api.first_request_at is not None else None
+        ),
+        "exit_seconds": round(exited - started, 3),
+        "output": result.stdout + result.stderr,
+    }
+
+
+def benchmark_startup(args: argparse.Namespace) -> dict[str, Any]:
+    size = SIZES[args.size]
+    api = FakeGithub([make_repo(OWNER, "repo-000", size)])
+    with tempfile.TemporaryDirectory(prefix="repo-manager-startup-") as tmp, FakeGithubServer(api) as server:
+        work_dir = Path(tmp)
+        settings_file = write_settings(size, work_dir)
+        inputs = main_env(server.url, settings_file, args.action, 1, work_dir)
+        env_file = work_dir / "env"
+        env_file.write_text("".join(f"{key}={value}\n" for key, value in inputs.items()))
+        command = shlex.split(args.command.format(env_file=env_file, work_dir=work_dir))
+        runs = [time_start(command, local_env(inputs), work_dir, api) for _ in range(args.runs)]
+
+    failed = [run for run in runs if run["exit_code"] != 0 or run["first_request_seconds"] is None]
+    starts = [run["first_request_seconds"] for run in runs if run["first_request_seconds"] is not None]
+    report = {
+        "command": args.command,
+        "action": args.action,
+        "runs": args.runs,
+        "failed_runs": len(failed),
+        # the first run is the coldest, before the os has cached the binary and its libraries
+        "cold_seconds": runs[0]["first_request_seconds"],
+        "median_seconds": round(statistics.median(starts), 3) if len(starts) > 0 else None,
+        "min_seconds": min(starts, default=None),
+        "max_seconds": max(starts, default=None),
+        "median_exit_seconds": round(statistics.median(run["exit_seconds"] for run in runs), 3),
+        "target_seconds": args.target,
+    }
+    if args.verbose or len(failed) > 0:
+        report["output"] = (failed or runs)[0]["output"]
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--command", default=LOCAL_COMMAND, help="Command to start repo_manager with")
+    parser.add_argument("--action", default="validate", help="Action to run main() with")
+    parser.add_argument("--size", default="small", help=f"Size of the repo and settings file, of {', '.join(SIZES)}")
+    parser.add_argument("--runs", type=int, default=5, help="How many times to start the command")
+    parser.add_argument("--target", type=float, help="Fail if the median seconds to the first request is over this")
+    parser.add_argument("--output", type=Path, help="Write the report to this json file")
+    parser.add_argument("--verbose", action="store_true", help="Include the command's output in the report")
+    args = parser.parse_args(argv)
+
+    report = benchmark_startup(args)
+    print(
+        f"{'command':<40} {'cold s':>8} {'median s':>8} {'min s':>8} {'max s':>8} {'exit s':>8} {'target s':>8}\n"
+        + f"{shlex.split(report['command'])[-1][-40:]:<40} {report['cold_seconds']!s:>8} "
+        + f"{report['median_seconds']!s:>8} {report['min_seconds']!s:>8} {report['max_seconds']!s:>8} "
+        + f"{report['median_exit_seconds']!s:>8} {report['target_seconds']!s:>8}"
+    )
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if report["failed_runs"] > 0:
+        print(f"FAILED {report['failed_runs']} of {report['runs']} runs made no api request or exited non-zero")
+        print(report["output"])
+        return 1
+    if args.target is not None and report["median_seconds"] > args.target:
+        print(f"REGRESSION started in {report['median_seconds']}s, over the {args.target}s target")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""Synthetic repos of varying size, and a settings file that has drift from them, for benchmarking repo_manager"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from .fake_github import FakeRepo
+from .fake_github import make_protection
+
+
+@dataclass(frozen=True)
+class RepoSize:
+    branches: int
+    protected_branches: int
+    labels: int
+    secrets: int
+    # deployment environments, each with environment_secrets secrets
+    environments: int
+    environment_secrets: int
+    files: int
+    # how many files the settings file manages
+    managed_files: int
+
+
+SIZES = {
+    "small": RepoSize(
+        branches=5,
+        protected_branches=1,
+        labels=10,
+        secrets=4,
+        environments=1,
+        environment_secrets=2,
+        files=10,
+        managed_files=4,
+    ),
+    "medium": RepoSize(
+        branches=50,
+        protected_branches=3,
+        labels=80,
+        secrets=20,
+        environments=3,
+        environment_secrets=5,
+        files=200,
+        managed_files=12,
+    ),
+    "large": RepoSize(
+        branches=400,
+        protected_branches=10,
+        labels=250,
+        secrets=80,
+        environments=12,
+        environment_secrets=20,
+        files=2000,
+        managed_files=40,
+    ),
+}
+
+SETTINGS = {
+    "description": "A synthetic repo",
+    "homepage": "https://example.com",
+    "private": False,
+    "has_issues": True,
+    "has_projects": False,
+    "has_wiki": False,
+    "has_downloads": True,
+    "default_branch": "main",
+    "allow_squash_merge": True,
+    "allow_merge_commit": False,
+    "allow_rebase_merge": True,
+    "delete_branch_on_merge": True,
+}
+
+
+def branch_names(size: RepoSize) -> list[str]:
+    """main, then the protected release branches, then unprotected feature branches"""
+    return (
+        ["main"]
+        + [f"release-{i}" for i in range(size.protected_branches - 1)]
+        + [f"feature-{i}" for i in range(size.branches - size.protected_branches)]
+    )
+
+
+def file_contents(i: int, version: int = 1) -> bytes:
+    return f"# module {i}, version {version}\n\n\ndef main():\n    return {i}\n".encode()
+
+
+def make_repo(owner: str, name: str, size: RepoSize) -> FakeRepo:
+    """A repo of size, with the same contents every time"""
+    branches = branch_names(size)
+    return FakeRepo(
+        owner=owner,
+        name=name,
+        settings=dict(SETTINGS),
+        topics=["python", "synthetic"],
+        labels={
+            f"label-{i:03d}": {
+                "name": f"label-{i:03d}",
+                "color": f"{i * 4099 % 0xFFFFFF:06x}",
+                "description": f"Label {i}",
+            }
+            for i in range(size.labels)
+        },
+        branches={
+            branch: make_protection() if i < size.protected_branches else None for i, branch in enumerate(branches)
+        },
+        secrets={
+            "actions": {f"SECRET_{i:03d}" for i in range(size.secrets // 2)},
+            "dependabot": {f"DEPENDABOT_{i:03d}" for i in range(size.secrets - size.secrets // 2)},
+            # each environment has half its secrets already
+            **{
+                f"environments/env-{e:02d}": {f"ENV_SECRET_{i:03d}" for i in range(size.environment_secrets // 2)}
+                for e in range(size.environments)
+            },
+        },
+        files={f"src/module_{i:04d}.py": file_contents(i) for i in range(size.files)},
+    )
+
+
+def make_settings(size: RepoSize, work_dir: Path) -> dict[str, Any]:
+    """A settings file for repos from make_repo, with drift in every section so apply has work to do
+
+    Local source files for the managed files are written to work_dir/templates
+    """
+    branches = branch_names(size)
+    templates = work_dir / "templates"
+    templates.mkdir(parents=True, exist_ok=True)
+
+    labels = [
+        # a third of the existing labels get a new color
+        {"name": f"label-{i:03d}", "color": "ededed" if i % 3 == 0 else f"{i * 4099 % 0xFFFFFF:06x}"}
+        for i in range(size.labels - 2)
+    ]
+    labels += [{"name": f"label-{i:03d}", "exists": False} for i in range(size.labels - 2, size.labels)]
+    labels += [{"name": f"new-label-{i}", "color": "0075ca", "description": "Added by repo_manager"} for i in range(5)]
+
+    protection = {
+        "pr_options": {"required_approving_review_count": 3, "dismiss_stale_reviews": True},
+        "required_status_checks": {"strict": True, "checks": ["test"]},
+        "enforce_admins": True,
+        "require_signed_commits": False,
+    }
+    branch_protections = [{"name": branch, "protection": protection} for branch in branches[: size.protected_branches]]
+    # protect a feature branch that isn't yet, and unprotect one that doesn't need to be
+    branch_protections.append({"name": branches[-1], "protection": protection})
+    if size.protected_branches > 1:
+        branch_protections[size.protected_branches - 1] = {
+            "name": branches[size.protected_branches - 1],
+            "exists": False,
+        }
+
+    secrets = [{"key": f"SECRET_{i:03d}", "value": f"value-{i}"} for i in range(size.secrets // 2)]
+    secrets += [{"key": "NEW_SECRET", "value": "new"}, {"key": "NEW_DEPENDABOT", "value": "new", "type": "dependabot"}]
+    secrets += [{"key": "DEPENDABOT_000", "type": "dependabot", "exists": False}]
+    secrets += [
+        {"key": f"ENV_SECRET_{i:03d}", "value": f"value-{e}-{i}", "type": f"environments/env-{e:02d}"}
+        for e in range(size.environments)
+        for i in range(size.environment_secrets)
+    ]
+
+    files = []
+    for i in range(size.managed_files):
+        # half the managed files are already up to date, the rest have changed
+        src_file = templates / f"module_{i:04d}.py"
+        src_file.write_bytes(file_contents(i, version=1 if i % 2 == 0 else 2))
+        files.append({"src_file": str(src_file), "dest_file": f"src/module_{i:04d}.py", "commit_msg": "Sync modules"})
+    files.append({"dest_file": f"src/module_{size.files - 1:04d}.py", "exists": False, "commit_msg": "Sync modules"})
+    files.append(
+        {
+            "src_file": f"remote://src/module_{size.files - 2:04d}.py",
+            "dest_file": f"lib/module_{size.files - 2:04d}.py",
+            "move": True,
+            "commit_msg": "Move a module",
+        }
+    )
+
+    return {
+        "settings": dict(
+            SETTINGS, description="A synthetic repo, managed by repo_manager", topics=["python", "synthetic"]
+        ),
+        "labels": labels,
+        "branch_protections": branch_protections,
+        "secrets": secrets,
+        "files": files,
+    }
+
+
+def write_settings(size: RepoSize, work_dir: Path) -> Path:
+    settings_file = work_dir / "settings.yml"
+    with open(settings_file, "w") as fh:
+        yaml.safe_dump(make_settings(size, work_dir), fh, sort_keys=False)
+    return settings_file
@@ -141,3 +141,20 @@ def tests(session: Session) -> None:
     session.install(".")
     session.install(*test_requirements)
     session.run("poetry", "run", "pytest", *session.posargs)
+
+
+@session(python=python_versions[0])
+def benchmarks(session: Session) -> None:
+    """Benchmark api requests and latency against a fake GitHub api, failing on regressions from the baseline."""
+    args = session.posargs or [
+        "--sizes",
+        "small,medium",
+        "--repos",
+        "1,5",
+        "--baseline",
+        "benchmarks/baseline.json",
+        "--output",
+        "benchmark-report.json",
+    ]
+    session.install(".")
+    session.run("python", "-m", "benchmarks.run", *args)
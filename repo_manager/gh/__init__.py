@@ -4,11 +4,50 @@ from github import Github
 from github.GithubException import GithubException
 from github.GithubException import UnknownObjectException
 
+from .cache import ResponseCache
+from .ratelimit import RequestScheduler
+from .tracing import tracer
+from .transport import build_github_client
+from .transport import PoolSettings
+
 
 @lru_cache
-def get_github_client(token: str, api_url: str) -> Github:
-    """ """
-    return Github(token, base_url=api_url)
+def get_github_client(
+    token: str,
+    api_url: str,
+    cache_dir: str | None = None,
+    pool: PoolSettings | None = None,
+    trace: bool = False,
+    cache_namespace: str | None = None,
+) -> Github:
+    """Get a Github client, shared by everything that calls with the same args
+
+    Every request goes through a RequestScheduler, which paces requests against the rate limit and retries them.
+    It replaces PyGithub's own retries and its fixed delay between requests, which would otherwise serialize every
+    worker sharing the client. It never has more requests in flight than the pool has connections to the api.
+
+    If cache_dir is set, GET responses are cached there with their ETags and repeat requests are made conditional.
+    They are keyed by cache_namespace if it is set, and by token otherwise.
+    If trace is set, every request that goes out is recorded by the shared tracer. It keeps every request's span until
+    the run ends, so it is only set when there is a trace_file to export them to
+    """
+    if pool is None:
+        pool = PoolSettings()
+    scheduler = RequestScheduler(max_concurrency=pool.max_connections_per_host)
+    middlewares = [scheduler]
+    if cache_dir:
+        middlewares.append(ResponseCache(cache_dir, cache_namespace))
+    if trace:
+        middlewares.append(tracer)
+    return build_github_client(
+        token,
+        api_url,
+        middlewares,
+        pool,
+        retry=None,
+        seconds_between_requests=None,
+        seconds_between_writes=None,
+    )
 
 
-__all__ = ["get_github_client", "GithubException", "UnknownObjectException"]
+__all__ = ["get_github_client", "GithubException", "PoolSettings", "UnknownObjectException"]
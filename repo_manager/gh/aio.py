@@ -0,0 +1,566 @@
+import asyncio
+import re
+from typing import Any
+from urllib.parse import quote
+
+from github.Branch import Branch
+from github.BranchProtection import BranchProtection as GithubBranchProtection
+from github.Consts import mediaTypeRequireMultipleApprovingReviews
+from github.Consts import signaturesProtectedBranchesPreview
+from github.GitCommit import GitCommit
+from github.GithubException import GithubException
+from github.GithubException import UnknownObjectException
+from github.GitTree import GitTree
+from github.Label import Label as GithubLabel
+from github.PublicKey import PublicKey
+from github.Repository import Repository
+
+from repo_manager.gh import branch_protections
+from repo_manager.gh import files
+from repo_manager.gh import get_github_client
+from repo_manager.gh import labels
+from repo_manager.gh import secrets
+from repo_manager.gh import settings
+from repo_manager.gh.plan import already_done
+from repo_manager.gh.plan import commit_step
+from repo_manager.gh.ratelimit import IDEMPOTENT_METHODS
+from repo_manager.gh.ratelimit import rate_limit_resource
+from repo_manager.gh.ratelimit import RequestScheduler
+from repo_manager.gh.state import RepoState
+from repo_manager.gh.tracing import set_trace_attributes
+from repo_manager.gh.tracing import tracer
+from repo_manager.gh.transport import PoolSettings
+from repo_manager.schemas import FileConfig
+from repo_manager.schemas import RepoManagerConfig
+from repo_manager.schemas.branch_protection import BranchProtection
+from repo_manager.schemas.branch_protection import ProtectionOptions
+from repo_manager.schemas.label import Label
+from repo_manager.schemas.secret import Secret
+from repo_manager.schemas.settings import Settings
+
+# httpx is optional, installed with the async extra. HTTP/2 is used when h2 is installed too
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# How many connections to keep open to the api, and so how many requests can be in flight at once, unless the
+# PoolSettings say otherwise
+MAX_CONNECTIONS = 100
+# How many repos check_repos checks at once. Each repo's checks run concurrently too
+MAX_REPOS = 100
+
+NEXT_PAGE = re.compile(r'<([^>]+)>;\s*rel="next"')
+
+
+class AsyncGithub:
+    """An asyncio GitHub api client, so many repos' requests can be in flight at once on one event loop
+
+    Requests go through one pooled httpx.AsyncClient, over HTTP/2 if h2 is installed. Like the requests transport
+    of get_github_client, they are paced and retried by a RequestScheduler, and recorded by the shared tracer if trace
+    is set. The ETag cache of cache_dir is not used.
+
+    Responses are turned into PyGithub objects with the requester of the matching sync client, so the sync check
+    and plan functions can be reused on them. Errors are raised as the same GithubExceptions PyGithub raises
+    """
+
+    def __init__(
+        self,
+        token: str,
+        api_url: str,
+        pool: PoolSettings | None = None,
+        scheduler: RequestScheduler | None = None,
+        transport: Any | None = None,
+        trace: bool = False,
+    ):
+        if httpx is None:
+            raise ImportError("The async transport needs httpx, install gha-repo-manager[async]")
+        if pool is None:
+            pool = PoolSettings(max_connections_per_host=MAX_CONNECTIONS)
+        self.requester = get_github_client(token, api_url).requester
+        self.scheduler = (
+            scheduler if scheduler is not None else RequestScheduler(max_concurrency=pool.max_connections_per_host)
+        )
+        headers = {"Accept": "application/vnd.github+json", "User-Agent": "gha-repo-manager"}
+        if token:
+            headers["Authorization"] = f"token {token}"
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(pool.read_timeout, connect=pool.connect_timeout),
+            # the api is one host, so its per host limit is the whole pool
+            limits=httpx.Limits(
+                max_connections=pool.max_connections_per_host,
+                max_keepalive_connections=pool.max_connections_per_host if pool.keep_alive else 0,
+            ),
+            http2=HTTP2,
+            transport=transport,
+        )
+        self._condition = asyncio.Condition()
+        self._in_flight = 0
+        self.tracer = tracer if trace else None
+
+    @property
+    def base_url(self) -> str:
+        return self.requester.base_url
+
+    async def __aenter__(self) -> "AsyncGithub":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _acquire(self, resource: str):
+        async with self._condition:
+            while True:
+                wait = self.scheduler.paused_for()
+                if wait <= 0 and self._in_flight < self.scheduler.concurrency(resource):
+                    break
+                try:
+                    # a pause can come from another thread, so wake up for it rather than waiting to be notified
+                    await asyncio.wait_for(self._condition.wait(), timeout=wait if wait > 0 else None)
+                except TimeoutError:
+                    pass
+            self._in_flight += 1
+
+    async def _release(self):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        parameters: dict[str, Any] | None = None,
+        input: Any | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> tuple[dict[str, str], Any]:
+        """Make an api request, like PyGithub's requestJsonAndCheck
+
+        Returns:
+            Tuple[Dict[str, str], Any]: The response's headers, with lowercase names, and its decoded json
+        """
+        request = self.client.build_request(method, url, params=parameters, json=input, headers=headers)
+        resource = rate_limit_resource(request)
+        attempt = 0
+        while True:
+            await self._acquire(resource)
+            span = self.tracer.start(request, request.content) if self.tracer is not None else None
+            try:
+                response = await self.client.send(request)
+            except httpx.TransportError as exc:
+                if span is not None:
+                    self.tracer.finish(span, exc=exc)
+                if attempt >= self.scheduler.max_retries or method not in IDEMPOTENT_METHODS:
+                    raise
+                await asyncio.sleep(self.scheduler.backoff(attempt))
+                attempt += 1
+                continue
+            finally:
+                await self._release()
+            if span is not None:
+                self.tracer.finish(span, response)
+
+            self.scheduler.update_budget(resource, response)
+            delay = self.scheduler.retry_delay(request, response, attempt)
+            if delay is None:
+                break
+            if response.status_code in (403, 429):
+                # a rate limit applies to every request, not just this one
+                self.scheduler.pause(delay, f"Github {resource} rate limited")
+            else:
+                await asyncio.sleep(delay)
+            attempt += 1
+
+        response_headers = dict(response.headers)
+        data = response.json() if len(response.content) > 0 else None
+        if response.status_code >= 400:
+            raise self.requester.createException(response.status_code, response_headers, data)
+        return response_headers, data
+
+    async def paginate(self, url: str, parameters: dict[str, Any] | None = None, key: str | None = None) -> list[Any]:
+        """Every item of a list endpoint, following the Link header to each next page
+
+        key is the field of each page that holds its items, for endpoints that don't return a plain list
+        """
+        items = []
+        while url is not None:
+            headers, data = await self.request("GET", url, parameters)
+            items.extend(data[key] if key is not None else data)
+            # the next page's url already has the parameters
+            next_page = NEXT_PAGE.search(headers.get("link", ""))
+            url, parameters = (next_page.group(1), None) if next_page is not None else (None, None)
+        return items
+
+    async def get_repo(self, full_name: str) -> Repository:
+        """Get a repo, complete, so reading its attributes never makes a blocking request"""
+        headers, data = await self.request("GET", f"{self.base_url}/repos/{full_name}")
+        return Repository(self.requester, headers, data, completed=True)
+
+
+async def check_repo_settings(
+    gh: AsyncGithub, repo: Repository, config_settings: Settings, state: RepoState | None = None
+) -> tuple[bool, list[str | None]]:
+    """Checks a repo's settings vs our expected settings, like settings.check_repo_settings
+
+    The repo from AsyncGithub.get_repo already has every setting, topics included, so no requests are made
+    """
+    if state is None:
+        state = RepoState()
+    if state.settings is None:
+        state.settings = {}
+    state.settings.setdefault("topics", repo.raw_data.get("topics", []))
+    return settings.check_repo_settings(repo, config_settings, state)
+
+
+async def check_repo_labels(
+    gh: AsyncGithub, repo: Repository, config_labels: list[Label], state: RepoState | None = None
+) -> tuple[bool, dict[str, list[str] | dict[str, Any]]]:
+    """Checks a repo's labels vs our expected labels, like labels.check_repo_labels"""
+    if state is None:
+        state = RepoState()
+    if state.labels is None:
+        state.labels = {
+            label["name"]: GithubLabel(gh.requester, {}, label, completed=True)
+            for label in await gh.paginate(f"{repo.url}/labels", {"per_page": 100})
+        }
+    return labels.check_repo_labels(repo, config_labels, state)
+
+
+async def get_branch(
+    gh: AsyncGithub, repo: Repository, branch: str
+) -> tuple[Branch | None, GithubBranchProtection | None]:
+    """Get a branch, and its protection if it is protected. The branch is None if it does not exist"""
+    try:
+        headers, data = await gh.request("GET", f"{repo.url}/branches/{quote(branch)}")
+    except UnknownObjectException:
+        return None, None
+    this_branch = Branch(gh.requester, headers, data)
+    if not this_branch.protected:
+        return this_branch, None
+    headers, data = await gh.request("GET", this_branch.protection_url)
+    # the api leaves out dismissal_restrictions when there are none. Set them, so reading them never tries to
+    # complete the object with a blocking request
+    if data.get("required_pull_request_reviews", None) is not None:
+        data["required_pull_request_reviews"].setdefault("dismissal_restrictions", {"users": [], "teams": []})
+    return this_branch, GithubBranchProtection(gh.requester, headers, data, completed=True)
+
+
+async def check_repo_branch_protections(
+    gh: AsyncGithub,
+    repo: Repository,
+    config_branch_protections: list[BranchProtection],
+    state: RepoState | None = None,
+) -> tuple[bool, dict[str, list[str] | dict[str, Any]]]:
+    """Checks a repo's branch protections vs our expected settings, like the sync check_repo_branch_protections
+
+    Every configured branch, and its protection, is fetched at the same time
+    """
+    if state is None:
+        state = RepoState()
+    if state.branches is None:
+        branch_names = list(dict.fromkeys(config_bp.name for config_bp in config_branch_protections))
+        fetched = await asyncio.gather(*[get_branch(gh, repo, branch_name) for branch_name in branch_names])
+        state.branches = {}
+        state.branch_objects = {}
+        for branch_name, (this_branch, this_protection) in zip(branch_names, fetched):
+            if this_branch is None:
+                continue
+            state.branches[branch_name] = this_protection
+            state.branch_objects[branch_name] = this_branch
+    return branch_protections.check_repo_branch_protections(repo, config_branch_protections, state)
+
+
+async def get_repo_secrets(
+    gh: AsyncGithub, repo: Repository, secret_types: list[str]
+) -> dict[str, dict[str, str | None]]:
+    """List a repo's secrets of several types at the same time, like secrets.get_repo_secrets"""
+    listed = await asyncio.gather(
+        *[
+            gh.paginate(
+                secrets.secrets_url(repo.url, secret_type), {"per_page": secrets.SECRETS_PER_PAGE}, key="secrets"
+            )
+            for secret_type in secret_types
+        ]
+    )
+    return {
+        secret_type: {secret["name"]: secret.get("updated_at", None) for secret in type_secrets}
+        for secret_type, type_secrets in zip(secret_types, listed)
+    }
+
+
+async def check_repo_secrets(
+    gh: AsyncGithub, repo: Repository, config_secrets: list[Secret], state: RepoState | None = None
+) -> tuple[bool, dict[str, list[str] | dict[str, Any]]]:
+    """Checks a repo's secrets vs our expected settings, like secrets.check_repo_secrets"""
+    if state is None:
+        state = RepoState()
+    listed = state.secrets if state.secrets is not None else {}
+    secret_types = list(secrets.DEFAULT_SECRET_TYPES) + sorted(
+        {secret.type for secret in config_secrets} - set(secrets.DEFAULT_SECRET_TYPES)
+    )
+    state.secrets = {
+        **listed,
+        **await get_repo_secrets(gh, repo, [secret_type for secret_type in secret_types if secret_type not in listed]),
+    }
+    return secrets.check_repo_secrets(repo, config_secrets, state)
+
+
+async def get_tree_files(
+    gh: AsyncGithub, repo: Repository, tree_sha: str
+) -> tuple[GitTree, dict[str, tuple[str, str]]]:
+    """Get a tree, and the blob sha and mode of every file in it, like files.get_tree_files"""
+    headers, data = await gh.request("GET", f"{repo.url}/git/trees/{tree_sha}", {"recursive": "1"})
+    tree = GitTree(gh.requester, headers, data, completed=True)
+    return tree, {
+        element["path"]: (element["sha"], element["mode"]) for element in data["tree"] if element["type"] == "blob"
+    }
+
+
+async def check_repo_files(
+    gh: AsyncGithub, repo: Repository, file_configs: list[FileConfig], state: RepoState | None = None
+) -> tuple[bool, dict[str, list[str] | dict[str, Any]]]:
+    """Checks a repo's files vs our expected files, like files.check_repo_files
+
+    The tree of every target branch is fetched at the same time. Trees too large for the api to return whole still
+    fall back to a blocking contents request for each file that isn't in them
+    """
+    if state is None:
+        state = RepoState()
+    if state.trees is None:
+        state.trees = {}
+    target_branches = list(
+        dict.fromkeys(
+            file_config.target_branch if file_config.target_branch is not None else repo.default_branch
+            for file_config in file_configs
+        )
+    )
+
+    async def fetch(target_branch: str):
+        try:
+            state.trees[target_branch] = await get_tree_files(gh, repo, target_branch)
+        except GithubException as exc:
+            # left out of state, for files.check_repo_files to report
+            if exc.status not in (files.BRANCH_NOT_FOUND, files.REPO_EMPTY):
+                raise
+
+    await asyncio.gather(
+        *[fetch(target_branch) for target_branch in target_branches if target_branch not in state.trees]
+    )
+    return files.check_repo_files(repo, file_configs, state)
+
+
+async def _traced(check_name: str, check, *args) -> tuple[bool, Any]:
+    # each task runs in a copy of the context, so the attributes only tag this check's requests
+    set_trace_attributes(phase="check", resource=check_name)
+    return await check(*args)
+
+
+async def check_repo(
+    gh: AsyncGithub, repo: Repository, config: RepoManagerConfig, state: RepoState | None = None
+) -> tuple[bool, dict[str, Any]]:
+    """Checks a repo vs our config, like runner.check_repo, with every check running at the same time
+
+    Returns:
+        Tuple[bool, Dict[str, Any]]: If the repo matched the config, and the diffs of each check that found any
+    """
+    if state is None:
+        state = RepoState()
+    to_run = {
+        check_name: (check, to_check)
+        for check_name, check, to_check in (
+            ("settings", check_repo_settings, config.settings),
+            ("secrets", check_repo_secrets, config.secrets),
+            ("labels", check_repo_labels, config.labels),
+            ("branch_protections", check_repo_branch_protections, config.branch_protections),
+            ("files", check_repo_files, config.files),
+        )
+        if to_check is not None
+    }
+    results = await asyncio.gather(
+        *[_traced(check_name, check, gh, repo, to_check, state) for check_name, (check, to_check) in to_run.items()]
+    )
+
+    check_result = True
+    diffs = {}
+    for check_name, (this_check, this_diffs) in zip(to_run, results):
+        check_result &= this_check
+        if this_diffs is not None:
+            diffs[check_name] = this_diffs
+    return check_result, diffs
+
+
+async def check_repos(
+    gh: AsyncGithub, repos: list[str], config: RepoManagerConfig, max_repos: int = MAX_REPOS
+) -> list[dict[str, Any]]:
+    """Check many repos on one event loop, max_repos at a time
+
+    Errors are collected into each repo's result rather than raised, like runner.run_repo
+
+    Returns:
+        List[Dict[str, Any]]: Each repo's name, check result, diffs, and any errors, in the order of repos
+    """
+    semaphore = asyncio.Semaphore(max_repos)
+
+    async def run(full_name: str) -> dict[str, Any]:
+        result = {"repo": full_name, "check": False, "diffs": {}, "errors": [], "commits": []}
+        set_trace_attributes(repo=full_name)
+        async with semaphore:
+            try:
+                repo = await gh.get_repo(full_name)
+                result["check"], result["diffs"] = await check_repo(gh, repo, config)
+            except Exception as exc:  # this should be tighter
+                result["errors"].append({"type": "repo", "error": f"{exc}"})
+        return result
+
+    return list(await asyncio.gather(*[run(full_name) for full_name in repos]))
+
+
+async def create_secret(
+    gh: AsyncGithub, repo: Repository, secret_name: str, unencrypted_value: str, secret_type: str = "actions"
+) -> bool:
+    """Create or update a secret, like secrets.create_secret, sharing its cache of public keys"""
+    secret_type = secrets.check_secret_type(secret_type)
+    cache = secrets.public_keys(gh.requester)
+    cache_key = (repo.url, secret_type)
+    public_key = cache.get(cache_key, None)
+    if public_key is None:
+        headers, data = await gh.request("GET", f"{secrets.secrets_url(repo.url, secret_type)}/public-key")
+        public_key = cache.setdefault(cache_key, PublicKey(gh.requester, headers, data, completed=True))
+    await gh.request(
+        "PUT",
+        f"{secrets.secrets_url(repo.url, secret_type)}/{secret_name}",
+        input={"key_id": public_key.key_id, "encrypted_value": public_key.encrypt(unencrypted_value)},
+    )
+    return True
+
+
+async def update_label(gh: AsyncGithub, repo: Repository, label: Label, this_label: GithubLabel | None = None):
+    """Update a label to match our config, like labels.update_label"""
+    if this_label is None:
+        headers, data = await gh.request("GET", f"{repo.url}/labels/{quote(label.name)}")
+        this_label = GithubLabel(gh.requester, headers, data, completed=True)
+    patch = {
+        "name": label.expected_name,
+        "color": this_label.color if label.color_no_hash is None else label.color_no_hash,
+    }
+    # leaving description out leaves the label's description as it is
+    if label.description is not None:
+        patch["description"] = label.description
+    await gh.request("PATCH", this_label.url, input=patch)
+
+
+async def update_branch_protection(
+    gh: AsyncGithub,
+    repo: Repository,
+    branch: str,
+    protection_config: ProtectionOptions,
+    this_branch: Branch | None = None,
+    update_signatures: bool = True,
+):
+    """Update a branch's protection to match our config, like branch_protections.update_branch_protection"""
+    if this_branch is None:
+        headers, data = await gh.request("GET", f"{repo.url}/branches/{quote(branch)}")
+        this_branch = Branch(gh.requester, headers, data)
+    try:
+        await gh.request(
+            "PUT",
+            this_branch.protection_url,
+            headers={"Accept": mediaTypeRequireMultipleApprovingReviews},
+            input=branch_protections.protection_parameters(repo, protection_config),
+        )
+    except GithubException as exc:
+        raise ValueError(f"{exc.data['message']} {exc.data['documentation_url']}")
+
+    if update_signatures and protection_config.require_signed_commits is not None:
+        await gh.request(
+            "POST" if protection_config.require_signed_commits else "DELETE",
+            f"{this_branch.protection_url}/required_signatures",
+            headers={"Accept": signaturesProtectedBranchesPreview},
+        )
+
+
+async def run_step(
+    gh: AsyncGithub, step: dict[str, Any], heads: dict[str, tuple[str, str]] | None = None
+) -> str | None:
+    """Make a plan step's requests, like plan.run_step
+
+    Returns:
+        Optional[str]: The SHA of the commit made, for commit steps
+    """
+    if "commit" not in step:
+        try:
+            await gh.request(
+                step["method"], step["url"], input=step.get("input", None), headers=step.get("headers", None)
+            )
+        except GithubException as exc:
+            if not already_done(step, exc):
+                raise
+        return None
+
+    if heads is None:
+        heads = {}
+    commit = step["commit"]
+    parent, base_tree = heads.get(commit["branch"], (commit["parent"], commit["base_tree"]))
+    headers, tree = await gh.request(
+        "POST", f"{commit['url']}/git/trees", input={"base_tree": base_tree, "tree": commit["tree"]}
+    )
+    headers, new_commit = await gh.request(
+        "POST",
+        f"{commit['url']}/git/commits",
+        input={"message": commit["message"], "tree": tree["sha"], "parents": [parent]},
+    )
+    await gh.request(
+        "PATCH", f"{commit['url']}/git/refs/heads/{commit['branch']}", input={"sha": new_commit["sha"], "force": False}
+    )
+    heads[commit["branch"]] = (new_commit["sha"], tree["sha"])
+    return new_commit["sha"]
+
+
+async def commit_files(
+    gh: AsyncGithub,
+    repo: Repository,
+    file_configs: list[FileConfig],
+    target_branch: str,
+    state: RepoState | None = None,
+) -> tuple[str | None, list[FileConfig], list[tuple[FileConfig, Exception]]]:
+    """Copy, move and delete a group of files in a single commit, like files.commit_files
+
+    Returns:
+        Tuple[Optional[str], List[FileConfig], List[Tuple[FileConfig, Exception]]]: The commit's SHA, or None if
+            there was nothing to commit, the files that were already up to date, and the files that were skipped
+    """
+    if state is None:
+        state = RepoState()
+    if state.trees is None:
+        state.trees = {}
+    headers, ref = await gh.request("GET", f"{repo.url}/git/ref/heads/{target_branch}")
+    headers, data = await gh.request("GET", f"{repo.url}/git/commits/{ref['object']['sha']}")
+    parent = GitCommit(gh.requester, headers, data, completed=True)
+    # fetched here, so files.tree_changes reuses it rather than fetching it itself
+    base_tree, _ = state.trees.get(target_branch, (None, None))
+    if base_tree is None or base_tree.sha != parent.tree.sha:
+        state.trees[target_branch] = await get_tree_files(gh, repo, parent.tree.sha)
+
+    base_tree, elements, unchanged, skipped = files.tree_changes(repo, file_configs, target_branch, parent, state)
+    if len(elements) == 0:
+        return None, unchanged, skipped
+    step = commit_step(
+        f"Commit {', '.join(elements.keys())} to {target_branch}",
+        repo.url,
+        target_branch,
+        parent.sha,
+        base_tree.sha,
+        file_configs[0].commit_msg,
+        [element._identity for element in elements.values()],
+    )
+    return await run_step(gh, step), unchanged, skipped
@@ -1,11 +1,18 @@
 from copy import deepcopy
 from typing import Any
+from urllib.parse import quote
 
+from github.Branch import Branch
+from github.BranchProtection import BranchProtection as GithubBranchProtection
 from github.Consts import mediaTypeRequireMultipleApprovingReviews
+from github.Consts import signaturesProtectedBranchesPreview
 from github.GithubException import GithubException
 from github.GithubObject import NotSet
+from github.PaginatedList import PaginatedList
 from github.Repository import Repository
 
+from repo_manager.gh.plan import request_step
+from repo_manager.gh.state import RepoState
 from repo_manager.schemas.branch_protection import BranchProtection
 from repo_manager.schemas.branch_protection import ProtectionOptions
 from repo_manager.utils import attr_to_kwarg
@@ -19,11 +26,37 @@ def diff_option(key: str, expected: Any, repo_value: Any) -> str | None:
     return None
 
 
-def update_branch_protection(repo: Repository, branch: str, protection_config: ProtectionOptions):  # noqa: C901
+# The parts of a branch's protection that can be changed on their own, in the order they're applied. "protection" is
+# the whole protection, for the options that can only be changed with a PUT of all of it
+PROTECTION_SUB_RESOURCES = (
+    "protection",
+    "required_status_checks",
+    "required_pull_request_reviews",
+    "restrictions",
+    "enforce_admins",
+    "required_signatures",
+)
+
+# Options without an endpoint of their own -> their key in the protection
+PROTECTION_FLAGS = {
+    "require_linear_history": "required_linear_history",
+    "allow_force_pushes": "allow_force_pushes",
+    "allow_deletions": "allow_deletions",
+    "block_creations": "block_creations",
+    "require_conversation_resolution": "required_conversation_resolution",
+}
+
+
+def _sorted_or_none(values: list[str] | None) -> list[str] | None:
+    return sorted(values) if values is not None else None
+
+
+def protection_parameters(repo: Repository, protection_config: ProtectionOptions) -> dict[str, Any]:  # noqa: C901
+    """The body of the PUT that sets a branch's whole protection to our config"""
+
     # Copied from https://github.com/PyGithub/PyGithub/blob/001970d4a828017f704f6744a5775b4207a6523c/github/Branch.py#L112
     # Until pygithub supports this, we need to do it manually
     def edit_protection(  # nosec
-        branch,
         required_status_checks=NotSet,
         enforce_admins=NotSet,
         dismissal_users=NotSet,
@@ -42,7 +75,7 @@ def update_branch_protection(repo: Repository, branch: str, protection_config: P
         required_conversation_resolution=NotSet,
     ):  # nosec
         """
-        :calls: `PUT /repos/{owner}/{repo}/branches/{branch}/protection <https://docs.github.com/en/rest/branches/branch-protection?apiVersion=2022-11-28#update-branch-protection>`_
+        :for: `PUT /repos/{owner}/{repo}/branches/{branch}/protection <https://docs.github.com/en/rest/branches/branch-protection?apiVersion=2022-11-28#update-branch-protection>`_
         :required_status_checks: dict
         :enforce_admins: bool
         :dismissal_users: list of strings
@@ -166,14 +199,8 @@ def update_branch_protection(repo: Repository, branch: str, protection_config: P
         else:
             post_parameters["required_conversation_resolution"] = None
 
-        headers, data = branch._requester.requestJsonAndCheck(
-            "PUT",
-            branch.protection_url,
-            headers={"Accept": mediaTypeRequireMultipleApprovingReviews},
-            input=post_parameters,
-        )
+        return post_parameters
 
-    this_branch = repo.get_branch(branch)
     kwargs = {}
     status_check_kwargs = {}
     extra_kwargs = {}
@@ -255,8 +282,30 @@ def update_branch_protection(repo: Repository, branch: str, protection_config: P
         transform_key="required_conversation_resolution",
     )
 
+    return edit_protection(**kwargs, **extra_kwargs)
+
+
+def update_branch_protection(
+    repo: Repository,
+    branch: str,
+    protection_config: ProtectionOptions,
+    this_branch: Branch | None = None,
+    update_signatures: bool = True,
+):
+    """Update a branch's protection to match our config, with a PUT of the whole protection
+
+    this_branch is the branch to protect, if already fetched. Otherwise it is fetched by name. Required signatures
+    have their own endpoint, and are only set if update_signatures is True
+    """
+    if this_branch is None:
+        this_branch = repo.get_branch(branch)
     try:
-        edit_protection(branch=this_branch, **kwargs, **extra_kwargs)
+        this_branch._requester.requestJsonAndCheck(
+            "PUT",
+            this_branch.protection_url,
+            headers={"Accept": mediaTypeRequireMultipleApprovingReviews},
+            input=protection_parameters(repo, protection_config),
+        )
     except GithubException as exc:
         raise ValueError(f"{exc.data['message']} {exc.data['documentation_url']}")
     # This errors out because the underlying method does a UPDATE instead of a POST as stated by GitHub documentation
@@ -268,48 +317,357 @@ def update_branch_protection(repo: Repository, branch: str, protection_config: P
     #         raise ValueError(f"{exc.data['message']} {exc.data['documentation_url']}")
 
     # signed commits has its own method
-    if protection_config.require_signed_commits is not None:
+    if update_signatures and protection_config.require_signed_commits is not None:
+        if protection_config.require_signed_commits:
+            this_branch.add_required_signatures()
+        else:
+            this_branch.remove_required_signatures()
+
+
+def _enabled(this_protection: GithubBranchProtection, key: str) -> bool:
+    return (this_protection.raw_data.get(key, None) or {}).get("enabled", False)
+
+
+def _differs(expected: Any, repo_value: Any) -> bool:
+    return expected is not None and expected != repo_value
+
+
+def protection_changes(  # noqa: C901
+    repo: Repository, protection_config: ProtectionOptions, this_protection: GithubBranchProtection | None
+) -> list[str]:
+    """Work out which parts of a branch's protection differ from our config
+
+    Options are compared like check_repo_branch_protections does, so options our config doesn't set are left alone.
+    this_protection is the branch's current protection, or None if the branch isn't protected.
+
+    Returns the names of the sub-resources to change, from PROTECTION_SUB_RESOURCES. "protection" means something
+    changed that only a PUT of the whole protection can set, like linear history, or requiring reviews on a branch
+    that doesn't require them yet. That PUT sets every other sub-resource but required_signatures too.
+    """
+    if this_protection is None:
+        changes = {"protection"}
+        if protection_config.require_signed_commits:
+            changes.add("required_signatures")
+        return [name for name in PROTECTION_SUB_RESOURCES if name in changes]
+
+    changes = set()
+    for option, key in PROTECTION_FLAGS.items():
+        if _differs(getattr(protection_config, option), _enabled(this_protection, key)):
+            changes.add("protection")
+
+    status_checks = protection_config.required_status_checks
+    repo_status_checks = this_protection.raw_data.get("required_status_checks", None)
+    if status_checks is not None:
+        if repo_status_checks is None:
+            if status_checks.strict or status_checks.checks:
+                changes.add("protection")
+        elif _differs(status_checks.strict, repo_status_checks.get("strict", False)) or _differs(
+            _sorted_or_none(status_checks.checks), sorted(repo_status_checks.get("contexts", []))
+        ):
+            changes.add("required_status_checks")
+
+    pr_options = protection_config.pr_options
+    if pr_options is not None:
+        expected = {
+            key: getattr(pr_options, key)
+            for key in ("required_approving_review_count", "dismiss_stale_reviews", "require_code_owner_reviews")
+            if getattr(pr_options, key) is not None
+        }
+        dismissal_restrictions = pr_options.dismissal_restrictions if repo.organization is not None else None
+        repo_reviews = this_protection.raw_data.get("required_pull_request_reviews", None)
+        if repo_reviews is None:
+            if len(expected) > 0 or dismissal_restrictions is not None:
+                changes.add("protection")
+        else:
+            if any(repo_reviews.get(key, None) != value for key, value in expected.items()):
+                changes.add("required_pull_request_reviews")
+            if dismissal_restrictions is not None:
+                repo_dismissal = repo_reviews.get("dismissal_restrictions", None) or {}
+                if _differs(
+                    _sorted_or_none(dismissal_restrictions.users),
+                    sorted(user["login"] for user in repo_dismissal.get("users", [])),
+                ) or _differs(
+                    _sorted_or_none(dismissal_restrictions.teams),
+                    sorted(team["slug"] for team in repo_dismissal.get("teams", [])),
+                ):
+                    changes.add("required_pull_request_reviews")
+
+    restrictions = protection_config.restrictions if repo.organization is not None else None
+    if restrictions is not None and (restrictions.users is not None or restrictions.teams is not None):
+        repo_restrictions = this_protection.raw_data.get("restrictions", None)
+        if repo_restrictions is None:
+            # restrictions can only be added to a branch without them by the PUT
+            changes.add("protection")
+        elif _differs(
+            _sorted_or_none(restrictions.users), sorted(user["login"] for user in repo_restrictions.get("users", []))
+        ) or _differs(
+            _sorted_or_none(restrictions.teams), sorted(team["slug"] for team in repo_restrictions.get("teams", []))
+        ):
+            changes.add("restrictions")
+
+    if _differs(protection_config.enforce_admins, _enabled(this_protection, "enforce_admins")):
+        changes.add("enforce_admins")
+    if _differs(protection_config.require_signed_commits, _enabled(this_protection, "required_signatures")):
+        changes.add("required_signatures")
+
+    if "protection" in changes:
+        # the PUT sets these anyway
+        changes -= {"required_status_checks", "required_pull_request_reviews", "restrictions", "enforce_admins"}
+    return [name for name in PROTECTION_SUB_RESOURCES if name in changes]
+
+
+def _status_check_kwargs(protection_config: ProtectionOptions) -> dict[str, Any]:
+    status_check_kwargs = {}
+    attr_to_kwarg("strict", protection_config.required_status_checks, status_check_kwargs)
+    attr_to_kwarg("checks", protection_config.required_status_checks, status_check_kwargs, transform_key="contexts")
+    return status_check_kwargs
+
+
+def _review_kwargs(repo: Repository, protection_config: ProtectionOptions) -> dict[str, Any]:
+    review_kwargs = {}
+    attr_to_kwarg("required_approving_review_count", protection_config.pr_options, review_kwargs)
+    attr_to_kwarg("dismiss_stale_reviews", protection_config.pr_options, review_kwargs)
+    attr_to_kwarg("require_code_owner_reviews", protection_config.pr_options, review_kwargs)
+    if repo.organization is not None:
+        dismissal_restrictions = protection_config.pr_options.dismissal_restrictions
+        attr_to_kwarg("users", dismissal_restrictions, review_kwargs, transform_key="dismissal_users")
+        attr_to_kwarg("teams", dismissal_restrictions, review_kwargs, transform_key="dismissal_teams")
+    return review_kwargs
+
+
+def protection_url(repo: Repository, branch: str) -> str:
+    return f"{repo.url}/branches/{quote(branch)}/protection"
+
+
+def plan_branch_protection(
+    repo: Repository, branch: str, protection_config: ProtectionOptions, state: RepoState | None = None
+) -> list[dict[str, Any]]:
+    """The requests sync_branch_protection would make, as plan steps"""
+    if state is None or state.branches is None or branch not in state.branches:
+        changes = ["protection"] + (
+            ["required_signatures"] if protection_config.require_signed_commits is not None else []
+        )
+    else:
+        changes = protection_changes(repo, protection_config, state.branches[branch])
+    url = protection_url(repo, branch)
+
+    steps = []
+    if "protection" in changes:
+        steps.append(
+            request_step(
+                "branch_protections",
+                f"Protect {branch}",
+                "PUT",
+                url,
+                input=protection_parameters(repo, protection_config),
+                headers={"Accept": mediaTypeRequireMultipleApprovingReviews},
+            )
+        )
+    if "required_status_checks" in changes:
+        steps.append(
+            request_step(
+                "branch_protections",
+                f"Update required status checks of {branch}",
+                "PATCH",
+                f"{url}/required_status_checks",
+                input=_status_check_kwargs(protection_config),
+            )
+        )
+    if "required_pull_request_reviews" in changes:
+        review_kwargs = _review_kwargs(repo, protection_config)
+        reviews = {key: value for key, value in review_kwargs.items() if not key.startswith("dismissal_")}
+        dismissal_restrictions = {
+            key: review_kwargs[f"dismissal_{key}"] for key in ("users", "teams") if f"dismissal_{key}" in review_kwargs
+        }
+        if len(dismissal_restrictions) > 0:
+            reviews["dismissal_restrictions"] = dismissal_restrictions
+        steps.append(
+            request_step(
+                "branch_protections",
+                f"Update required reviews of {branch}",
+                "PATCH",
+                f"{url}/required_pull_request_reviews",
+                input=reviews,
+                headers={"Accept": mediaTypeRequireMultipleApprovingReviews},
+            )
+        )
+    if "restrictions" in changes:
+        for key in ("users", "teams"):
+            if getattr(protection_config.restrictions, key) is not None:
+                steps.append(
+                    request_step(
+                        "branch_protections",
+                        f"Set the {key} who can push to {branch}",
+                        "PUT",
+                        f"{url}/restrictions/{key}",
+                        input={key: getattr(protection_config.restrictions, key)},
+                    )
+                )
+    if "enforce_admins" in changes:
+        steps.append(
+            request_step(
+                "branch_protections",
+                f"{'Enforce' if protection_config.enforce_admins else 'Stop enforcing'} {branch} protection on admins",
+                "POST" if protection_config.enforce_admins else "DELETE",
+                f"{url}/enforce_admins",
+            )
+        )
+    if "required_signatures" in changes:
+        steps.append(
+            request_step(
+                "branch_protections",
+                f"{'Require' if protection_config.require_signed_commits else 'Stop requiring'} signed commits on "
+                + branch,
+                "POST" if protection_config.require_signed_commits else "DELETE",
+                f"{url}/required_signatures",
+                headers={"Accept": signaturesProtectedBranchesPreview},
+            )
+        )
+    return steps
+
+
+def sync_branch_protection(
+    repo: Repository, branch: str, protection_config: ProtectionOptions, state: RepoState | None = None
+) -> list[str]:
+    """Update only the parts of a branch's protection that differ from our config
+
+    The branch's current protection is read from state, where the check or prefetch_repo_states left it. Each changed
+    sub-resource is sent to its own, narrower, endpoint, and the whole protection is only PUT when something changed
+    that has no endpoint of its own. If the current protection isn't known, this falls back to
+    update_branch_protection.
+
+    Returns the sub-resources that were changed, from PROTECTION_SUB_RESOURCES
+    """
+    if state is None:
+        state = RepoState()
+    if state.branches is None or branch not in state.branches:
+        update_branch_protection(repo, branch, protection_config, state.get_branch(repo, branch))
+        return ["protection"] + (
+            ["required_signatures"] if protection_config.require_signed_commits is not None else []
+        )
+
+    changes = protection_changes(repo, protection_config, state.branches[branch])
+    if len(changes) == 0:
+        return changes
+    this_branch = state.get_branch(repo, branch)
+
+    if "protection" in changes:
+        update_branch_protection(repo, branch, protection_config, this_branch, update_signatures=False)
+    if "required_status_checks" in changes:
+        this_branch.edit_required_status_checks(**_status_check_kwargs(protection_config))
+    if "required_pull_request_reviews" in changes:
+        this_branch.edit_required_pull_request_reviews(**_review_kwargs(repo, protection_config))
+    if "restrictions" in changes:
+        if protection_config.restrictions.users is not None:
+            this_branch.replace_user_push_restrictions(*protection_config.restrictions.users)
+        if protection_config.restrictions.teams is not None:
+            this_branch.replace_team_push_restrictions(*protection_config.restrictions.teams)
+    if "enforce_admins" in changes:
+        if protection_config.enforce_admins:
+            this_branch.set_admin_enforcement()
+        else:
+            this_branch.remove_admin_enforcement()
+    if "required_signatures" in changes:
         if protection_config.require_signed_commits:
             this_branch.add_required_signatures()
         else:
             this_branch.remove_required_signatures()
+    return changes
 
 
-def check_repo_branch_protections(
-    repo: Repository, config_branch_protections: list[BranchProtection]
+def get_branch(repo: Repository, branch: str) -> Branch | None:
+    """Gets a single branch from a repo, returning None if the branch does not exist"""
+    try:
+        return repo.get_branch(branch)
+    except GithubException as exc:
+        if exc.status == 404:
+            return None
+        raise
+
+
+def get_protected_branches(repo: Repository) -> dict[str, Branch]:
+    """
+    :calls: `GET /repos/{owner}/{repo}/branches?protected=true
+    <https://docs.github.com/en/rest/branches/branches#list-branches>`_
+
+    Only lists protected branches, so the number of calls scales with how many branches are protected rather than
+    how many branches the repo has
+    """
+    return {
+        branch.name: branch
+        for branch in PaginatedList(Branch, repo._requester, f"{repo.url}/branches", {"protected": "true"})
+    }
+
+
+def check_repo_branch_protections(  # noqa: C901
+    repo: Repository,
+    config_branch_protections: list[BranchProtection],
+    state: RepoState | None = None,
 ) -> tuple[bool, dict[str, list[str] | dict[str, Any]]]:
     """Checks a repo's branch protections vs our expected settings
 
     Args:
         repo (Repository): [description]
         secrets (List[Secret]): [description]
+        state (Optional[RepoState]): The run's snapshot of the repo. Its branches are used if already fetched.
+            Otherwise the protections this compares are added to them, and the branches this looks up are added to
+            its branch_objects
 
     """
-    repo_branches = {branch.name: branch for branch in repo.get_branches()}
-
+    if state is None:
+        state = RepoState()
+    if state.branch_objects is None:
+        state.branch_objects = {}
+    repo_branches = state.branches
+    # the protections looked up here, for apply to diff against
+    fetched_protections = {}
     missing_protections = []
     extra_protections = []
     diff_protections = {}
+    # only fetched if there are protections to remove
+    protected_branches = None
 
     for config_bp in config_branch_protections:
-        repo_bp = repo_branches.get(config_bp.name, None)
-        if repo_bp is None and config_bp.exists:
-            missing_protections.append(config_bp.name)
-            continue
-        if not config_bp.exists and repo_bp is not None:
-            extra_protections.append(config_bp.name)
+        if not config_bp.exists:
+            if repo_branches is not None:
+                if repo_branches.get(config_bp.name, None) is not None:
+                    extra_protections.append(config_bp.name)
+                continue
+            if protected_branches is None:
+                protected_branches = get_protected_branches(repo)
+            if config_bp.name in protected_branches:
+                extra_protections.append(config_bp.name)
+                state.branch_objects[config_bp.name] = protected_branches[config_bp.name]
             continue
 
+        if repo_branches is not None:
+            if config_bp.name not in repo_branches:
+                missing_protections.append(config_bp.name)
+                continue
+            this_protection = repo_branches[config_bp.name]
+            protected = this_protection is not None
+        else:
+            # Look up only the branches in our config instead of listing every branch in the repo
+            repo_bp = get_branch(repo, config_bp.name)
+            if repo_bp is None:
+                missing_protections.append(config_bp.name)
+                continue
+            state.branch_objects[config_bp.name] = repo_bp
+            protected = repo_bp.protected
+
         diffs = []
         if config_bp.protection is None:
             continue
 
         # if our repo isn't protected and we've made it this far, it should be
-        if not repo_bp.protected:
+        if not protected:
+            fetched_protections[config_bp.name] = None
             diff_protections[config_bp.name] = ["Branch is not protected"]
             continue
 
-        this_protection = repo_bp.get_protection()
+        if repo_branches is None:
+            this_protection = repo_bp.get_protection()
+            fetched_protections[config_bp.name] = this_protection
         if config_bp.protection.pr_options is not None:
             diffs.append(
                 diff_option(
@@ -355,15 +713,12 @@ def check_repo_branch_protections(
                 )
             )
             # Without sorting, they sometimes get flagged as different just due to the ordinality of them
-            if config_bp.protection.required_status_checks.checks is not None:
-                config_bp.protection.required_status_checks.checks.sort()
-            if this_protection.required_status_checks.contexts is not None:
-                this_protection.required_status_checks.contexts.sort()
+            # The config is shared between threads in fleet mode, so sort copies rather than in place
             diffs.append(
                 diff_option(
                     "required_status_checks::checks",
-                    config_bp.protection.required_status_checks.checks,
-                    this_protection.required_status_checks.contexts,
+                    _sorted_or_none(config_bp.protection.required_status_checks.checks),
+                    _sorted_or_none(this_protection.required_status_checks.contexts),
                 )
             )
 
@@ -417,8 +772,7 @@ def check_repo_branch_protections(
             )
         )
 
-        # TODO: Figure out how to diff Restriction options
-        # I figured out some of them....
+        # users are compared by login, like protection_changes does, as that is what our config lists them by
         try:
             dismissal_teams = objary_to_list("slug", this_protection.required_pull_request_reviews.dismissal_teams)
         except TypeError:
@@ -426,35 +780,51 @@ def check_repo_branch_protections(
 
         dismissal_teams.sort()
         if config_bp.protection.pr_options.dismissal_restrictions is not None:
-            if config_bp.protection.pr_options.dismissal_restrictions.teams is not None:
-                config_bp.protection.pr_options.dismissal_restrictions.teams.sort()
             diffs.append(
                 diff_option(
                     "dismissal_teams",
-                    config_bp.protection.pr_options.dismissal_restrictions.teams,
+                    _sorted_or_none(config_bp.protection.pr_options.dismissal_restrictions.teams),
                     dismissal_teams,
                 )
             )
         try:
-            dismissal_users = objary_to_list("name", this_protection.required_pull_request_reviews.dismissal_users)
+            dismissal_users = objary_to_list("login", this_protection.required_pull_request_reviews.dismissal_users)
         except TypeError:
             dismissal_users = []
         dismissal_users.sort()
         if config_bp.protection.pr_options.dismissal_restrictions is not None:
-            if config_bp.protection.pr_options.dismissal_restrictions.teams is not None:
-                config_bp.protection.pr_options.dismissal_restrictions.teams.sort()
             diffs.append(
                 diff_option(
                     "dismissal_users",
-                    config_bp.protection.pr_options.dismissal_restrictions.users,
+                    _sorted_or_none(config_bp.protection.pr_options.dismissal_restrictions.users),
                     dismissal_users,
                 )
             )
 
+        restrictions = config_bp.protection.restrictions if repo.organization is not None else None
+        if restrictions is not None:
+            repo_restrictions = this_protection.raw_data.get("restrictions", None) or {}
+            diffs.append(
+                diff_option(
+                    "restrictions::users",
+                    _sorted_or_none(restrictions.users),
+                    sorted(user["login"] for user in repo_restrictions.get("users", [])),
+                )
+            )
+            diffs.append(
+                diff_option(
+                    "restrictions::teams",
+                    _sorted_or_none(restrictions.teams),
+                    sorted(team["slug"] for team in repo_restrictions.get("teams", [])),
+                )
+            )
+
         diffs = [i for i in diffs if i is not None]
         if len(diffs) > 0:
             diff_protections[config_bp.name] = deepcopy(diffs)
 
+    if repo_branches is None:
+        state.branches = fetched_protections
     return len(missing_protections) == 0 & len(extra_protections) == 0 & len(diff_protections.keys()) == 0, {
         "missing": missing_protections,
         "extra": extra_protections,
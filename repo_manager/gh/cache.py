@@ -0,0 +1,148 @@
+import json
+import os
+import time
+from base64 import b64decode
+from base64 import b64encode
+from collections.abc import Callable
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any
+
+from requests import PreparedRequest
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Headers that describe the request that was just made, rather than the cached resource. These are taken from the
+# 304 response instead of the cache when replaying
+FRESH_HEADERS = ("date", "x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset", "x-ratelimit-used")
+# The body is stored already decoded, so these no longer apply to it
+STRIPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+# Seconds an entry is kept without being used, before it is pruned
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+
+class ResponseCache:
+    """On-disk cache of GET responses and their ETags
+
+    Lets repeat GET requests be sent with If-None-Match. GitHub answers those with a 304 when nothing changed, which
+    does not count against the rate limit, and the cached response is replayed in its place.
+
+    Each response is stored as its own json file in cache_dir, so the directory can be saved and restored between
+    runs with actions/cache. Entries that haven't been used for max_age seconds are pruned when the cache is opened,
+    so the directory doesn't grow without bound.
+
+    Entries are keyed by the token they were fetched with, unless a namespace is set. The GITHUB_TOKEN of a workflow
+    changes every run, so without a namespace the cache is only reused across runs with a token that doesn't, like a
+    PAT. A namespace lets every token that uses it share entries, which is safe to replay as each conditional request
+    is still sent with the current token, and GitHub only answers it with a 304 if that token gets the same response.
+    """
+
+    def __init__(self, cache_dir: str | Path, namespace: str | None = None, max_age: float = CACHE_MAX_AGE):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self.max_age = max_age
+        self.prune()
+
+    def key(self, request: PreparedRequest) -> str:
+        """Cache key for a request
+
+        Includes the namespace if there is one. Otherwise it includes the auth header, hashed, so that responses
+        fetched with one token are never replayed for another
+        """
+        if self.namespace is not None:
+            identity = f"namespace:{self.namespace}"
+        else:
+            identity = sha256(request.headers.get("Authorization", "").encode("utf-8")).hexdigest()
+        return sha256(
+            "\n".join([request.method, request.url, request.headers.get("Accept", ""), identity]).encode("utf-8")
+        ).hexdigest()
+
+    def prune(self) -> int:
+        """Delete the entries that haven't been used for max_age seconds, and any temp files left by a run that died
+
+        Returns:
+            int: How many files were deleted
+        """
+        oldest = time.time() - self.max_age
+        pruned = 0
+        for path in [*self.cache_dir.glob("*.json"), *self.cache_dir.glob("*.tmp")]:
+            try:
+                if path.stat().st_mtime < oldest:
+                    path.unlink()
+                    pruned += 1
+            except OSError:
+                # another run pruned it first
+                continue
+        return pruned
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        try:
+            with open(self._path(key)) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            # a missing or corrupt entry is just a cache miss
+            return None
+
+    def set(self, key: str, response: Response):
+        entry = {
+            "etag": response.headers.get("ETag", None),
+            "last_modified": response.headers.get("Last-Modified", None),
+            "headers": {
+                header: value for header, value in response.headers.items() if header.lower() not in STRIPPED_HEADERS
+            },
+            "body": b64encode(response.content).decode("ascii"),
+        }
+        # write to a temp file and rename it into place, so concurrent workers never read a partial entry
+        with NamedTemporaryFile("w", dir=self.cache_dir, delete=False, suffix=".tmp") as fh:
+            json.dump(entry, fh)
+        os.replace(fh.name, self._path(key))
+
+    def __call__(self, request: PreparedRequest, send: Callable[..., Response], **kwargs) -> Response:
+        """Send a request through the cache, for use as a transport middleware"""
+        if request.method != "GET" or kwargs.get("stream", False):
+            return send(request, **kwargs)
+
+        key = self.key(request)
+        cached = self.get(key)
+        if cached is not None:
+            if cached["etag"] is not None:
+                request.headers["If-None-Match"] = cached["etag"]
+            elif cached["last_modified"] is not None:
+                request.headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = send(request, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            # mark the entry as used, so it isn't pruned
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+            return self.replay(cached, response)
+        if response.status_code == 200 and ("ETag" in response.headers or "Last-Modified" in response.headers):
+            self.set(key, response)
+        return response
+
+    @staticmethod
+    def replay(cached: dict[str, Any], not_modified: Response) -> Response:
+        """Build a 200 response from a cache entry, in place of the 304 GitHub sent"""
+        response = Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(cached["headers"])
+        for header in FRESH_HEADERS:
+            if header in not_modified.headers:
+                response.headers[header] = not_modified.headers[header]
+        response._content = b64decode(cached["body"])
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response.connection = getattr(not_modified, "connection", None)
+        response.elapsed = not_modified.elapsed
+        response.encoding = get_encoding_from_headers(response.headers)
+        return response
@@ -1,17 +1,36 @@
 from pathlib import Path
+from typing import Any
 
+from github.GitCommit import GitCommit
+from github.GitTree import GitTree
+from github.GithubException import GithubException
 from github.GithubException import UnknownObjectException
+from github.InputGitTreeElement import InputGitTreeElement
 from github.Repository import Repository
 
+from repo_manager.gh.plan import commit_step
+from repo_manager.gh.state import RepoState
 from repo_manager.schemas import FileConfig
+from repo_manager.schemas.file import git_blob_sha
 
 
 class RemoteSrcNotFoundError(Exception): ...
 
 
-def copy_file(repo: Repository, file_config: FileConfig) -> str:
+class RemoteDestNotFoundError(Exception): ...
+
+
+DEFAULT_FILE_MODE = "100644"
+# Statuses of a tree request for a branch that doesn't exist, and for any branch of an empty repo
+BRANCH_NOT_FOUND = 404
+REPO_EMPTY = 409
+
+
+def copy_file(repo: Repository, file_config: FileConfig) -> str | None:
     """Copy files to a repository using the BLOB API
     Files can be sourced from a local file or a remote repository
+
+    Returns None without committing if the destination already has the same contents
     """
     target_branch = file_config.target_branch if file_config.target_branch is not None else repo.default_branch
     try:
@@ -25,6 +44,8 @@ def copy_file(repo: Repository, file_config: FileConfig) -> str:
 
     try:
         dest_contents = repo.get_contents(str(file_config.dest_file), ref=target_branch)
+        if dest_contents.sha == git_blob_sha(file_contents):
+            return None
         result = repo.update_file(
             str(file_config.dest_file.relative_to(".")),
             file_config.commit_msg,
@@ -63,3 +84,282 @@ def delete_file(
     contents = repo.get_contents(str(to_delete.relative_to(".")), ref=target_branch)
     result = repo.delete_file(contents.path, file_config.commit_msg, contents.sha, branch=target_branch)
     return result["commit"].sha
+
+
+def group_files(file_configs: list[FileConfig]) -> dict[str, list[FileConfig]]:
+    """Group file configs by their commit_key, each group is committed in one commit"""
+    groups = {}
+    for file_config in file_configs:
+        groups.setdefault(file_config.commit_key, []).append(file_config)
+    return groups
+
+
+def get_tree_files(repo: Repository, tree_sha: str) -> tuple[GitTree, dict[str, tuple[str, str]]]:
+    """Get a tree, and the blob sha and mode of every file in it, in one request
+
+    tree_sha can also be a commit sha or branch name
+    """
+    tree = repo.get_git_tree(tree_sha, recursive=True)
+    return tree, {element.path: (element.sha, element.mode) for element in tree.tree if element.type == "blob"}
+
+
+def find_tree_file(
+    repo: Repository, tree: GitTree, tree_files: dict[str, tuple[str, str]], path: str, ref: str
+) -> tuple[str, str] | None:
+    """Find a file's blob sha and mode in a tree from get_tree_files, or None if the file does not exist"""
+    if path in tree_files:
+        return tree_files[path]
+    # Very large trees are truncated by the API, so fall back to looking the file up directly
+    if not tree.raw_data.get("truncated", False):
+        return None
+    try:
+        contents = repo.get_contents(path, ref=ref)
+    except UnknownObjectException:
+        return None
+    return contents.sha, DEFAULT_FILE_MODE
+
+
+def commit_files(
+    repo: Repository, file_configs: list[FileConfig], target_branch: str, state: RepoState | None = None
+) -> tuple[str | None, list[FileConfig], list[tuple[FileConfig, Exception]]]:
+    """Copy, move and delete a group of files in a single commit using the Git Data API
+
+    All of file_configs should share a commit_key. Rather than a GET and a PUT per file through the contents API,
+    this reads the branch's tree once, builds one new tree with every change, and pushes it as one commit.
+    New file contents are sent inline in the tree, so no separate blob requests are needed, and remote copies
+    and moves reuse the source file's existing blob.
+
+    If the branch still points at the tree check_repo_files put in state, that tree is reused rather than fetched
+    again. Files whose destination already has the expected contents are left out of the commit, and if nothing
+    changed no commit is made. Files that can't be committed, like deleting a file that does not exist, are left out
+    of the commit and returned with the exception explaining why.
+
+    If the branch moves while the commit is made, it is made again once on top of the branch's new head. Commits made
+    with the Git Data API aren't signed, so if the branch requires signed commits the files are committed through
+    the contents API instead, one commit per file, which GitHub signs.
+
+    Returns:
+        Tuple[Optional[str], List[FileConfig], List[Tuple[FileConfig, Exception]]]: The commit's SHA, or None if
+            there was nothing to commit, the files that were already up to date, and the files that were skipped
+    """
+    ref = repo.get_git_ref(f"heads/{target_branch}")
+    for attempt in range(2):
+        parent = repo.get_git_commit(ref.object.sha)
+        base_tree, elements, unchanged, skipped = tree_changes(repo, file_configs, target_branch, parent, state)
+        if len(elements) == 0:
+            return None, unchanged, skipped
+
+        new_tree = repo.create_git_tree(list(elements.values()), base_tree)
+        commit = repo.create_git_commit(file_configs[0].commit_msg, new_tree, [parent])
+        try:
+            ref.edit(commit.sha)
+        except GithubException as exc:
+            if exc.status != 422:
+                raise
+            if "signature" in f"{exc.data}".lower():
+                return commit_files_by_contents(repo, file_configs, unchanged, skipped)
+            # not a fast forward, the branch moved since its head was read
+            if attempt > 0:
+                raise
+            ref = repo.get_git_ref(f"heads/{target_branch}")
+            continue
+        return commit.sha, unchanged, skipped
+
+
+def commit_files_by_contents(
+    repo: Repository,
+    file_configs: list[FileConfig],
+    unchanged: list[FileConfig],
+    skipped: list[tuple[FileConfig, Exception]],
+) -> tuple[str | None, list[FileConfig], list[tuple[FileConfig, Exception]]]:
+    """Commit the files of a group commit_files found changes for with the contents API, one commit per file
+
+    Returns:
+        Tuple[Optional[str], List[FileConfig], List[Tuple[FileConfig, Exception]]]: The SHA of the last commit, or
+            None if none were made, and unchanged and skipped, with any files that failed added to skipped
+    """
+    done = {id(file_config) for file_config in unchanged} | {id(file_config) for file_config, _ in skipped}
+    commit_sha = None
+    for file_config in file_configs:
+        if id(file_config) in done:
+            continue
+        try:
+            if not file_config.exists:
+                commit_sha = delete_file(repo, file_config)
+            elif file_config.move and file_config.remote_src:
+                _, commit_sha = move_file(repo, file_config)
+            else:
+                commit_sha = copy_file(repo, file_config) or commit_sha
+        except Exception as exc:  # this should be tighter
+            skipped.append((file_config, exc))
+    return commit_sha, unchanged, skipped
+
+
+def plan_commit(
+    repo: Repository, file_configs: list[FileConfig], target_branch: str, state: RepoState | None = None
+) -> tuple[dict[str, Any] | None, list[FileConfig], list[tuple[FileConfig, Exception]]]:
+    """The commit commit_files would make, as a plan step
+
+    The step commits on top of the branch's head as the plan is made, and holds the contents of any local files
+
+    Returns:
+        Tuple[Optional[Dict[str, Any]], List[FileConfig], List[Tuple[FileConfig, Exception]]]: The commit step, or
+            None if there is nothing to commit, the files that are already up to date, and the files that are skipped
+    """
+    parent = repo.get_git_commit(repo.get_git_ref(f"heads/{target_branch}").object.sha)
+    base_tree, elements, unchanged, skipped = tree_changes(repo, file_configs, target_branch, parent, state)
+    if len(elements) == 0:
+        return None, unchanged, skipped
+    step = commit_step(
+        f"Commit {', '.join(elements.keys())} to {target_branch}",
+        repo.url,
+        target_branch,
+        parent.sha,
+        base_tree.sha,
+        file_configs[0].commit_msg,
+        [element._identity for element in elements.values()],
+    )
+    return step, unchanged, skipped
+
+
+def tree_changes(  # noqa: C901
+    repo: Repository, file_configs: list[FileConfig], target_branch: str, parent: GitCommit, state: RepoState | None
+) -> tuple[GitTree, dict[str, InputGitTreeElement], list[FileConfig], list[tuple[FileConfig, Exception]]]:
+    """The tree elements to change to commit a group of files on top of parent, as commit_files does
+
+    Returns:
+        Tuple[GitTree, Dict[str, InputGitTreeElement], List[FileConfig], List[Tuple[FileConfig, Exception]]]: The
+            parent's tree, the elements to change by path, and the unchanged and skipped files
+    """
+    base_tree, tree_files = None, None
+    if state is not None and state.trees is not None:
+        base_tree, tree_files = state.trees.get(target_branch, (None, None))
+    # if the branch moved since the check, its tree is fetched again rather than committing over the changes
+    if base_tree is None or base_tree.sha != parent.tree.sha:
+        base_tree, tree_files = get_tree_files(repo, parent.tree.sha)
+
+    def lookup(path: str) -> tuple[str, str] | None:
+        return find_tree_file(repo, base_tree, tree_files, path, parent.sha)
+
+    elements = {}
+    unchanged = []
+    skipped = []
+    for file_config in file_configs:
+        dest_path = str(file_config.dest_file.relative_to("."))
+        try:
+            if not file_config.exists:
+                dest = lookup(dest_path)
+                if dest is None:
+                    raise RemoteDestNotFoundError(f"{dest_path} not found in {target_branch}")
+                elements[dest_path] = InputGitTreeElement(dest_path, dest[1], "blob", sha=None)
+                continue
+
+            dest = lookup(dest_path)
+            if file_config.remote_src:
+                src_path = str(file_config.src_file.relative_to("."))
+                src = lookup(src_path)
+                if src is None:
+                    raise RemoteSrcNotFoundError(f"Remote file {file_config.src_file} not found in {target_branch}")
+                if file_config.move:
+                    elements[src_path] = InputGitTreeElement(src_path, src[1], "blob", sha=None)
+                if dest is not None and dest[0] == src[0]:
+                    if not file_config.move:
+                        unchanged.append(file_config)
+                    continue
+                elements[dest_path] = InputGitTreeElement(dest_path, src[1], "blob", sha=src[0])
+            else:
+                if dest is not None and dest[0] == file_config.src_file_sha:
+                    unchanged.append(file_config)
+                    continue
+                elements[dest_path] = InputGitTreeElement(
+                    dest_path,
+                    dest[1] if dest is not None else DEFAULT_FILE_MODE,
+                    "blob",
+                    content=file_config.src_file_contents,
+                )
+        except Exception as exc:  # this should be tighter
+            skipped.append((file_config, exc))
+    return base_tree, elements, unchanged, skipped
+
+
+def check_repo_files(
+    repo: Repository, file_configs: list[FileConfig], state: RepoState | None = None
+) -> tuple[bool, dict[str, list[str] | dict[str, Any]]]:
+    """Checks a repo's files vs our expected files
+
+    Files are compared by their git blob sha, using one tree request per target branch, so no file contents are
+    downloaded.
+
+    Args:
+        repo (Repository): [description]
+        file_configs (List[FileConfig]): [description]
+        state (Optional[RepoState]): The run's snapshot of the repo. The trees this fetches are added to it
+
+    """
+    if state is None:
+        state = RepoState()
+    if state.trees is None:
+        state.trees = {}
+    missing_files = []
+    extra_files = []
+    diff_files = {}
+    branch_trees = state.trees
+    # target branch -> status of its tree request, for branches that have no tree to check against
+    missing_branches = {}
+
+    for file_config in file_configs:
+        target_branch = file_config.target_branch if file_config.target_branch is not None else repo.default_branch
+        dest_path = str(file_config.dest_file.relative_to("."))
+        if target_branch not in branch_trees and target_branch not in missing_branches:
+            try:
+                branch_trees[target_branch] = get_tree_files(repo, target_branch)
+            except GithubException as exc:
+                if exc.status not in (BRANCH_NOT_FOUND, REPO_EMPTY):
+                    raise
+                missing_branches[target_branch] = exc.status
+        if target_branch in missing_branches:
+            # files to delete are already gone. An empty repo is missing every file, which apply reports an error
+            # for, like it does for a target branch that doesn't exist
+            if not file_config.exists:
+                continue
+            if missing_branches[target_branch] == REPO_EMPTY:
+                missing_files.append(dest_path)
+            else:
+                diff_files[dest_path] = [f"Target branch {target_branch} not found"]
+            continue
+        tree, tree_files = branch_trees[target_branch]
+
+        dest = find_tree_file(repo, tree, tree_files, dest_path, target_branch)
+        if not file_config.exists:
+            if dest is not None:
+                extra_files.append(dest_path)
+            continue
+
+        diffs = []
+        if file_config.remote_src:
+            src_path = str(file_config.src_file.relative_to("."))
+            src = find_tree_file(repo, tree, tree_files, src_path, target_branch)
+            if src is None:
+                if dest is None:
+                    diffs.append(f"Remote src_file {src_path} not found in {target_branch}")
+            else:
+                if file_config.move:
+                    diffs.append(f"{src_path} should be moved to {dest_path}")
+                if dest is not None and dest[0] != src[0]:
+                    diffs.append(f"Contents differ from {src_path}")
+        elif not file_config.src_file_exists:
+            diffs.append(f"Local src_file {str(file_config.src_file)} not found")
+        else:
+            if dest is not None and dest[0] != file_config.src_file_sha:
+                diffs.append(f"Contents differ from {str(file_config.src_file)}")
+
+        if dest is None and len(diffs) == 0:
+            missing_files.append(dest_path)
+        elif len(diffs) > 0:
+            diff_files[dest_path] = diffs
+
+    return len(missing_files) == 0 and len(extra_files) == 0 and len(diff_files.keys()) == 0, {
+        "missing": missing_files,
+        "extra": extra_files,
+        "diffs": diff_files,
+    }
@@ -0,0 +1,263 @@
+from typing import Any
+from urllib.parse import quote
+
+from github import Github
+from github.Branch import Branch
+from github.BranchProtection import BranchProtection
+from github.Label import Label
+from github.Requester import Requester
+
+from .state import RepoState
+
+# How many repos to fetch in one query. Each repo brings up to 100 labels, so this keeps a query well under
+# GitHub's node limit
+GRAPHQL_BATCH_SIZE = 20
+
+REPO_FRAGMENTS = """
+fragment RepoFields on Repository {
+  nameWithOwner
+  description
+  homepageUrl
+  isPrivate
+  hasIssuesEnabled
+  hasProjectsEnabled
+  hasWikiEnabled
+  defaultBranchRef { name }
+  squashMergeAllowed
+  mergeCommitAllowed
+  rebaseMergeAllowed
+  deleteBranchOnMerge
+  repositoryTopics(first: 100) { nodes { topic { name } } }
+  labels(first: 100) { ...LabelPage }
+}
+
+fragment LabelPage on LabelConnection {
+  pageInfo { hasNextPage endCursor }
+  nodes { name color description }
+}
+
+fragment RefFields on Ref {
+  name
+  branchProtectionRule {
+    requiresApprovingReviews
+    requiredApprovingReviewCount
+    dismissesStaleReviews
+    requiresCodeOwnerReviews
+    restrictsReviewDismissals
+    reviewDismissalAllowances(first: 100) {
+      nodes { actor { __typename ... on User { login name } ... on Team { slug } } }
+    }
+    restrictsPushes
+    pushAllowances(first: 100) {
+      nodes { actor { __typename ... on User { login } ... on Team { slug } ... on App { slug } } }
+    }
+    requiresStatusChecks
+    requiresStrictStatusChecks
+    requiredStatusCheckContexts
+    isAdminEnforced
+    requiresLinearHistory
+    allowsForcePushes
+    allowsDeletions
+    blocksCreations
+    requiresConversationResolution
+    requiresCommitSignatures
+  }
+}
+"""
+
+LABELS_QUERY = """
+query RepoLabels($owner: String!, $name: String!, $after: String) {
+  repository(owner: $owner, name: $name) { labels(first: 100, after: $after) { ...LabelPage } }
+}
+
+fragment LabelPage on LabelConnection {
+  pageInfo { hasNextPage endCursor }
+  nodes { name color description }
+}
+"""
+
+# Settings from repo_manager.schemas.settings.Settings -> how to read them from a RepoFields result. Settings that
+# aren't in GraphQL, like has_downloads, are left for the check to read from the repo object
+SETTINGS_FIELDS = {
+    "description": lambda repo: repo["description"],
+    "homepage": lambda repo: repo["homepageUrl"],
+    "topics": lambda repo: [node["topic"]["name"] for node in repo["repositoryTopics"]["nodes"]],
+    "private": lambda repo: repo["isPrivate"],
+    "has_issues": lambda repo: repo["hasIssuesEnabled"],
+    "has_projects": lambda repo: repo["hasProjectsEnabled"],
+    "has_wiki": lambda repo: repo["hasWikiEnabled"],
+    "default_branch": lambda repo: repo["defaultBranchRef"]["name"] if repo["defaultBranchRef"] is not None else None,
+    "allow_squash_merge": lambda repo: repo["squashMergeAllowed"],
+    "allow_merge_commit": lambda repo: repo["mergeCommitAllowed"],
+    "allow_rebase_merge": lambda repo: repo["rebaseMergeAllowed"],
+    "delete_branch_on_merge": lambda repo: repo["deleteBranchOnMerge"],
+}
+
+
+def build_repo_states_query(repo_count: int, branch_count: int) -> str:
+    """Build a query for the state of repo_count repos, and branch_count branches in each, in one request
+
+    Each repo is aliased repo<n>, with variables owner<n> and name<n>. Each branch is aliased branch<n>, with variable
+    branch<n> holding its fully qualified ref name
+    """
+    variables = [f"$owner{i}: String!, $name{i}: String!" for i in range(repo_count)] + [
+        f"$branch{j}: String!" for j in range(branch_count)
+    ]
+    branches = "\n".join(
+        f"    branch{j}: ref(qualifiedName: $branch{j}) {{ ...RefFields }}" for j in range(branch_count)
+    )
+    repos = "\n".join(
+        f"  repo{i}: repository(owner: $owner{i}, name: $name{i}) {{\n    ...RepoFields\n{branches}\n  }}"
+        for i in range(repo_count)
+    )
+    return f"query RepoStates({', '.join(variables)}) {{\n{repos}\n}}\n{REPO_FRAGMENTS}"
+
+
+def protection_attributes(rule: dict[str, Any], url: str) -> dict[str, Any]:
+    """Convert a GraphQL branchProtectionRule to the shape the REST api returns a branch's protection in"""
+    attributes = {
+        "url": url,
+        "enforce_admins": {"enabled": rule["isAdminEnforced"]},
+        "required_linear_history": {"enabled": rule["requiresLinearHistory"]},
+        "allow_force_pushes": {"enabled": rule["allowsForcePushes"]},
+        "allow_deletions": {"enabled": rule["allowsDeletions"]},
+        "block_creations": {"enabled": rule["blocksCreations"]},
+        "required_conversation_resolution": {"enabled": rule["requiresConversationResolution"]},
+        "required_signatures": {"enabled": rule["requiresCommitSignatures"]},
+    }
+    if rule["requiresStatusChecks"]:
+        attributes["required_status_checks"] = {
+            "strict": rule["requiresStrictStatusChecks"],
+            "contexts": rule["requiredStatusCheckContexts"],
+        }
+    if rule["requiresApprovingReviews"]:
+        reviews = {
+            "dismiss_stale_reviews": rule["dismissesStaleReviews"],
+            "require_code_owner_reviews": rule["requiresCodeOwnerReviews"],
+            "required_approving_review_count": rule["requiredApprovingReviewCount"],
+        }
+        # always set, even if empty, so reading them never tries to complete the object with another request
+        actors = []
+        if rule["restrictsReviewDismissals"]:
+            actors = [node["actor"] for node in rule["reviewDismissalAllowances"]["nodes"]]
+        reviews["dismissal_restrictions"] = {
+            "users": [
+                {"login": actor["login"], "name": actor["name"]} for actor in actors if actor["__typename"] == "User"
+            ],
+            "teams": [{"slug": actor["slug"]} for actor in actors if actor["__typename"] == "Team"],
+        }
+        attributes["required_pull_request_reviews"] = reviews
+    if rule["restrictsPushes"]:
+        actors = [node["actor"] for node in rule["pushAllowances"]["nodes"]]
+        attributes["restrictions"] = {
+            "url": f"{url}/restrictions",
+            "users_url": f"{url}/restrictions/users",
+            "teams_url": f"{url}/restrictions/teams",
+            "apps_url": f"{url}/restrictions/apps",
+            "users": [{"login": actor["login"]} for actor in actors if actor["__typename"] == "User"],
+            "teams": [{"slug": actor["slug"]} for actor in actors if actor["__typename"] == "Team"],
+            "apps": [{"slug": actor["slug"]} for actor in actors if actor["__typename"] == "App"],
+        }
+    return attributes
+
+
+def _make_labels(requester: Requester, repo_url: str, nodes: list[dict[str, Any]]) -> dict[str, Label]:
+    return {
+        node["name"]: Label(
+            requester,
+            {},
+            {
+                "name": node["name"],
+                "color": node["color"],
+                "description": node["description"],
+                "url": f"{repo_url}/labels/{quote(node['name'])}",
+            },
+            completed=True,
+        )
+        for node in nodes
+    }
+
+
+def _get_remaining_labels(requester: Requester, repo_url: str, full_name: str, after: str) -> dict[str, Label]:
+    """Page through the labels after the first page, for the rare repo with more than 100 of them"""
+    owner, name = full_name.split("/", 1)
+    labels = {}
+    has_next_page = True
+    while has_next_page:
+        _, data = requester.graphql_query(LABELS_QUERY, {"owner": owner, "name": name, "after": after})
+        page = data["data"]["repository"]["labels"]
+        labels.update(_make_labels(requester, repo_url, page["nodes"]))
+        has_next_page = page["pageInfo"]["hasNextPage"]
+        after = page["pageInfo"]["endCursor"]
+    return labels
+
+
+def fetch_repo_states(client: Github, full_names: list[str], branch_names: list[str]) -> dict[str, RepoState]:
+    """Fetch the settings, topics, labels, and protection of branch_names, for many repos in one GraphQL query
+
+    Repos the query can't see, because they don't exist or the token can't access them, are left out of the result
+    so their checks fall back to the REST api.
+
+    Returns:
+        Dict[str, RepoState]: Each repo's state, keyed by the full name it was requested by
+    """
+    if len(full_names) == 0:
+        return {}
+
+    requester = client.requester
+    variables = {}
+    for i, full_name in enumerate(full_names):
+        variables[f"owner{i}"], variables[f"name{i}"] = full_name.split("/", 1)
+    for j, branch_name in enumerate(branch_names):
+        variables[f"branch{j}"] = f"refs/heads/{branch_name}"
+
+    # Not requester.graphql_query, which raises if any one repo is missing rather than returning the rest
+    _, data = requester.requestJsonAndCheck(
+        "POST",
+        requester.graphql_url,
+        input={"query": build_repo_states_query(len(full_names), len(branch_names)), "variables": variables},
+    )
+    if data.get("data", None) is None:
+        raise requester.createException(400, {}, data)
+
+    states = {}
+    for i, full_name in enumerate(full_names):
+        repo = data["data"].get(f"repo{i}", None)
+        if repo is None:
+            continue
+        repo_url = f"{requester.base_url}/repos/{repo['nameWithOwner']}"
+
+        labels = _make_labels(requester, repo_url, repo["labels"]["nodes"])
+        if repo["labels"]["pageInfo"]["hasNextPage"]:
+            labels.update(
+                _get_remaining_labels(requester, repo_url, full_name, repo["labels"]["pageInfo"]["endCursor"])
+            )
+
+        branches = {}
+        branch_objects = {}
+        for j, branch_name in enumerate(branch_names):
+            ref = repo.get(f"branch{j}", None)
+            if ref is None:
+                continue
+            rule = ref["branchProtectionRule"]
+            protection_url = f"{repo_url}/branches/{quote(branch_name)}/protection"
+            branches[branch_name] = (
+                BranchProtection(requester, {}, protection_attributes(rule, protection_url), completed=True)
+                if rule is not None
+                else None
+            )
+            # enough of the branch for apply to change its protection without fetching it
+            branch_objects[branch_name] = Branch(
+                requester,
+                {},
+                {"name": branch_name, "protected": rule is not None, "protection_url": protection_url},
+            )
+
+        states[full_name] = RepoState(
+            settings={setting_name: get(repo) for setting_name, get in SETTINGS_FIELDS.items()},
+            labels=labels,
+            branches=branches,
+            branch_objects=branch_objects,
+        )
+
+    return states
@@ -0,0 +1,176 @@
+import hmac
+import json
+import os
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import Any
+
+from github.Repository import Repository
+
+from repo_manager.schemas import RepoManagerConfig
+
+# Name of the incremental store's file in cache_dir
+INCREMENTAL_FILE = "incremental.json"
+# Bumped whenever what goes into a section's fingerprint changes, so old fingerprints never match
+INCREMENTAL_VERSION = 1
+# The config sections that are checked, and can be skipped, independently
+SECTIONS = ("settings", "secrets", "labels", "branch_protections", "files")
+
+
+def config_fingerprints(config: RepoManagerConfig, secret_key: str | None = None) -> dict[str, str]:
+    """Fingerprint each section of our config, to tell which sections changed since the last run
+
+    Files are fingerprinted with the blob sha of each local src_file, so editing a template changes the files
+    section. Secrets are only fingerprinted when secret_key is set, with an HMAC of their values, since a plain hash
+    of a short value can be brute forced. Without a key the secrets are always checked.
+
+    Returns:
+        Dict[str, str]: Section name -> fingerprint, for every section our config sets
+    """
+    fingerprints = {}
+    for section in SECTIONS:
+        value = getattr(config, section)
+        if value is None or (section == "secrets" and secret_key is None):
+            continue
+        if section == "settings":
+            dumped = value.model_dump(mode="json")
+        else:
+            dumped = [item.model_dump(mode="json") for item in value]
+        if section == "files":
+            for file_config, dumped_file in zip(value, dumped):
+                if file_config.exists and not file_config.remote_src and file_config.src_file_exists:
+                    dumped_file["src_file_sha"] = file_config.src_file_sha
+        elif section == "secrets":
+            for secret, dumped_secret in zip(value, dumped):
+                dumped_secret.pop("value", None)
+                if secret.exists:
+                    try:
+                        dumped_secret["expected_value"] = secret.expected_value
+                    except Exception:  # this should be tighter
+                        # a value that's missing now is checked, and reported, by the secrets check
+                        dumped_secret["expected_value"] = None
+        message = json.dumps([INCREMENTAL_VERSION, section, dumped], sort_keys=True).encode("utf-8")
+        if section == "secrets":
+            fingerprints[section] = hmac.new(secret_key.encode("utf-8"), message, sha256).hexdigest()
+        else:
+            fingerprints[section] = sha256(message).hexdigest()
+    return fingerprints
+
+
+def repo_markers(repo: Repository) -> dict[str, str | None]:
+    """When the repo was last changed and pushed to, which GitHub bumps when it changes the repo"""
+    return {
+        "updated_at": repo.updated_at.isoformat() if repo.updated_at is not None else None,
+        "pushed_at": repo.pushed_at.isoformat() if repo.pushed_at is not None else None,
+    }
+
+
+def clean(diff: Any) -> bool:
+    """If a check's diff found no drift. Diffs are lists and dicts of lists, which are all empty when nothing drifted"""
+    if diff is None:
+        return True
+    if isinstance(diff, dict):
+        return all(clean(value) for value in diff.values())
+    if isinstance(diff, list):
+        return len(diff) == 0
+    return False
+
+
+class IncrementalStore:
+    """The config fingerprints of the sections each repo last matched, to skip checks that can't have changed
+
+    Each repo's entry has the fingerprints of the config sections that last checked out clean, or were applied
+    without errors, along with the repo's updated_at and pushed_at at the time. A section whose fingerprint is the
+    same, on a repo whose markers haven't moved, still matches our config, and its api requests can be skipped.
+
+    The store is one json file, so it can be kept in cache_dir and saved and restored between runs with
+    actions/cache, like SecretFingerprints.
+    """
+
+    def __init__(self, path: str | Path, fingerprints: dict[str, str]):
+        self.path = Path(path)
+        self.fingerprints = fingerprints
+        self._lock = Lock()
+        try:
+            with open(self.path) as fh:
+                self.entries: dict[str, dict[str, Any]] = json.load(fh)
+        except (OSError, ValueError):
+            # a missing or corrupt store just means every repo is checked in full
+            self.entries = {}
+
+    def unchanged_sections(self, repo: Repository) -> list[str]:
+        """The sections of our config that still match the repo as of its last run
+
+        Secrets don't move the markers, so they are compared whether or not the markers have moved
+        """
+        with self._lock:
+            entry = self.entries.get(repo.full_name, None)
+        if entry is None:
+            return []
+        markers_moved = entry["markers"] != repo_markers(repo)
+        return [
+            section
+            for section, fingerprint in self.fingerprints.items()
+            if (section == "secrets" or not markers_moved)
+            and hmac.compare_digest(entry["sections"].get(section, ""), fingerprint)
+        ]
+
+    def config_for(self, repo: Repository, config: RepoManagerConfig) -> tuple[RepoManagerConfig, list[str]]:
+        """Our config, without the sections that are unchanged for this repo
+
+        Returns:
+            Tuple[RepoManagerConfig, List[str]]: The config to check and apply, and the sections left out of it
+        """
+        skipped = self.unchanged_sections(repo)
+        if len(skipped) == 0:
+            return config, skipped
+        copied = config.model_copy(update={section: None for section in skipped})
+        # model_copy copies the dict indexes the config already built too, which would still hold the skipped sections
+        for index in ("secrets_dict", "labels_dict", "branch_protections_dict"):
+            copied.__dict__.pop(index, None)
+        return copied, skipped
+
+    def record(self, repo: Repository, sections: list[str]):
+        """Remember that sections of our config match the repo
+
+        The markers are those of the repo object, as it was fetched before the checks, so a change made during the
+        run is never recorded as seen. The sections are added to those already recorded for the same markers, and
+        replace them otherwise
+        """
+        markers = repo_markers(repo)
+        recorded = {section: self.fingerprints[section] for section in sections if section in self.fingerprints}
+        with self._lock:
+            entry = self.entries.get(repo.full_name, None)
+            if entry is not None and entry["markers"] == markers:
+                recorded = {**entry["sections"], **recorded}
+            elif entry is not None and "secrets" in entry["sections"]:
+                # the secrets an apply set are carried over to the new markers, which don't track them
+                recorded = {"secrets": entry["sections"]["secrets"], **recorded}
+            self.entries[repo.full_name] = {"markers": markers, "sections": recorded}
+
+    def record_result(self, repo: Repository, diffs: dict[str, Any], applied: bool):
+        """Record the sections a run found clean. Every section is recorded after an apply without errors
+
+        The secrets check can only tell that secrets exist, not what they are set to, so secrets are only recorded
+        once an apply has set them
+        """
+        self.record(
+            repo,
+            [
+                section
+                for section in self.fingerprints
+                if applied or (section != "secrets" and clean(diffs.get(section, None)))
+            ],
+        )
+
+    def save(self):
+        """Write the store to its file"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            entries = dict(self.entries)
+        # write to a temp file and rename it into place, so a run that dies part way never leaves a partial store
+        with NamedTemporaryFile("w", dir=self.path.parent, delete=False, suffix=".tmp") as fh:
+            json.dump(entries, fh, sort_keys=True)
+        os.replace(fh.name, self.path)
@@ -1,29 +1,207 @@
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from typing import Any
+from urllib.parse import quote
 
+from actions_toolkit import core as actions_toolkit
+from github import GithubObject
+from github.Label import Label as GithubLabel
 from github.Repository import Repository
 
+from repo_manager.gh.plan import request_step
+from repo_manager.gh.state import RepoState
+from repo_manager.gh.tracing import bind_trace_context
 from repo_manager.schemas.label import Label
 
+# How many label create, edit and delete requests to have in flight at once for one repo
+LABEL_WORKERS = 8
 
-def update_label(repo: Repository, label: Label):
-    this_label = repo.get_label(label.name)
+
+def update_label(repo: Repository, label: Label, this_label: GithubLabel | None = None):
+    """Update a label to match our config, renaming it if new_name is set
+
+    this_label is the repo's label to update, if already fetched. Otherwise it is fetched by label.name
+    """
+    if this_label is None:
+        this_label = repo.get_label(label.name)
     color = this_label.color if label.color_no_hash is None else label.color_no_hash
-    description = this_label.description if label.description is None else label.description
+    # NotSet leaves the label's description as it is, where None would fail PyGithub's type check
+    description = GithubObject.NotSet if label.description is None else label.description
     this_label.edit(label.expected_name, color, description)
 
 
+def _run_all(tasks: list[tuple[Callable[[], str], dict[str, str]]], max_workers: int) -> list[dict]:
+    """Run tasks concurrently, logging the message each returns, and return the errors of any that raised
+
+    Each task is a function and the error dict to report, with its error message added, if it raises
+    """
+    errors = []
+    if len(tasks) == 0:
+        return errors
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(tasks)), thread_name_prefix="repo-manager-labels"
+    ) as executor:
+        futures = [(executor.submit(bind_trace_context(task)), error) for task, error in tasks]
+        # collected in submission order so the log reads the same as when labels were updated one by one
+        for future, error in futures:
+            try:
+                actions_toolkit.info(future.result())
+            except Exception as exc:  # this should be tighter
+                errors.append({**error, "error": f"{exc}"})
+    return errors
+
+
+def reconcile_labels(
+    repo: Repository,
+    config_labels: dict[str, Label],
+    labels_diff: dict[str, Any],
+    state: RepoState | None = None,
+    max_workers: int = LABEL_WORKERS,
+) -> list[dict]:
+    """Delete, create, rename and update a repo's labels to fix the diffs found by check_repo_labels
+
+    The label objects the check put in state are reused so no label is fetched again before it is edited or deleted.
+    If there are none, the repo's labels are listed once. Requests are sent up to max_workers at a time, with every
+    delete done before any create or rename, and those before any update, so a label can be deleted and its name
+    reused in one apply.
+
+    Args:
+        config_labels (Dict[str, Label]): Our config's labels, by expected name
+        labels_diff (Dict[str, Any]): The labels diff from check_repo_labels
+        state (Optional[RepoState]): The run's snapshot of the repo, from check_repo_labels
+
+    Returns:
+        List[Dict]: Errors from any label that could not be reconciled
+    """
+    if state is None or state.labels is None:
+        repo_labels = {label.name: label for label in repo.get_labels()}
+    else:
+        repo_labels = state.labels
+
+    def get_label(name: str) -> GithubLabel:
+        this_label = repo_labels.get(name, None)
+        return this_label if this_label is not None else repo.get_label(name)
+
+    def delete(label_name: str) -> str:
+        get_label(label_name).delete()
+        return f"Deleted {label_name}"
+
+    def rename(label_object: Label) -> str:
+        update_label(repo, label_object, get_label(label_object.name))
+        return f"Renamed {label_object.name} to {label_object.expected_name}"
+
+    def create(label_object: Label) -> str:
+        repo.create_label(label_object.expected_name, label_object.color_no_hash, label_object.description)
+        return f"Created label {label_object.expected_name}"
+
+    def update(label_object: Label) -> str:
+        update_label(repo, label_object, get_label(label_object.expected_name))
+        return f"Updated label {label_object.expected_name}"
+
+    errors = _run_all(
+        [
+            (lambda label_name=label_name: delete(label_name), {"type": "label-delete", "name": label_name})
+            for label_name in labels_diff["extra"]
+        ],
+        max_workers,
+    )
+    create_or_rename = []
+    for label_name in labels_diff["missing"]:
+        label_object = config_labels[label_name]
+        if label_object.name != label_object.expected_name:
+            create_or_rename.append(
+                (lambda label_object=label_object: rename(label_object), {"type": "label-update", "name": label_name})
+            )
+        else:
+            create_or_rename.append(
+                (lambda label_object=label_object: create(label_object), {"type": "label-create", "name": label_name})
+            )
+    errors += _run_all(create_or_rename, max_workers)
+    errors += _run_all(
+        [
+            (
+                lambda label_object=config_labels[label_name]: update(label_object),
+                {"type": "label-update", "name": label_name},
+            )
+            for label_name in labels_diff["diffs"].keys()
+        ],
+        max_workers,
+    )
+    return errors
+
+
+def plan_labels(
+    repo: Repository,
+    config_labels: dict[str, Label],
+    labels_diff: dict[str, Any],
+    state: RepoState | None = None,
+) -> list[dict[str, Any]]:
+    """The requests reconcile_labels would make, as plan steps, in the same order
+
+    Labels keep their color when our config doesn't set one, so it is read from the labels the check put in state
+    """
+    if state is None or state.labels is None:
+        repo_labels = {label.name: label for label in repo.get_labels()}
+    else:
+        repo_labels = state.labels
+
+    def label_url(name: str) -> str:
+        return f"{repo.url}/labels/{quote(name, safe='')}"
+
+    def edit(label_object: Label, current_name: str, description: str) -> dict[str, Any]:
+        this_label = repo_labels.get(current_name, None)
+        color = label_object.color_no_hash
+        if color is None:
+            color = this_label.color if this_label is not None else repo.get_label(current_name).color
+        patch = {"new_name": label_object.expected_name, "color": color}
+        if label_object.description is not None:
+            patch["description"] = label_object.description
+        return request_step("labels", description, "PATCH", label_url(current_name), input=patch)
+
+    steps = [
+        request_step("labels", f"Delete {label_name}", "DELETE", label_url(label_name))
+        for label_name in labels_diff["extra"]
+    ]
+    for label_name in labels_diff["missing"]:
+        label_object = config_labels[label_name]
+        if label_object.name != label_object.expected_name:
+            steps.append(
+                edit(label_object, label_object.name, f"Rename {label_object.name} to {label_object.expected_name}")
+            )
+        else:
+            new_label = {"name": label_object.expected_name}
+            if label_object.color_no_hash is not None:
+                new_label["color"] = label_object.color_no_hash
+            if label_object.description is not None:
+                new_label["description"] = label_object.description
+            steps.append(
+                request_step(
+                    "labels", f"Create label {label_object.expected_name}", "POST", f"{repo.url}/labels", new_label
+                )
+            )
+    for label_name in labels_diff["diffs"].keys():
+        steps.append(edit(config_labels[label_name], label_name, f"Update label {label_name}"))
+    return steps
+
+
 def check_repo_labels(
-    repo: Repository, config_labels: list[Label]
+    repo: Repository, config_labels: list[Label], state: RepoState | None = None
 ) -> tuple[bool, dict[str, list[str] | dict[str, Any]]]:
     """Checks a repo's labels vs our expected settings
 
     Args:
         repo (Repository): [description]
         secrets (List[Secret]): [description]
+        state (Optional[RepoState]): The run's snapshot of the repo. Its labels are used if already fetched, and
+            set if not
 
     """
-    repo_labels = {label.name: label for label in repo.get_labels()}
+    if state is None:
+        state = RepoState()
+    if state.labels is None:
+        state.labels = {label.name: label for label in repo.get_labels()}
+    repo_labels = state.labels
 
     missing_labels = []
     extra_labels = []
@@ -0,0 +1,141 @@
+import json
+import os
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any
+
+from github.GithubException import GithubException
+from github.Requester import Requester
+
+# Bumped whenever the shape of a plan changes, so apply-plan never runs a plan it would misread
+PLAN_VERSION = 1
+
+
+class PlanError(Exception): ...
+
+
+def request_step(
+    resource: str,
+    description: str,
+    method: str,
+    url: str,
+    input: dict[str, Any] | None = None,
+    headers: dict[str, str] | None = None,
+) -> dict[str, Any]:
+    """One api request of a plan, to make as it is"""
+    step = {"resource": resource, "description": description, "method": method, "url": url}
+    if input is not None:
+        step["input"] = input
+    if headers is not None:
+        step["headers"] = headers
+    return step
+
+
+def commit_step(
+    description: str,
+    repo_url: str,
+    branch: str,
+    parent: str,
+    base_tree: str,
+    message: str,
+    tree: list[dict[str, Any]],
+) -> dict[str, Any]:
+    """A commit of a plan, made with the Git Data api
+
+    The commit is made on top of parent, the head of branch when the plan was made, so if the branch has moved since,
+    updating it isn't a fast forward and is refused rather than overwriting the newer commits
+    """
+    return {
+        "resource": "files",
+        "description": description,
+        "commit": {
+            "url": repo_url,
+            "branch": branch,
+            "parent": parent,
+            "base_tree": base_tree,
+            "message": message,
+            "tree": tree,
+        },
+    }
+
+
+def already_done(step: dict[str, Any], exc: GithubException) -> bool:
+    """If a step that failed with exc has nothing left to do
+
+    A 404 on deleting a branch's protection means the branch isn't protected, like apply_repo treats it
+    """
+    return exc.status == 404 and step["resource"] == "branch_protections" and step["method"] == "DELETE"
+
+
+def run_step(requester: Requester, step: dict[str, Any], heads: dict[str, tuple[str, str]] | None = None) -> str | None:
+    """Make a step's requests
+
+    A plan can hold more than one commit to a branch, each made on top of the same head. heads tracks the commit and
+    tree each commit step makes by branch, so the next commit to that branch is made on top of it instead
+
+    Returns:
+        Optional[str]: The SHA of the commit made, for commit steps
+    """
+    if "commit" not in step:
+        try:
+            requester.requestJsonAndCheck(
+                step["method"], step["url"], input=step.get("input", None), headers=step.get("headers", None)
+            )
+        except GithubException as exc:
+            if not already_done(step, exc):
+                raise
+        return None
+
+    if heads is None:
+        heads = {}
+    commit = step["commit"]
+    parent, base_tree = heads.get(commit["branch"], (commit["parent"], commit["base_tree"]))
+    headers, tree = requester.requestJsonAndCheck(
+        "POST", f"{commit['url']}/git/trees", input={"base_tree": base_tree, "tree": commit["tree"]}
+    )
+    headers, new_commit = requester.requestJsonAndCheck(
+        "POST",
+        f"{commit['url']}/git/commits",
+        input={"message": commit["message"], "tree": tree["sha"], "parents": [parent]},
+    )
+    requester.requestJsonAndCheck(
+        "PATCH",
+        f"{commit['url']}/git/refs/heads/{commit['branch']}",
+        input={"sha": new_commit["sha"], "force": False},
+    )
+    heads[commit["branch"]] = (new_commit["sha"], tree["sha"])
+    return new_commit["sha"]
+
+
+def write_plan(path: str | Path, repo_steps: dict[str, list[dict[str, Any]]]):
+    """Write each repo's steps to a plan file"""
+    path = Path(path)
+    plan = {
+        "version": PLAN_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "repos": {repo_name: {"steps": steps} for repo_name, steps in sorted(repo_steps.items())},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temp file and rename it into place, so a run that dies part way never leaves a partial plan
+    with NamedTemporaryFile("w", dir=path.parent, delete=False, suffix=".tmp") as fh:
+        json.dump(plan, fh, indent=1)
+    os.replace(fh.name, path)
+
+
+def load_plan(path: str | Path) -> dict[str, list[dict[str, Any]]]:
+    """Read a plan file written by write_plan
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: Each repo's steps, keyed by the repo's full name
+    """
+    try:
+        with open(path) as fh:
+            plan = json.load(fh)
+    except ValueError as exc:
+        raise PlanError(f"{path} is not a plan file - {exc}")
+    if not isinstance(plan, dict) or plan.get("version", None) != PLAN_VERSION:
+        version = plan.get("version", None) if isinstance(plan, dict) else None
+        raise PlanError(f"{path} is a version {version} plan, only version {PLAN_VERSION} plans can be applied")
+    return {repo_name: repo_plan["steps"] for repo_name, repo_plan in plan["repos"].items()}
@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+from collections.abc import Callable
+from math import ceil
+from urllib.parse import urlparse
+
+from actions_toolkit import core as actions_toolkit
+from requests import PreparedRequest
+from requests import Response
+from requests.exceptions import ConnectionError
+from requests.exceptions import Timeout
+
+# Server errors worth retrying, only for requests that are safe to send twice
+RETRY_STATUSES = (500, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+# GitHub asks for at least a minute between retries after a secondary rate limit with no Retry-After
+SECONDARY_RATE_LIMIT_WAIT = 60.0
+
+
+def rate_limit_resource(request: PreparedRequest) -> str:
+    """Which of GitHub's rate limit buckets a request, from requests or httpx, counts against"""
+    path = urlparse(str(request.url)).path
+    if path.endswith("/graphql"):
+        return "graphql"
+    if "/search/" in path:
+        return "search"
+    return "core"
+
+
+class RequestScheduler:
+    """Transport middleware that schedules every GitHub api request against the rate limit
+
+    * Tracks the remaining budget of each rate limit bucket from the X-RateLimit-* headers of every response
+    * Shrinks how many requests can be in flight at once as the budget drains, and pauses every worker until the
+      reset once it is spent
+    * Waits out Retry-After and secondary rate limits, pausing every worker rather than just the one that hit it
+    * Retries server errors and dropped connections of idempotent requests with jittered exponential backoff
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        max_wait: float = 900.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # the longest we'll wait for a rate limit to reset, rather than failing the request
+        self.max_wait = max_wait
+        self.sleep = sleep
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        # wall clock time every worker waits until before sending another request
+        self._paused_until = 0.0
+        # resource -> (limit, remaining, reset)
+        self.budgets: dict[str, tuple[int, int, float]] = {}
+
+    def concurrency(self, resource: str = "core") -> int:
+        """How many requests can be in flight at once, scaled down as the budget for resource drains"""
+        budget = self.budgets.get(resource, None)
+        if budget is None or budget[0] <= 0:
+            return self.max_concurrency
+        limit, remaining, _ = budget
+        return max(self.min_concurrency, min(self.max_concurrency, ceil(self.max_concurrency * remaining / limit)))
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))  # nosec B311
+
+    def pause(self, seconds: float, reason: str):
+        """Stop every worker from sending requests for seconds"""
+        with self._condition:
+            until = time.time() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                actions_toolkit.warning(f"{reason}, pausing Github api requests for {seconds:.0f}s")
+
+    def paused_for(self) -> float:
+        """Seconds until requests can be sent again, or 0 if they aren't paused"""
+        with self._condition:
+            return max(0.0, self._paused_until - time.time())
+
+    def _acquire(self, resource: str):
+        with self._condition:
+            while True:
+                wait = self._paused_until - time.time()
+                if wait <= 0 and self._in_flight < self.concurrency(resource):
+                    break
+                self._condition.wait(timeout=wait if wait > 0 else None)
+            self._in_flight += 1
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def update_budget(self, resource: str, response: Response):
+        """Track the budget of resource left after response, from its X-RateLimit-* headers"""
+        headers = response.headers
+        try:
+            limit = int(headers["X-RateLimit-Limit"])
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset = float(headers["X-RateLimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        resource = headers.get("X-RateLimit-Resource", resource)
+        with self._condition:
+            self.budgets[resource] = (limit, remaining, reset)
+            self._condition.notify_all()
+
+        # Once the budget is spent, every request until the reset would just be rejected
+        wait = reset - time.time()
+        if remaining == 0 and 0 < wait <= self.max_wait:
+            self.pause(wait + 1, f"Github {resource} rate limit spent")
+
+    def retry_delay(self, request: PreparedRequest, response: Response, attempt: int) -> float | None:
+        """How long to wait before retrying a request, or None if it shouldn't be retried"""
+        if attempt >= self.max_retries:
+            return None
+
+        if response.status_code in (403, 429):
+            retry_after = response.headers.get("Retry-After", None)
+            if retry_after is not None:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    return SECONDARY_RATE_LIMIT_WAIT
+            if response.headers.get("X-RateLimit-Remaining", None) == "0":
+                try:
+                    wait = float(response.headers["X-RateLimit-Reset"]) - time.time() + 1
+                except (KeyError, ValueError):
+                    return None
+                return max(wait, 0) if wait <= self.max_wait else None
+            if "secondary rate limit" in response.text.lower():
+                return SECONDARY_RATE_LIMIT_WAIT * (attempt + 1)
+            # anything else is a real permissions error
+            return None
+
+        if response.status_code in RETRY_STATUSES and request.method in IDEMPOTENT_METHODS:
+            return self.backoff(attempt)
+        return None
+
+    def __call__(self, request: PreparedRequest, send: Callable[..., Response], **kwargs) -> Response:
+        resource = rate_limit_resource(request)
+        attempt = 0
+        while True:
+            self._acquire(resource)
+            try:
+                response = send(request, **kwargs)
+            except (ConnectionError, Timeout):
+                if attempt >= self.max_retries or request.method not in IDEMPOTENT_METHODS:
+                    raise
+                self.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            finally:
+                self._release()
+
+            self.update_budget(resource, response)
+            delay = self.retry_delay(request, response, attempt)
+            if delay is None:
+                return response
+            if response.status_code in (403, 429):
+                # a rate limit applies to every worker, not just this one
+                self.pause(delay, f"Github {resource} rate limited")
+            else:
+                self.sleep(delay)
+            attempt += 1
@@ -1,10 +1,25 @@
-from gh import Github
+import re
+from collections.abc import Iterator
+from fnmatch import fnmatchcase
+
+from actions_toolkit import core as actions_toolkit
+from github import Github
+from github.GithubException import UnknownObjectException
+from github.PaginatedList import PaginatedList
 from github.Repository import Repository
 
 
 class BadTokenError(Exception): ...
 
 
+GLOB_CHARS = ("*", "?", "[")
+VISIBILITIES = ("all", "public", "private", "internal")
+# The search api returns at most this many results for a query
+SEARCH_RESULT_LIMIT = 1000
+# The most the search api returns in a page
+SEARCH_PER_PAGE = 100
+
+
 def get_repo(client: Github, repo: str) -> tuple[bool, Repository | None]:
     """Gets a repo"""
     try:
@@ -13,3 +28,89 @@ def get_repo(client: Github, repo: str) -> tuple[bool, Repository | None]:
         raise BadTokenError(exc)
 
     return True, repo
+
+
+def get_owner_repos(client: Github, owner: str) -> Iterator[Repository]:
+    """Lists all of the repos of an owner, which can be either an organization or a user"""
+    try:
+        yield from client.get_organization(owner).get_repos()
+    except UnknownObjectException:
+        yield from client.get_user(owner).get_repos()
+
+
+def resolve_repos(client: Github, repos: list[str]) -> Iterator[Repository | str]:
+    """Resolves a list of repos in the style of 'owner/repo-name' into the repos to manage
+
+    A repo name can be a glob, like 'owner/*' or 'owner/service-*'. Globs are expanded by listing the owner's repos
+    and the matched Repository objects are returned. Plain repo names are returned as strings, so that they can be
+    fetched by whichever worker manages them.
+    """
+    seen = set()
+    for repo_name in repos:
+        owner, name = repo_name.split("/")
+        if not any(char in name for char in GLOB_CHARS):
+            if repo_name.lower() not in seen:
+                seen.add(repo_name.lower())
+                yield repo_name
+            continue
+
+        for repo in get_owner_repos(client, owner):
+            if fnmatchcase(repo.name, name) and repo.full_name.lower() not in seen:
+                seen.add(repo.full_name.lower())
+                yield repo
+
+
+def search_query(owner: str, topics: list[str] | None = None, visibility: str = "all", archived: bool = False) -> str:
+    """Build a repository search query for an owner's repos, filtered by topics, visibility and archived"""
+    # forks are left out of search results unless asked for, but the repos listing includes them
+    qualifiers = [f"user:{owner}", "fork:true"]
+    qualifiers += [f"topic:{topic}" for topic in topics or []]
+    if visibility != "all":
+        qualifiers.append(f"is:{visibility}")
+    if not archived:
+        qualifiers.append("archived:false")
+    return " ".join(qualifiers)
+
+
+def _matches(repo: Repository, topics: list[str] | None, visibility: str, archived: bool) -> bool:
+    """If a repo from the repos listing matches the filters search_query would apply"""
+    return (
+        set(topics or []) <= set(repo.topics or [])
+        and (visibility == "all" or repo.visibility == visibility)
+        and (archived or not repo.archived)
+    )
+
+
+def iter_org_repos(
+    client: Github,
+    owner: str,
+    topics: list[str] | None = None,
+    visibility: str = "all",
+    archived: bool = False,
+    name_regex: str | None = None,
+) -> Iterator[Repository]:
+    """Streams the repos of an organization, or user, that match the filters
+
+    topics, visibility and archived are filtered server side with the search api, a page of SEARCH_PER_PAGE repos at
+    a time, so repos that don't match are never listed. Repos must have every one of topics. The search api can't
+    match a regex, so name_regex is matched against each repo's name as it streams in.
+
+    The search api only returns the first SEARCH_RESULT_LIMIT results, so if more repos match than that, every repo
+    of the owner is listed and filtered here instead.
+    """
+    pattern = re.compile(name_regex) if name_regex is not None else None
+    parameters = {"q": search_query(owner, topics, visibility, archived), "per_page": SEARCH_PER_PAGE}
+    headers, data = client.requester.requestJsonAndCheck("GET", "/search/repositories", parameters=parameters)
+    if data["total_count"] > SEARCH_RESULT_LIMIT:
+        actions_toolkit.warning(
+            f"{data['total_count']} repos of {owner} match, more than the search api returns. Listing them all instead"
+        )
+        repos = (repo for repo in get_owner_repos(client, owner) if _matches(repo, topics, visibility, archived))
+    else:
+        # the first page is already fetched, the rest are fetched as they're iterated over
+        repos = PaginatedList(
+            Repository, client.requester, "/search/repositories", parameters, firstData=data, firstHeaders=headers
+        )
+    for repo in repos:
+        if pattern is None or pattern.search(repo.name) is not None:
+            yield repo
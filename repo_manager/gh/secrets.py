@@ -1,111 +1,572 @@
+import hmac
 import json
+import os
+import re
+import warnings
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
 from typing import Any
+from urllib.parse import quote
+from weakref import WeakKeyDictionary
 
+from actions_toolkit import core as actions_toolkit
 from github.PublicKey import PublicKey
 from github.Repository import Repository
+from github.Requester import Requester
 
+from repo_manager.gh.plan import request_step
+from repo_manager.gh.state import RepoState
+from repo_manager.gh.tracing import bind_trace_context
 from repo_manager.schemas.secret import Secret
+from repo_manager.schemas.secret import validate_secret_type
 
+# Secret types every repo has. Environments' secrets are only listed when our config has some
+DEFAULT_SECRET_TYPES = ("actions", "dependabot")
+# The most the api returns in a page of secrets
+SECRETS_PER_PAGE = 100
+# How many secret types, like deployment environments, to sync at the same time
+SECRET_WORKERS = 8
 
-def get_public_key(repo: Repository, is_dependabot: bool = False) -> PublicKey:
+# Name of the fingerprint store's file in cache_dir
+SECRET_FINGERPRINTS_FILE = "secret-fingerprints.json"
+
+# Public keys only change when GitHub rotates them, so we fetch each repo's key once per client. Keyed by the client's
+# requester, then (repo url, secret type), so the keys go when the client does and are never shared between tokens
+_PUBLIC_KEYS: WeakKeyDictionary[Requester, dict[tuple[str, str], PublicKey]] = WeakKeyDictionary()
+_PUBLIC_KEYS_LOCK = Lock()
+
+
+class SecretFingerprints:
+    """Fingerprints of the secret values we last set, to tell which secrets changed without reading them back
+
+    The api never returns a secret's value, so each value we set is fingerprinted with an HMAC keyed by a secret the
+    run supplies, and stored with the updated_at GitHub lists for the secret after we set it. A secret whose value
+    has the same fingerprint, and whose updated_at hasn't moved since, doesn't need to be set again.
+
+    The store is one json file, so it can be kept in cache_dir and saved and restored between runs with
+    actions/cache. Only the fingerprints are stored, never the key or the values.
+    """
+
+    def __init__(self, path: str | Path, key: str):
+        self.path = Path(path)
+        self._key = key.encode("utf-8")
+        self._lock = Lock()
+        try:
+            with open(self.path) as fh:
+                self.entries: dict[str, dict[str, str]] = json.load(fh)
+        except (OSError, ValueError):
+            # a missing or corrupt store just means every secret is set again
+            self.entries = {}
+
+    @staticmethod
+    def _entry_key(repo_name: str, secret_type: str, secret_name: str) -> str:
+        return f"{repo_name}/{secret_type}/{secret_name}"
+
+    def fingerprint(self, repo_name: str, secret_type: str, secret_name: str, value: str) -> str:
+        """HMAC of a secret's value. The secret's name is included, so two secrets with the same value don't match"""
+        message = "\0".join([repo_name, secret_type, secret_name, value]).encode("utf-8")
+        return hmac.new(self._key, message, sha256).hexdigest()
+
+    def unchanged(self, repo_name: str, secret_type: str, secret_name: str, value: str, updated_at: str | None) -> bool:
+        """If the secret still has the value we last set it to
+
+        updated_at is the secret's updated_at from the api, or None if the secret doesn't exist
+        """
+        entry = self.entries.get(self._entry_key(repo_name, secret_type, secret_name), None)
+        if entry is None or updated_at is None or entry["updated_at"] != updated_at:
+            return False
+        return hmac.compare_digest(entry["fingerprint"], self.fingerprint(repo_name, secret_type, secret_name, value))
+
+    def record(self, repo_name: str, secret_type: str, secret_name: str, value: str, updated_at: str):
+        """Remember the value a secret was set to, and the secret's updated_at after setting it"""
+        self.record_fingerprint(
+            repo_name,
+            secret_type,
+            secret_name,
+            self.fingerprint(repo_name, secret_type, secret_name, value),
+            updated_at,
+        )
+
+    def record_fingerprint(self, repo_name: str, secret_type: str, secret_name: str, fingerprint: str, updated_at: str):
+        """Remember the fingerprint of the value a secret was set to, like record, for a value only a plan has"""
+        with self._lock:
+            self.entries[self._entry_key(repo_name, secret_type, secret_name)] = {
+                "fingerprint": fingerprint,
+                "updated_at": updated_at,
+            }
+
+    def forget(self, repo_name: str, secret_type: str, secret_name: str):
+        with self._lock:
+            self.entries.pop(self._entry_key(repo_name, secret_type, secret_name), None)
+
+    def save(self):
+        """Write the store to its file"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            entries = dict(self.entries)
+        # write to a temp file and rename it into place, so a run that dies part way never leaves a partial store
+        with NamedTemporaryFile("w", dir=self.path.parent, delete=False, suffix=".tmp") as fh:
+            json.dump(entries, fh, sort_keys=True)
+        os.replace(fh.name, self.path)
+
+
+def secrets_url(repo_url: str, secret_type: str) -> str:
+    """The url of a secret type's secrets. An environment's name is quoted, as it can have characters like spaces"""
+    if secret_type.startswith("environments/"):
+        secret_type = f"environments/{quote(secret_type.removeprefix('environments/'), safe='')}"
+    return f"{repo_url}/{secret_type}/secrets"
+
+
+def public_keys(requester: Requester) -> dict[tuple[str, str], PublicKey]:
+    """The public keys fetched with requester's client, by (repo url, secret type)"""
+    with _PUBLIC_KEYS_LOCK:
+        return _PUBLIC_KEYS.setdefault(requester, {})
+
+
+def check_secret_type(secret_type: str | bool) -> str:
+    """Checks secret_type is actions, dependabot, or environments/<name>
+
+    These functions took is_dependabot, a bool, where they now take secret_type. A bool is still taken, with a
+    DeprecationWarning, as dependabot for True and actions for False
     """
-    :calls: `GET /repos/{owner}/{repo}/actions/secrets/public-key
+    if isinstance(secret_type, bool):
+        warnings.warn(
+            "is_dependabot is deprecated, pass secret_type as actions or dependabot instead",
+            DeprecationWarning,
+            stacklevel=3,
+        )
+        return "dependabot" if secret_type else "actions"
+    return validate_secret_type(secret_type)
+
+
+def get_public_key(repo: Repository, secret_type: str = "actions") -> PublicKey:
+    """
+    :calls: `GET /repos/{owner}/{repo}/{secret_type}/secrets/public-key
     <https://docs.github.com/en/rest/reference/actions#get-a-repository-public-key>`_
     :rtype: :class:`github.PublicKey.PublicKey`
+
+    Public keys are cached per client, repo and secret type, so each environment's key is fetched once, for the rest
+    of the run
     """
-    secret_type = "actions" if not is_dependabot else "dependabot"
-    headers, data = repo._requester.requestJsonAndCheck("GET", f"{repo.url}/{secret_type}/secrets/public-key")
-    return PublicKey(repo._requester, headers, data, completed=True)
+    secret_type = check_secret_type(secret_type)
+    cache = public_keys(repo._requester)
+    cache_key = (repo.url, secret_type)
+    public_key = cache.get(cache_key, None)
+    if public_key is None:
+        headers, data = repo._requester.requestJsonAndCheck("GET", f"{secrets_url(repo.url, secret_type)}/public-key")
+        public_key = cache.setdefault(cache_key, PublicKey(repo._requester, headers, data, completed=True))
+    return public_key
+
 
+def encrypt_secrets(
+    repo: Repository, unencrypted_values: dict[str, str], secret_type: str = "actions"
+) -> dict[str, dict[str, str]]:
+    """Encrypt a batch of secrets with the repo's public key
 
-def create_secret(repo: Repository, secret_name: str, unencrypted_value: str, is_dependabot: bool = False) -> bool:
+    :param unencrypted_values: dict of secret name to unencrypted value
+    :rtype: dict of secret name to the parameters to PUT for that secret
     """
-    :calls: `PUT /repos/{owner}/{repo}/actions/secrets/{secret_name}
-    <https://docs.github.com/en/rest/reference/actions#get-a-repository-secret>`_
+    public_key = get_public_key(repo, secret_type)
+    return {
+        secret_name: {
+            "key_id": public_key.key_id,
+            "encrypted_value": public_key.encrypt(unencrypted_value),
+        }
+        for secret_name, unencrypted_value in unencrypted_values.items()
+    }
 
-    Copied from https://github.com/PyGithub/PyGithub/blob/master/github/Repository.py#L1428 in order to
-    support dependabot
+
+def put_secret(
+    repo: Repository, secret_name: str, put_parameters: dict[str, str], secret_type: str = "actions"
+) -> bool:
+    """
+    :calls: `PUT /repos/{owner}/{repo}/{secret_type}/secrets/{secret_name}
+    <https://docs.github.com/en/rest/reference/actions#create-or-update-a-repository-secret>`_
     :param secret_name: string
-    :param unencrypted_value: string
+    :param put_parameters: dict, from encrypt_secrets
     :rtype: bool
     """
-    public_key = get_public_key(repo, is_dependabot)
-    payload = public_key.encrypt(unencrypted_value)
-    put_parameters = {
-        "key_id": public_key.key_id,
-        "encrypted_value": payload,
-    }
-    secret_type = "actions" if not is_dependabot else "dependabot"
     status, headers, data = repo._requester.requestJson(
-        "PUT", f"{repo.url}/{secret_type}/secrets/{secret_name}", input=put_parameters
+        "PUT", f"{secrets_url(repo.url, secret_type)}/{secret_name}", input=put_parameters
     )
     if status not in (201, 204):
         raise Exception(f"Unable to create {secret_type} secret. Status code: {status}")
     return True
 
 
-def delete_secret(repo: Repository, secret_name: str, is_dependabot: bool = False) -> bool:
+def create_secret(repo: Repository, secret_name: str, unencrypted_value: str, secret_type: str = "actions") -> bool:
+    """
+    :calls: `PUT /repos/{owner}/{repo}/{secret_type}/secrets/{secret_name}
+    <https://docs.github.com/en/rest/reference/actions#get-a-repository-secret>`_
+
+    Copied from https://github.com/PyGithub/PyGithub/blob/master/github/Repository.py#L1428 in order to
+    support dependabot and environments
+    :param secret_name: string
+    :param unencrypted_value: string
+    :param secret_type: actions, dependabot, or environments/<name>. Raises ValueError otherwise
+    :rtype: bool
+    """
+    secret_type = check_secret_type(secret_type)
+    put_parameters = encrypt_secrets(repo, {secret_name: unencrypted_value}, secret_type)[secret_name]
+    return put_secret(repo, secret_name, put_parameters, secret_type)
+
+
+def delete_secret(repo: Repository, secret_name: str, secret_type: str = "actions") -> bool:
     """
     Copied from https://github.com/PyGithub/PyGithub/blob/master/github/Repository.py#L1448
-    to add support for dependabot
-    :calls: `DELETE /repos/{owner}/{repo}/actions/secrets/{secret_name}
+    to add support for dependabot and environments
+    :calls: `DELETE /repos/{owner}/{repo}/{secret_type}/secrets/{secret_name}
         <https://docs.github.com/en/rest/reference/actions#delete-a-repository-secret>`_
     :param secret_name: string
+    :param secret_type: actions, dependabot, or environments/<name>. Raises ValueError otherwise
     :rtype: bool
     """
-    secret_type = "actions" if not is_dependabot else "dependabot"
-    status, headers, data = repo._requester.requestJson("DELETE", f"{repo.url}/{secret_type}/secrets/{secret_name}")
+    secret_type = check_secret_type(secret_type)
+    status, headers, data = repo._requester.requestJson("DELETE", f"{secrets_url(repo.url, secret_type)}/{secret_name}")
     return status == 204
 
 
-def check_repo_secrets(repo: Repository, secrets: list[Secret]) -> tuple[bool, dict[str, list[str] | dict[str, Any]]]:
+def _sync_secret_type(
+    repo: Repository,
+    secret_type: str,
+    unencrypted_values: dict[str, str],
+    to_delete: list[str],
+    state: RepoState,
+    fingerprints: SecretFingerprints | None,
+) -> tuple[list[str], list[dict]]:
+    """Sync one type of secret, returning the messages to log and any errors"""
+    messages = []
+    errors = []
+    for secret_name in to_delete:
+        try:
+            delete_secret(repo, secret_name, secret_type)
+            messages.append(f"Deleted {secret_name}")
+            if fingerprints is not None:
+                fingerprints.forget(repo.full_name, secret_type, secret_name)
+        except Exception as exc:  # this should be tighter
+            errors.append({"type": "secret-delete", "key": secret_name, "error": f"{exc}"})
+
+    if fingerprints is not None:
+        updated_at = (state.secrets or {}).get(secret_type, {})
+        unchanged = [
+            secret_name
+            for secret_name, value in unencrypted_values.items()
+            if fingerprints.unchanged(repo.full_name, secret_type, secret_name, value, updated_at.get(secret_name))
+        ]
+        unencrypted_values = {
+            secret_name: value for secret_name, value in unencrypted_values.items() if secret_name not in unchanged
+        }
+        if len(unchanged) > 0:
+            messages.append(f"{len(unchanged)} {secret_type} secrets already set to expected value")
+    if len(unencrypted_values) == 0:
+        return messages, errors
+
+    try:
+        payloads = encrypt_secrets(repo, unencrypted_values, secret_type)
+    except Exception as exc:  # this should be tighter
+        errors.extend(
+            {"type": "secret-update", "key": secret_name, "error": f"{exc}"} for secret_name in unencrypted_values
+        )
+        return messages, errors
+    set_names = []
+    for secret_name, payload in payloads.items():
+        try:
+            put_secret(repo, secret_name, payload, secret_type)
+            messages.append(f"Set {secret_name} to expected value")
+            set_names.append(secret_name)
+        except Exception as exc:  # this should be tighter
+            errors.append({"type": "secret-update", "key": secret_name, "error": f"{exc}"})
+
+    if fingerprints is not None and len(set_names) > 0:
+        try:
+            record_secret_fingerprints(
+                repo,
+                fingerprints,
+                secret_type,
+                {secret_name: unencrypted_values[secret_name] for secret_name in set_names},
+            )
+        except Exception as exc:  # this should be tighter
+            actions_toolkit.warning(f"Unable to record fingerprints of {secret_type} secrets: {exc}")
+    return messages, errors
+
+
+def sync_secrets(
+    repo: Repository,
+    secrets: list[Secret],
+    state: RepoState | None = None,
+    fingerprints: SecretFingerprints | None = None,
+    max_workers: int = SECRET_WORKERS,
+) -> list[dict]:
+    """Set and delete a repo's secrets to match our config
+
+    Secrets are grouped by type, so each type's public key is fetched once and all its values are encrypted in one
+    batch. The types, like each deployment environment, are synced concurrently. If fingerprints is set, secrets it
+    shows already have their expected value are skipped, and the secrets that are set are recorded in it
+
+    Returns:
+        List[Dict]: Errors setting or deleting secrets
+    """
+    if state is None:
+        state = RepoState()
+    errors = []
+    # secret type -> values to set, and names to delete
+    to_set = {}
+    to_delete = {}
+    for secret in secrets:
+        if secret.exists:
+            try:
+                to_set.setdefault(secret.type, {})[secret.key] = secret.expected_value
+            except Exception as exc:  # this should be tighter
+                errors.append({"type": "secret-update", "key": secret.key, "error": f"{exc}"})
+        else:
+            to_delete.setdefault(secret.type, []).append(secret.key)
+
+    secret_types = list(dict.fromkeys(list(to_delete) + list(to_set)))
+    if len(secret_types) == 0:
+        return errors
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(secret_types)), thread_name_prefix="repo-manager-secrets"
+    ) as executor:
+        futures = [
+            executor.submit(
+                bind_trace_context(_sync_secret_type),
+                repo,
+                secret_type,
+                to_set.get(secret_type, {}),
+                to_delete.get(secret_type, []),
+                state,
+                fingerprints,
+            )
+            for secret_type in secret_types
+        ]
+        # collected in submission order so the log reads the same as when secrets were set one by one
+        for future in futures:
+            messages, type_errors = future.result()
+            for message in messages:
+                actions_toolkit.info(message)
+            errors += type_errors
+    return errors
+
+
+def _plan_secret_type(
+    repo: Repository,
+    secret_type: str,
+    unencrypted_values: dict[str, str],
+    to_delete: list[str],
+    state: RepoState,
+    fingerprints: SecretFingerprints | None,
+) -> list[dict[str, Any]]:
+    """The requests _sync_secret_type would make for one type of secret, as plan steps"""
+    steps = [
+        request_step(
+            "secrets",
+            f"Delete {secret_type} secret {secret_name}",
+            "DELETE",
+            f"{secrets_url(repo.url, secret_type)}/{secret_name}",
+        )
+        for secret_name in to_delete
+    ]
+    if fingerprints is not None:
+        updated_at = (state.secrets or {}).get(secret_type, {})
+        unencrypted_values = {
+            secret_name: value
+            for secret_name, value in unencrypted_values.items()
+            if not fingerprints.unchanged(repo.full_name, secret_type, secret_name, value, updated_at.get(secret_name))
+        }
+    if len(unencrypted_values) == 0:
+        return steps
+
+    for secret_name, payload in encrypt_secrets(repo, unencrypted_values, secret_type).items():
+        step = request_step(
+            "secrets",
+            f"Set {secret_type} secret {secret_name}",
+            "PUT",
+            f"{secrets_url(repo.url, secret_type)}/{secret_name}",
+            input=payload,
+        )
+        if fingerprints is not None:
+            step["secret"] = {
+                "repo": repo.full_name,
+                "repo_url": repo.url,
+                "type": secret_type,
+                "name": secret_name,
+                "fingerprint": fingerprints.fingerprint(
+                    repo.full_name, secret_type, secret_name, unencrypted_values[secret_name]
+                ),
+            }
+        steps.append(step)
+    return steps
+
+
+def plan_secrets(
+    repo: Repository,
+    secrets: list[Secret],
+    state: RepoState | None = None,
+    fingerprints: SecretFingerprints | None = None,
+    max_workers: int = SECRET_WORKERS,
+) -> tuple[list[dict[str, Any]], list[dict]]:
+    """The requests sync_secrets would make, as plan steps
+
+    The values are encrypted with the repo's public key as the plan is made, so the plan never holds a secret in the
+    clear, and only GitHub can read them. If fingerprints is set, secrets it shows already have their expected value
+    are left out, and the fingerprint of each value the plan sets is kept in its step, to record once it's applied
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[Dict]]: The steps, and errors for secrets that can't be planned
+    """
+    if state is None:
+        state = RepoState()
+    errors = []
+    to_set = {}
+    to_delete = {}
+    for secret in secrets:
+        if secret.exists:
+            try:
+                to_set.setdefault(secret.type, {})[secret.key] = secret.expected_value
+            except Exception as exc:  # this should be tighter
+                errors.append({"type": "secret-update", "key": secret.key, "error": f"{exc}"})
+        else:
+            to_delete.setdefault(secret.type, []).append(secret.key)
+
+    steps = []
+    secret_types = list(dict.fromkeys(list(to_delete) + list(to_set)))
+    if len(secret_types) == 0:
+        return steps, errors
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(secret_types)), thread_name_prefix="repo-manager-secrets"
+    ) as executor:
+        futures = {
+            secret_type: executor.submit(
+                bind_trace_context(_plan_secret_type),
+                repo,
+                secret_type,
+                to_set.get(secret_type, {}),
+                to_delete.get(secret_type, []),
+                state,
+                fingerprints,
+            )
+            for secret_type in secret_types
+        }
+        for secret_type, future in futures.items():
+            try:
+                steps += future.result()
+            except Exception as exc:  # this should be tighter
+                errors.extend(
+                    {"type": "secret-update", "key": secret_name, "error": f"{exc}"}
+                    for secret_name in to_set.get(secret_type, {})
+                )
+    return steps, errors
+
+
+def record_planned_fingerprints(requester: Requester, fingerprints: SecretFingerprints, steps: list[dict[str, Any]]):
+    """Record the fingerprints of the secrets a plan's steps set, with the updated_at the api now lists for each"""
+    planned = {}
+    for step in steps:
+        if "secret" in step:
+            planned.setdefault((step["secret"]["repo_url"], step["secret"]["type"]), []).append(step["secret"])
+    for (repo_url, secret_type), planned_secrets in planned.items():
+        updated_at = dict(_iter_secrets(requester, secrets_url(repo_url, secret_type)))
+        for secret in planned_secrets:
+            if updated_at.get(secret["name"], None) is not None:
+                fingerprints.record_fingerprint(
+                    secret["repo"], secret_type, secret["name"], secret["fingerprint"], updated_at[secret["name"]]
+                )
+
+
+def record_secret_fingerprints(
+    repo: Repository, fingerprints: SecretFingerprints, secret_type: str, values: dict[str, str]
+):
+    """Record the values secrets were just set to, with the updated_at the api now lists for each"""
+    updated_at = dict(iter_repo_secrets(repo, secret_type))
+    for secret_name, value in values.items():
+        if updated_at.get(secret_name, None) is not None:
+            fingerprints.record(repo.full_name, secret_type, secret_name, value, updated_at[secret_name])
+
+
+def check_repo_secrets(
+    repo: Repository, secrets: list[Secret], state: RepoState | None = None
+) -> tuple[bool, dict[str, list[str] | dict[str, Any]]]:
     """Checks a repo's secrets vs our expected settings
 
+    The actions and dependabot secrets, and those of any environment in secrets, are listed concurrently
+
     Args:
         repo (Repository): [description]
         secrets (List[Secret]): [description]
+        state (Optional[RepoState]): The run's snapshot of the repo. Secret types already listed in it aren't listed
+            again, and the secrets this lists are added to it
 
     Returns:
         Tuple[bool, Optional[List[str]]]: [description]
     """
-    actions_secrets_names = _get_repo_secret_names(repo)
-    dependabot_secret_names = _get_repo_secret_names(repo, "dependabot")
-    secrets_dict = {secret.key: secret for secret in secrets}
+    if state is None:
+        state = RepoState()
+    secret_types = list(DEFAULT_SECRET_TYPES) + sorted({secret.type for secret in secrets} - set(DEFAULT_SECRET_TYPES))
+    listed = state.secrets if state.secrets is not None else {}
+    state.secrets = {
+        **listed,
+        **get_repo_secrets(repo, [secret_type for secret_type in secret_types if secret_type not in listed]),
+    }
     checked = True
 
-    actions_expected_secrets_names = {secret.key for secret in secrets if (secret.exists and secret.type == "actions")}
-    dependabot_expected_secret_names = {
-        secret.key for secret in secrets if (secret.exists and secret.type == "dependabot")
-    }
-    diff = {
-        "missing": list(actions_expected_secrets_names - (actions_secrets_names))
-        + list((dependabot_expected_secret_names) - (dependabot_secret_names)),
-        "extra": [],
-    }
-    extra_secret_names = (list((actions_secrets_names) - (actions_expected_secrets_names))) + (
-        list(dependabot_secret_names - dependabot_expected_secret_names)
-    )
-    for secret_name in extra_secret_names:
-        secret_config = secrets_dict.get(secret_name, None)
-        if secret_config is None:
-            continue
-        if not secret_config.exists:
-            diff["extra"].append(secret_name)
-            checked = False
-
-    if len(diff["missing"]) > 0:
+    diff = {"missing": [], "extra": []}
+    for secret_type in secret_types:
+        repo_secret_names = set(state.secrets[secret_type])
+        expected_secret_names = {secret.key for secret in secrets if (secret.exists and secret.type == secret_type)}
+        diff["missing"] += list(expected_secret_names - repo_secret_names)
+        diff["extra"] += [
+            secret.key
+            for secret in secrets
+            if not secret.exists and secret.type == secret_type and secret.key in repo_secret_names
+        ]
+
+    if len(diff["missing"]) > 0 or len(diff["extra"]) > 0:
         checked = False
 
     return checked, diff
 
 
-def _get_repo_secret_names(repo: Repository, type: str = "actions") -> set[str]:
-    status, headers, raw_data = repo._requester.requestJson("GET", f"{repo.url}/{type}/secrets")
-    if status != 200:
-        raise Exception(f"Unable to get repo's secrets {status}")
-    try:
-        secret_data = json.loads(raw_data)
-    except json.JSONDecodeError as exc:
-        raise Exception(f"Github apu returned invalid json {exc}")
+def iter_repo_secrets(repo: Repository, type: str = "actions") -> Iterator[tuple[str, str | None]]:
+    """
+    :calls: `GET /repos/{owner}/{repo}/{type}/secrets
+    <https://docs.github.com/en/rest/actions/secrets#list-repository-secrets>`_
+
+    Streams a repo's secrets of one type, a page of SECRETS_PER_PAGE at a time, following the Link header to the next
+    page. type is actions, dependabot, or an environment's path, like environments/production
+
+    Yields each secret's name, and when it was last updated
+    """
+    return _iter_secrets(repo._requester, secrets_url(repo.url, type))
+
 
-    return {secret["name"] for secret in secret_data["secrets"]}
+def _iter_secrets(requester: Requester, url: str) -> Iterator[tuple[str, str | None]]:
+    parameters = {"per_page": SECRETS_PER_PAGE}
+    while url is not None:
+        headers, data = requester.requestJsonAndCheck("GET", url, parameters=parameters)
+        for secret in data["secrets"]:
+            yield secret["name"], secret.get("updated_at", None)
+        # the next page's url already has the parameters
+        next_page = re.search(r'<([^>]+)>;\s*rel="next"', headers.get("link", ""))
+        url, parameters = (next_page.group(1), None) if next_page is not None else (None, None)
+
+
+def get_repo_secrets(repo: Repository, secret_types: list[str]) -> dict[str, dict[str, str | None]]:
+    """List a repo's secrets of several types at the same time
+
+    Returns:
+        Dict[str, Dict[str, Optional[str]]]: Secret type -> secret name -> when the secret was last updated
+    """
+    if len(secret_types) == 0:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(secret_types), thread_name_prefix="repo-manager-secrets") as executor:
+        futures = {
+            secret_type: executor.submit(
+                bind_trace_context(lambda secret_type=secret_type: dict(iter_repo_secrets(repo, secret_type)))
+            )
+            for secret_type in secret_types
+        }
+        return {secret_type: future.result() for secret_type, future in futures.items()}
@@ -1,65 +1,153 @@
 from typing import Any
 
+from github.GithubException import UnknownObjectException
 from github.Repository import Repository
 
+from repo_manager.gh.plan import request_step
+from repo_manager.gh.state import RepoState
 from repo_manager.schemas.settings import Settings
-from repo_manager.utils import attr_to_kwarg
-
-
-def update_settings(repo: Repository, settings: Settings):
-    kwargs = {"name": None}
-
-    attr_to_kwarg("description", settings, kwargs)
-    attr_to_kwarg("homepage", settings, kwargs)
-    attr_to_kwarg("private", settings, kwargs)
-    attr_to_kwarg("has_issues", settings, kwargs)
-    attr_to_kwarg("has_projects", settings, kwargs)
-    attr_to_kwarg("has_wiki", settings, kwargs)
-    attr_to_kwarg("has_downloads", settings, kwargs)
-    attr_to_kwarg("default_branch", settings, kwargs)
-    attr_to_kwarg("allow_squash_merge", settings, kwargs)
-    attr_to_kwarg("allow_merge_commit", settings, kwargs)
-    attr_to_kwarg("allow_rebase_merge", settings, kwargs)
-    attr_to_kwarg("delete_branch_on_merge", settings, kwargs)
-    repo.edit(**kwargs)
-
-    if settings.enable_automated_security_fixes is not None:
-        if settings.enable_automated_security_fixes:
+
+# Settings that are changed by toggling them on or off with their own endpoints, rather than by editing the repo
+TOGGLE_SETTINGS = ("enable_automated_security_fixes", "enable_vulnerability_alerts")
+
+
+def automated_security_fixes_enabled(repo: Repository) -> bool:
+    """If Dependabot security updates are on. GitHub answers with a 404 when they're off"""
+    try:
+        return repo.get_automated_security_fixes()["enabled"]
+    except UnknownObjectException:
+        return False
+
+
+def settings_patch(repo: Repository, settings: Settings, state: RepoState | None = None) -> dict[str, Any]:
+    """The configured settings whose value differs from the repo's, as found by check_repo_settings
+
+    Settings missing from state are included, except for the security toggles, which are read first since reading
+    them is cheaper than writing them. Topics are compared ignoring order, GitHub keeps them in its own order
+    """
+    repo_settings = state.settings if state is not None and state.settings is not None else {}
+    patch = {}
+    for setting_name, settings_value in settings.dict().items():
+        if settings_value is None:
+            continue
+        if setting_name not in repo_settings and setting_name in TOGGLE_SETTINGS:
+            repo_settings[setting_name] = SETTINGS[setting_name]["read"](repo)
+        if setting_name not in repo_settings:
+            patch[setting_name] = settings_value
+            continue
+        repo_value = repo_settings[setting_name]
+        if setting_name == "topics":
+            settings_value = [settings_value] if isinstance(settings_value, str) else settings_value
+            if sorted(repo_value or []) == sorted(settings_value):
+                continue
+        elif repo_value == settings_value:
+            continue
+        patch[setting_name] = settings_value
+    return patch
+
+
+def update_settings(repo: Repository, settings: Settings, state: RepoState | None = None) -> dict[str, Any]:
+    """Update only the repo's settings that differ from our config, skipping every request if none do
+
+    :calls: `PATCH /repos/{owner}/{repo} <https://docs.github.com/en/rest/repos/repos#update-a-repository>`_
+
+    The repo is edited with a PATCH of just the changed fields rather than Repository.edit, which sends every
+    argument it's given and no longer takes has_downloads
+
+    Returns:
+        Dict[str, Any]: The settings that were changed, and their new values
+    """
+    patch = settings_patch(repo, settings, state)
+
+    edit = {
+        setting_name: value
+        for setting_name, value in patch.items()
+        if setting_name not in TOGGLE_SETTINGS and setting_name != "topics"
+    }
+    if len(edit) > 0:
+        headers, data = repo._requester.requestJsonAndCheck("PATCH", repo.url, input=edit)
+        repo._useAttributes(data)
+
+    if "enable_automated_security_fixes" in patch:
+        if patch["enable_automated_security_fixes"]:
             repo.enable_automated_security_fixes()
         else:
             repo.disable_automated_security_fixes()
 
-    if settings.enable_vulnerability_alerts is not None:
-        if settings.enable_vulnerability_alerts:
+    if "enable_vulnerability_alerts" in patch:
+        if patch["enable_vulnerability_alerts"]:
             repo.enable_vulnerability_alert()
         else:
             repo.disable_vulnerability_alert()
 
-    if settings.topics is not None:
-        repo.replace_topics(settings.topics)
-
-
-def check_repo_settings(repo: Repository, settings: Settings) -> tuple[bool, list[str | None]]:
+    if "topics" in patch:
+        repo.replace_topics(patch["topics"])
+
+    if state is not None and state.settings is not None:
+        state.settings.update(patch)
+    return patch
+
+
+def plan_settings(repo: Repository, settings: Settings, state: RepoState | None = None) -> list[dict[str, Any]]:
+    """The requests update_settings would make, as plan steps"""
+    patch = settings_patch(repo, settings, state)
+    steps = []
+    edit = {
+        setting_name: value
+        for setting_name, value in patch.items()
+        if setting_name not in TOGGLE_SETTINGS and setting_name != "topics"
+    }
+    if len(edit) > 0:
+        steps.append(request_step("settings", f"Update {', '.join(edit.keys())}", "PATCH", repo.url, input=edit))
+    for setting_name, path in (
+        ("enable_automated_security_fixes", "automated-security-fixes"),
+        ("enable_vulnerability_alerts", "vulnerability-alerts"),
+    ):
+        if setting_name in patch:
+            steps.append(
+                request_step(
+                    "settings",
+                    f"{'Enable' if patch[setting_name] else 'Disable'} {path.replace('-', ' ')}",
+                    "PUT" if patch[setting_name] else "DELETE",
+                    f"{repo.url}/{path}",
+                )
+            )
+    if "topics" in patch:
+        steps.append(
+            request_step("settings", "Replace topics", "PUT", f"{repo.url}/topics", input={"names": patch["topics"]})
+        )
+    return steps
+
+
+def check_repo_settings(
+    repo: Repository, settings: Settings, state: RepoState | None = None
+) -> tuple[bool, list[str | None]]:
     """Checks a repo's settings vs our expected settings
 
     Args:
         repo (Repository): [description]
         settings (Settings): [description]
+        state (Optional[RepoState]): The run's snapshot of the repo. Settings already in it aren't read again, and
+            the settings read from the repo are added to it
 
     Returns:
         Tuple[bool, Optional[List[str]]]: [description]
     """
+    if state is None:
+        state = RepoState()
+    if state.settings is None:
+        state.settings = {}
 
     def get_repo_value(setting_name: str, repo: Repository) -> Any | None:
-        """Get a value from the repo object"""
+        """Get a value from the snapshot, or the repo object"""
+        if setting_name in state.settings:
+            return state.settings[setting_name]
         getter_val = SETTINGS[setting_name].get("get", setting_name)
         if getter_val is None:
             return None
         getter = getattr(repo, getter_val)
-        if not callable(getter):
-            return getter
-        else:
-            return getter()
+        state.settings[setting_name] = getter() if callable(getter) else getter
+        return state.settings[setting_name]
 
     drift = []
     checked = True
@@ -149,6 +237,15 @@ SETTINGS = {
     "delete_branch_on_merge": {"set": ""},
     # Checks set to none are for values that there are no api endpoints to get
     # Like the security and vulnerability alerts
-    "enable_automated_security_fixes": {"get": None, "set": set_security_fixes},
-    "enable_vulnerability_alerts": {"get": None, "set": set_vuln_alerts},
+    # They are read by update_settings, only when configured, to skip toggling them if they're already set
+    "enable_automated_security_fixes": {
+        "get": None,
+        "set": set_security_fixes,
+        "read": lambda repo: automated_security_fixes_enabled(repo),
+    },
+    "enable_vulnerability_alerts": {
+        "get": None,
+        "set": set_vuln_alerts,
+        "read": lambda repo: repo.get_vulnerability_alert(),
+    },
 }
@@ -0,0 +1,39 @@
+from dataclasses import dataclass
+from typing import Any
+
+from github.Branch import Branch
+from github.BranchProtection import BranchProtection
+from github.GitTree import GitTree
+from github.Label import Label
+from github.Repository import Repository
+
+
+@dataclass
+class RepoState:
+    """A snapshot of a repo's state for one run
+
+    It can be prefetched up front, by prefetch_repo_states, so the checks don't each have to make their own requests.
+    Each check fills in the parts it fetched itself, and apply reads what the checks found rather than fetching it
+    again. Any field left as None has not been fetched yet.
+    """
+
+    # Setting name from repo_manager.schemas.settings.Settings -> the repo's value. Settings missing from the dict
+    # are read from the repo object
+    settings: dict[str, Any] | None = None
+    # Label name -> label
+    labels: dict[str, Label] | None = None
+    # Branch name -> the branch's protection, or None if it is not protected. Branches that don't exist are left out.
+    # Prefetched for every configured branch, or filled by the check with the protections it compared
+    branches: dict[str, BranchProtection | None] | None = None
+    # Branch name -> the branch, for the configured branches that exist, to change their protection with
+    branch_objects: dict[str, Branch] | None = None
+    # Secret type -> secret name -> when the secret was last updated
+    secrets: dict[str, dict[str, str | None]] | None = None
+    # Branch name -> the tree check_repo_files compared files against, and the blob sha and mode of each of its files
+    trees: dict[str, tuple[GitTree, dict[str, tuple[str, str]]]] | None = None
+
+    def get_branch(self, repo: Repository, branch_name: str) -> Branch:
+        """A branch from the snapshot, or fetched from the repo if the check didn't look it up"""
+        if self.branch_objects is not None and branch_name in self.branch_objects:
+            return self.branch_objects[branch_name]
+        return repo.get_branch(branch_name)
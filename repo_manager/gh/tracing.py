@@ -0,0 +1,321 @@
+import json
+import os
+import re
+import threading
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from contextvars import copy_context
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+from functools import wraps
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlparse
+
+from actions_toolkit import core as actions_toolkit
+from requests import PreparedRequest
+from requests import Response
+
+from .ratelimit import rate_limit_resource
+from .transport import connection_stats
+
+# Attributes, like the repo, phase, and resource, that requests made in the current context are tagged with
+_attributes: ContextVar[dict[str, str]] = ContextVar("repo_manager_trace_attributes", default={})
+
+# (pattern, replacement) applied in order to a request's path to get its url template, so requests for different
+# repos, labels, branches or files are grouped together
+URL_TEMPLATES = [
+    (re.compile(r"^/api/v3(?=/)"), ""),
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/{owner}/{repo}"),
+    (re.compile(r"^/(orgs|users)/[^/]+"), r"/\1/{owner}"),
+    (re.compile(r"/labels/[^/]+$"), "/labels/{name}"),
+    (re.compile(r"/branches/.+?(?=/protection|$)"), "/branches/{branch}"),
+    (re.compile(r"/environments/[^/]+"), "/environments/{environment}"),
+    (re.compile(r"/secrets/(?!public-key$)[^/]+$"), "/secrets/{name}"),
+    (re.compile(r"/contents/.+$"), "/contents/{path}"),
+    (re.compile(r"/git/(blobs|commits|trees)/[^/]+$"), r"/git/\1/{sha}"),
+    (re.compile(r"/git/(refs?)/heads/.+$"), r"/git/\1/heads/{branch}"),
+]
+
+
+def url_template(url: str) -> str:
+    """The path of url with its owner, repo, and resource names replaced by placeholders"""
+    path = urlparse(url).path
+    for pattern, replacement in URL_TEMPLATES:
+        path = pattern.sub(replacement, path)
+    return path
+
+
+def set_trace_attributes(**attributes: str):
+    """Tag every request made from here on in the current context with attributes
+
+    Use inside a function decorated with traced, or bound with bind_trace_context, so the attributes don't outlive it
+    """
+    _attributes.set({**_attributes.get(), **attributes})
+
+
+def bind_trace_context(func: Callable, **attributes: str) -> Callable:
+    """Bind func to a copy of the current trace attributes, plus attributes
+
+    Threads don't inherit context, so functions submitted to an executor are bound first to keep the attributes of
+    whoever submitted them. Each bound function should only be called once at a time
+    """
+    context = copy_context()
+
+    def run(*args, **kwargs):
+        def with_attributes():
+            set_trace_attributes(**attributes)
+            return func(*args, **kwargs)
+
+        return context.run(with_attributes)
+
+    return run
+
+
+def traced(**attributes: str) -> Callable:
+    """Decorate a function to tag the requests made while it runs with attributes"""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return bind_trace_context(func, **attributes)(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@dataclass
+class Span:
+    """One GitHub api request"""
+
+    method: str
+    url: str
+    template: str
+    start_ns: int
+    seconds: float
+    status: int | None = None
+    request_bytes: int = 0
+    response_bytes: int = 0
+    rate_limit_resource: str = "core"
+    rate_limit_remaining: int | None = None
+    # rate limit points the request cost. 304s are free, GraphQL queries cost what GitHub says they did
+    rate_limit_cost: int = 0
+    error: str | None = None
+    thread: str = ""
+    attributes: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.template}"
+
+
+class Tracer:
+    """Transport middleware that records a Span for every request sent to the GitHub api
+
+    It goes last in the middleware chain, so every attempt the RequestScheduler makes is recorded with the latency,
+    status and size it had on the wire, tagged with the trace attributes of the context it was made in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans: list[Span] = []
+        # resource -> X-RateLimit-Used of its last response, to work out what each GraphQL query cost
+        self._used: dict[str, int] = {}
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+            self._used = {}
+
+    def _cost(self, resource: str, response: Response) -> int:
+        if response.status_code == 304:
+            return 0
+        try:
+            used = int(response.headers["X-RateLimit-Used"])
+        except (KeyError, ValueError):
+            return 1
+        with self._lock:
+            last_used = self._used.get(resource, None)
+            self._used[resource] = used
+        if resource != "graphql" or last_used is None or used <= last_used:
+            return 1
+        return used - last_used
+
+    def start(self, request: PreparedRequest, body: str | bytes | None) -> Span:
+        """Start a Span for a request about to be sent, tagged with the trace attributes of the current context
+
+        request can be a requests or an httpx request, they have the same method and url
+        """
+        body = body or b""
+        url = str(request.url)
+        return Span(
+            method=request.method,
+            url=url,
+            template=url_template(url),
+            start_ns=time.time_ns(),
+            seconds=time.perf_counter(),
+            request_bytes=len(body.encode("utf-8") if isinstance(body, str) else body),
+            rate_limit_resource=rate_limit_resource(request),
+            thread=threading.current_thread().name,
+            attributes=dict(_attributes.get()),
+        )
+
+    def finish(self, span: Span, response: Response | None = None, exc: Exception | None = None):
+        """Record a Span from start once its response, or the exception sending it raised, is in
+
+        response can be a requests or an httpx response, they have the same status_code, content and headers
+        """
+        # until it's finished, seconds holds when the span started
+        span.seconds = time.perf_counter() - span.seconds
+        if exc is not None:
+            span.error = f"{exc}"
+        else:
+            span.status = response.status_code
+            span.response_bytes = len(response.content or b"")
+            span.rate_limit_cost = self._cost(span.rate_limit_resource, response)
+            remaining = response.headers.get("X-RateLimit-Remaining", None)
+            span.rate_limit_remaining = int(remaining) if remaining is not None and remaining.isdigit() else None
+        self._record(span)
+
+    def __call__(self, request: PreparedRequest, send: Callable[..., Response], **kwargs) -> Response:
+        span = self.start(request, request.body)
+        try:
+            response = send(request, **kwargs)
+        except Exception as exc:
+            self.finish(span, exc=exc)
+            raise
+        self.finish(span, response)
+        return response
+
+    def _record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> list[dict[str, Any]]:
+        """Requests grouped by phase, resource, method and url template, slowest group first"""
+        groups = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            key = (span.attributes.get("phase", ""), span.attributes.get("resource", ""), span.name)
+            group = groups.setdefault(
+                key,
+                {
+                    "phase": key[0],
+                    "resource": key[1],
+                    "request": key[2],
+                    "count": 0,
+                    "seconds": 0.0,
+                    "response_bytes": 0,
+                    "rate_limit_cost": 0,
+                    "statuses": {},
+                },
+            )
+            group["count"] += 1
+            group["seconds"] += span.seconds
+            group["response_bytes"] += span.response_bytes
+            group["rate_limit_cost"] += span.rate_limit_cost
+            status = str(span.status) if span.status is not None else "error"
+            group["statuses"][status] = group["statuses"].get(status, 0) + 1
+        for group in groups.values():
+            group["seconds"] = round(group["seconds"], 6)
+        return sorted(groups.values(), key=lambda group: group["seconds"], reverse=True)
+
+    def to_json(self) -> dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "spans": [asdict(span) for span in spans],
+            "summary": self.summary(),
+            "connections": connection_stats.summary(),
+        }
+
+    def to_otlp(self, service_name: str = "repo-manager") -> dict[str, Any]:
+        """The spans as an OpenTelemetry OTLP/JSON ExportTraceServiceRequest, all in one trace"""
+        trace_id = os.urandom(16).hex()
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_otlp_attribute("service.name", service_name)]},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [_otlp_span(span, trace_id) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def export(self, trace_file: str | Path):
+        """Write the trace to trace_file as json, and as an OTLP/JSON span dump next to it, then log the summary
+
+        The span dump goes to trace_file with its suffix replaced by .otlp.json
+        """
+        trace_file = Path(trace_file)
+        trace_file.parent.mkdir(parents=True, exist_ok=True)
+        trace_file.write_text(json.dumps(self.to_json(), indent=2))
+        otlp_file = trace_file.with_suffix(".otlp.json")
+        otlp_file.write_text(json.dumps(self.to_otlp()))
+
+        summary = self.summary()
+        actions_toolkit.info(
+            f"Traced {sum(group['count'] for group in summary)} Github api requests to {trace_file} and {otlp_file}"
+        )
+        for group in summary[:10]:
+            actions_toolkit.info(
+                f"{group['phase'] or '-'}/{group['resource'] or '-'} {group['request']}: "
+                + f"{group['count']} requests, {group['seconds']:.3f}s"
+            )
+
+
+def _otlp_attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_span(span: Span, trace_id: str) -> dict[str, Any]:
+    attributes = {
+        "http.request.method": span.method,
+        "url.full": span.url,
+        "url.template": span.template,
+        "http.request.body.size": span.request_bytes,
+        "http.response.body.size": span.response_bytes,
+        "github.rate_limit.resource": span.rate_limit_resource,
+        "github.rate_limit.cost": span.rate_limit_cost,
+        "thread.name": span.thread,
+    }
+    if span.status is not None:
+        attributes["http.response.status_code"] = span.status
+    if span.rate_limit_remaining is not None:
+        attributes["github.rate_limit.remaining"] = span.rate_limit_remaining
+    if span.error is not None:
+        attributes["error.type"] = span.error
+    attributes.update({f"repo_manager.{key}": value for key, value in span.attributes.items()})
+    failed = span.error is not None or (span.status is not None and span.status >= 400)
+    return {
+        "traceId": trace_id,
+        "spanId": os.urandom(8).hex(),
+        "name": span.name,
+        # SPAN_KIND_CLIENT
+        "kind": 3,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.start_ns + int(span.seconds * 1e9)),
+        "attributes": [_otlp_attribute(key, value) for key, value in attributes.items()],
+        # STATUS_CODE_ERROR or STATUS_CODE_UNSET
+        "status": {"code": 2} if failed else {"code": 0},
+    }
+
+
+# Every client from get_github_client records to this tracer
+tracer = Tracer()
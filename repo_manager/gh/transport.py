@@ -0,0 +1,228 @@
+import threading
+from collections.abc import Callable
+from collections.abc import Sequence
+from dataclasses import dataclass
+from functools import partial
+from typing import Any
+
+from actions_toolkit import core as actions_toolkit
+from github import Github
+from github.Requester import HTTPRequestsConnectionClass
+from github.Requester import HTTPSRequestsConnectionClass
+from github.Requester import Requester
+from github.Requester import RequestsResponse
+from requests import PreparedRequest
+from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool
+
+# A middleware is called with the request, the next send in the chain and send's kwargs, and returns the response.
+# It can change the request, skip or repeat the send, or replace the response.
+Middleware = Callable[..., Response]
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    """How the transport pools and keeps alive its connections to the GitHub api"""
+
+    # How many hosts to keep a pool of connections for
+    pool_size: int = 10
+    # The most connections to keep open to one host. Requests past it wait for a connection rather than opening
+    # one that is thrown away after, and the RequestScheduler never has more than this many in flight
+    max_connections_per_host: int = 32
+    # Reuse connections between requests. Without it every request pays for its own TCP and TLS handshake
+    keep_alive: bool = True
+    # Seconds to wait for a connection to open, and for each read of a response
+    connect_timeout: float = 15.0
+    read_timeout: float = 15.0
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        """The (connect, read) timeout to send requests with, as requests takes it"""
+        return self.connect_timeout, self.read_timeout
+
+
+class ConnectionStats:
+    """Counts the requests sent, and connections opened, by every GithubAdapter's connection pools
+
+    Every request that doesn't open a connection reuses one, so the two show how well keep-alive and the pool size
+    are working. A pool reconnects the same connection object when its socket was closed, so the connections are
+    counted as they connect rather than as the pool makes them
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # id -> pool. Pools are kept even once the adapter drops them, so their counts still add up
+        self._pools: dict[int, HTTPConnectionPool] = {}
+        self._connections = 0
+        # connection class -> its subclass that counts its connects here
+        self._counting_classes: dict[type, type] = {}
+
+    def reset(self):
+        with self._lock:
+            self._pools = {}
+            self._connections = 0
+
+    def watch(self, pool: HTTPConnectionPool):
+        """Count the requests and connections of pool, from its first request on"""
+        with self._lock:
+            if id(pool) in self._pools:
+                return
+            self._pools[id(pool)] = pool
+            base = pool.ConnectionCls
+            if base not in self._counting_classes:
+                self._counting_classes[base] = self._counting_class(base)
+            pool.ConnectionCls = self._counting_classes[base]
+
+    def _counting_class(self, base: type) -> type:
+        stats = self
+
+        class CountingConnection(base):
+            def connect(self):
+                super().connect()
+                with stats._lock:
+                    stats._connections += 1
+
+        return CountingConnection
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            pools = list(self._pools.values())
+            connections = self._connections
+        requests = sum(pool.num_requests for pool in pools)
+        reused = max(0, requests - connections)
+        return {
+            "requests": requests,
+            "connections": connections,
+            "reused": reused,
+            "reuse_ratio": round(reused / requests, 3) if requests > 0 else 0.0,
+        }
+
+    def report(self):
+        """Log the summary, for the end of the run"""
+        summary = self.summary()
+        if summary["requests"] == 0:
+            return
+        actions_toolkit.info(
+            f"Github api connections: {summary['connections']} opened for {summary['requests']} requests, "
+            + f"{summary['reuse_ratio']:.0%} of requests reused a connection"
+        )
+
+
+class GithubAdapter(HTTPAdapter):
+    """requests transport adapter that every GitHub api request made through get_github_client goes through
+
+    Each request is passed through the middlewares, in order, before it is sent. The connection pools it sends with
+    are counted by connection_stats
+    """
+
+    def __init__(
+        self,
+        middlewares: Sequence[Middleware] = (),
+        keep_alive: bool = True,
+        timeout: tuple[float, float] | None = None,
+        **kwargs,
+    ):
+        self.middlewares = list(middlewares)
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def get_connection_with_tls_context(self, *args, **kwargs) -> HTTPConnectionPool:
+        pool = super().get_connection_with_tls_context(*args, **kwargs)
+        connection_stats.watch(pool)
+        return pool
+
+    def get_connection(self, *args, **kwargs) -> HTTPConnectionPool:
+        # used instead of get_connection_with_tls_context by requests older than 2.32.2
+        pool = super().get_connection(*args, **kwargs)
+        connection_stats.watch(pool)
+        return pool
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        if not self.keep_alive:
+            request.headers["Connection"] = "close"
+        if self.timeout is not None:
+            # PyGithub only takes one timeout, for both connecting and reading
+            kwargs["timeout"] = self.timeout
+        send = super().send
+        for middleware in reversed(self.middlewares):
+            send = partial(middleware, send=send)
+        return send(request, **kwargs)
+
+
+def _connection_class(
+    base: type[HTTPRequestsConnectionClass] | type[HTTPSRequestsConnectionClass],
+    scheme: str,
+    middlewares: Sequence[Middleware],
+    pool: PoolSettings,
+) -> type:
+    """Subclass one of PyGithub's connection classes to mount a GithubAdapter on its session
+
+    PyGithub keeps one connection per client, which every thread using the client shares. Its request() stores the
+    request on the connection for getresponse() to send, so two threads could send each other's requests. The
+    subclass keeps each thread's request apart until it is sent
+    """
+
+    class Connection(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._pending = threading.local()
+            self.adapter = GithubAdapter(
+                middlewares,
+                keep_alive=pool.keep_alive,
+                timeout=pool.timeout,
+                max_retries=self.retry,
+                pool_connections=pool.pool_size,
+                pool_maxsize=pool.max_connections_per_host,
+                pool_block=True,
+            )
+            self.session.mount(f"{scheme}://", self.adapter)
+
+        def request(self, verb: str, url: str, input: Any, headers: dict[str, str], stream: bool = False):
+            self._pending.request = (verb, url, input, headers)
+
+        def getresponse(self) -> RequestsResponse:
+            verb, url, input, headers = self._pending.request
+            del self._pending.request
+            response = self.session.request(
+                verb,
+                f"{self.protocol}://{self.host}:{self.port}{url}",
+                headers=headers,
+                data=input,
+                timeout=self.timeout,
+                verify=self.verify,
+                allow_redirects=False,
+            )
+            return RequestsResponse(response)
+
+    return Connection
+
+
+def build_github_client(
+    token: str,
+    api_url: str,
+    middlewares: Sequence[Middleware] = (),
+    pool: PoolSettings | None = None,
+    **kwargs,
+) -> Github:
+    """Build a Github client whose requests go through our transport middlewares, pooled as pool says
+
+    PyGithub only lets connection classes be swapped for every Requester at once, so they are injected just long
+    enough for this client's Requester to pick them up, then reset. The connection classes are injected even without
+    middlewares, so the pool settings always apply
+    """
+    if pool is None:
+        pool = PoolSettings()
+    Requester.injectConnectionClasses(
+        _connection_class(HTTPRequestsConnectionClass, "http", middlewares, pool),
+        _connection_class(HTTPSRequestsConnectionClass, "https", middlewares, pool),
+    )
+    try:
+        return Github(token, base_url=api_url, **kwargs)
+    finally:
+        Requester.resetConnectionClasses()
+
+
+# Every client from build_github_client counts its connections here
+connection_stats = ConnectionStats()
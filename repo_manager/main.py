@@ -1,26 +1,35 @@
+import atexit
 import json
 import sys
+from pathlib import Path
 
 from actions_toolkit import core as actions_toolkit
 
-from repo_manager.gh.branch_protections import check_repo_branch_protections
-from repo_manager.gh.branch_protections import update_branch_protection
-from repo_manager.gh.files import copy_file
-from repo_manager.gh.files import delete_file
-from repo_manager.gh.files import move_file
-from repo_manager.gh.files import RemoteSrcNotFoundError
-from repo_manager.gh.labels import check_repo_labels
-from repo_manager.gh.labels import update_label
-from repo_manager.gh.secrets import check_repo_secrets
-from repo_manager.gh.secrets import create_secret
-from repo_manager.gh.secrets import delete_secret
-from repo_manager.gh.settings import check_repo_settings
-from repo_manager.gh.settings import update_settings
+from repo_manager.gh import get_github_client
+from repo_manager.gh.incremental import config_fingerprints
+from repo_manager.gh.incremental import INCREMENTAL_FILE
+from repo_manager.gh.incremental import IncrementalStore
+from repo_manager.gh.plan import load_plan
+from repo_manager.gh.plan import PlanError
+from repo_manager.gh.plan import write_plan
+from repo_manager.gh.repos import iter_org_repos
+from repo_manager.gh.repos import resolve_repos
+from repo_manager.gh.secrets import SECRET_FINGERPRINTS_FILE
+from repo_manager.gh.secrets import SecretFingerprints
+from repo_manager.gh.state import RepoState
+from repo_manager.gh.tracing import set_trace_attributes
+from repo_manager.gh.tracing import tracer
+from repo_manager.gh.transport import connection_stats
+from repo_manager.runner import apply_repo
+from repo_manager.runner import check_repo
+from repo_manager.runner import plan_repo
+from repo_manager.runner import prefetch_repo_states
+from repo_manager.runner import run_fleet
+from repo_manager.runner import run_plan
 from repo_manager.schemas import load_config
 from repo_manager.utils import get_inputs
 from yaml import YAMLError
 from pydantic import ValidationError
-from repo_manager.gh import GithubException, UnknownObjectException
 
 
 def main():  # noqa: C901
@@ -29,6 +38,15 @@ def main():  # noqa: C901
     # actions toolkit has very broad exceptions :(
     except Exception as exc:
         actions_toolkit.set_failed(f"Unable to collect inputs {exc}")
+    # registered first so it runs last, once the trace has been written
+    atexit.register(connection_stats.report)
+    if inputs["trace_file"] is not None:
+        # set_failed exits, so the trace is written on the way out however main ends
+        atexit.register(tracer.export, inputs["trace_file"])
+    if inputs["action"] == "apply-plan":
+        plan_main(inputs)
+        sys.exit(0)
+
     actions_toolkit.debug(f"Loading config from {inputs['settings_file']}")
     try:
         config = load_config(inputs["settings_file"])
@@ -47,28 +65,44 @@ def main():  # noqa: C901
         sys.exit(0)
     actions_toolkit.info(f"Config from {inputs['settings_file']} validated.")
 
-    check_result = True
-    diffs = {}
-    for check, to_check in {
-        check_repo_settings: ("settings", config.settings),
-        check_repo_secrets: ("secrets", config.secrets),
-        check_repo_labels: ("labels", config.labels),
-        check_repo_branch_protections: (
-            "branch_protections",
-            config.branch_protections,
-        ),
-    }.items():
-        check_name, to_check = to_check
-        if to_check is not None:
-            this_check, this_diffs = check(inputs["repo_object"], to_check)
-            check_result &= this_check
-            if this_diffs is not None:
-                diffs[check_name] = this_diffs
+    if inputs["repos"] is not None or inputs["org"] is not None:
+        fleet_main(inputs, config)
+        sys.exit(0)
 
-    actions_toolkit.debug(json_diff := json.dumps({}))
+    set_trace_attributes(repo=inputs["repo_object"].full_name)
+    client = get_github_client(
+        inputs["token"],
+        inputs["api_url"],
+        inputs["cache_dir"],
+        inputs["pool"],
+        inputs["trace_file"] is not None,
+        inputs["cache_namespace"],
+    )
+    incremental = get_incremental(inputs, config)
+    if incremental is not None:
+        config, skipped = incremental.config_for(inputs["repo_object"], config)
+        if len(skipped) > 0:
+            actions_toolkit.info(f"{', '.join(skipped)} unchanged since the last run, skipped")
+    state = prefetch_repo_states(client, [inputs["repo_object"]], config).get(
+        inputs["repo_object"].full_name, RepoState()
+    )
+    check_result, diffs = check_repo(inputs["repo_object"], config, state)
+
+    actions_toolkit.debug(json_diff := json.dumps(diffs))
     actions_toolkit.set_output("diff", json_diff)
 
+    if inputs["action"] == "check" and inputs["plan_file"] is not None:
+        steps, errors = plan_repo(inputs["repo_object"], config, diffs, state, get_secret_fingerprints(inputs))
+        write_plan(inputs["plan_file"], {inputs["repo_object"].full_name: steps})
+        actions_toolkit.info(f"Wrote a plan of {len(steps)} steps to {inputs['plan_file']}")
+        if len(errors) > 0:
+            actions_toolkit.error(json.dumps(errors))
+            actions_toolkit.set_failed("Errors while planning")
+
     if inputs["action"] == "check":
+        if incremental is not None:
+            incremental.record_result(inputs["repo_object"], diffs, applied=False)
+            incremental.save()
         if not check_result:
             actions_toolkit.set_output("result", "Check failed, diff detected")
             actions_toolkit.set_failed("Diff detected")
@@ -76,193 +110,140 @@ def main():  # noqa: C901
         sys.exit(0)
 
     if inputs["action"] == "apply":
-        errors = []
+        fingerprints = get_secret_fingerprints(inputs)
+        errors, commits = apply_repo(inputs["repo_object"], config, diffs, state, fingerprints)
+        if fingerprints is not None:
+            fingerprints.save()
+        if incremental is not None and len(errors) == 0:
+            incremental.record_result(inputs["repo_object"], diffs, applied=True)
+            incremental.save()
+        actions_toolkit.info("Commit SHAs: " + ",".join(commits))
 
-        # Because we cannot diff secrets, just apply it every time
-        if config.secrets is not None:
-            for secret in config.secrets:
-                if secret.exists:
-                    try:
-                        create_secret(
-                            inputs["repo_object"], secret.key, secret.expected_value, secret.type == "dependabot"
-                        )
-                        actions_toolkit.info(f"Set {secret.key} to expected value")
-                    except Exception as exc:  # this should be tighter
-                        errors.append(
-                            {
-                                "type": "secret-update",
-                                "key": secret.key,
-                                "error": f"{exc}",
-                            }
-                        )
-                else:
-                    try:
-                        delete_secret(inputs["repo_object"], secret.key, secret.type == "dependabot")
-                        actions_toolkit.info(f"Deleted {secret.key}")
-                    except Exception as exc:  # this should be tighter
-                        errors.append(
-                            {
-                                "type": "secret-delete",
-                                "key": secret.key,
-                                "error": f"{exc}",
-                            }
-                        )
+        if len(errors) > 0:
+            actions_toolkit.error(json.dumps(errors))
+            actions_toolkit.set_failed("Errors during apply")
+        actions_toolkit.set_output("result", "Apply successful")
 
-        labels_diff = diffs.get("labels", None)
-        if labels_diff is not None:
-            for label_name in labels_diff["extra"]:
-                try:
-                    this_label = inputs["repo_object"].get_label(label_name)
-                    this_label.delete()
-                    actions_toolkit.info(f"Deleted {label_name}")
-                except Exception as exc:  # this should be tighter
-                    errors.append({"type": "label-delete", "name": label_name, "error": f"{exc}"})
-            for label_name in labels_diff["missing"]:
-                label_object = config.labels_dict[label_name]
-                if label_object.name != label_object.expected_name:
-                    update_label(inputs["repo_object"], label_object)
-                    actions_toolkit.info(f"Renamed {label_object.name} to {label_object.expected_name}")
-                else:
-                    try:
-                        inputs["repo_object"].create_label(
-                            label_object.expected_name,
-                            label_object.color_no_hash,
-                            label_object.description,
-                        )
-                        actions_toolkit.info(f"Created label {label_name}")
-                    except Exception as exc:  # this should be tighter
-                        errors.append(
-                            {
-                                "type": "label-create",
-                                "name": label_name,
-                                "error": f"{exc}",
-                            }
-                        )
-            for label_name in labels_diff["diffs"].keys():
-                update_label(inputs["repo_object"], config.labels_dict[label_name])
-                actions_toolkit.info(f"Updated label {label_name}")
 
-        bp_diff = diffs.get("branch_protections", None)
-        if bp_diff is not None:
-            # delete branch protection
-            for branch_name in bp_diff["extra"]:
-                try:
-                    this_branch = inputs["repo_object"].get_branch(branch_name)
-                    this_branch.remove_protection()
-                except GithubException as ghexc:
-                    if ghexc.status != 404:
-                        # a 404 on a delete is fine, means it isnt protected
-                        errors.append(
-                            {
-                                "type": "bp-delete",
-                                "name": branch_name,
-                                "error": f"{ghexc}",
-                            }
-                        )
-                except Exception as exc:  # this should be tighter
-                    errors.append({"type": "bp-delete", "name": branch_name, "error": f"{exc}"})
+def get_secret_fingerprints(inputs) -> SecretFingerprints | None:
+    """The secret fingerprint store in cache_dir, if secret_fingerprint_key is set"""
+    if inputs["secret_fingerprint_key"] is None:
+        return None
+    return SecretFingerprints(Path(inputs["cache_dir"]) / SECRET_FINGERPRINTS_FILE, inputs["secret_fingerprint_key"])
+
+
+def get_incremental(inputs, config) -> IncrementalStore | None:
+    """The incremental store in cache_dir, with the fingerprints of config, if incremental is set"""
+    if not inputs["incremental"]:
+        return None
+    return IncrementalStore(
+        Path(inputs["cache_dir"]) / INCREMENTAL_FILE, config_fingerprints(config, inputs["secret_fingerprint_key"])
+    )
+
+
+def fleet_main(inputs, config):
+    """Runs check or apply against every repo in inputs['repos'], or of inputs['org'], and sets the outputs"""
+    client = get_github_client(
+        inputs["token"],
+        inputs["api_url"],
+        inputs["cache_dir"],
+        inputs["pool"],
+        inputs["trace_file"] is not None,
+        inputs["cache_namespace"],
+    )
+    plan = inputs["action"] == "check" and inputs["plan_file"] is not None
+    fingerprints = get_secret_fingerprints(inputs) if inputs["action"] == "apply" or plan else None
+    incremental = get_incremental(inputs, config)
+    if inputs["org"] is not None:
+        repos = iter_org_repos(
+            client,
+            inputs["org"],
+            topics=inputs["org_topics"],
+            visibility=inputs["org_visibility"],
+            archived=inputs["org_archived"],
+            name_regex=inputs["org_name_regex"],
+        )
+    else:
+        repos = resolve_repos(client, inputs["repos"])
+    results = run_fleet(
+        client,
+        repos,
+        config,
+        inputs["action"],
+        max_workers=inputs["max_workers"],
+        fingerprints=fingerprints,
+        plan=plan,
+        incremental=incremental,
+    )
+    if incremental is not None:
+        incremental.save()
+    if plan:
+        write_plan(inputs["plan_file"], {repo_name: result.get("steps", []) for repo_name, result in results.items()})
+        actions_toolkit.info(f"Wrote a plan for {len(results)} repos to {inputs['plan_file']}")
+    elif fingerprints is not None:
+        fingerprints.save()
+
+    actions_toolkit.debug(
+        json_diff := json.dumps({repo_name: result["diffs"] for repo_name, result in results.items()})
+    )
+    actions_toolkit.set_output("diff", json_diff)
 
-            # update or create branch protection
-            for branch_name in bp_diff["missing"] + list(bp_diff["diffs"].keys()):
-                try:
-                    bp_config = config.branch_protections_dict[branch_name]
-                    if bp_config.protection is not None:
-                        update_branch_protection(inputs["repo_object"], branch_name, bp_config.protection)
-                        actions_toolkit.info(f"Updated branch proection for {branch_name}")
-                    else:
-                        actions_toolkit.warning(f"Branch protection config for {branch_name} is empty")
-                except GithubException as ghexc:
-                    if ghexc.status == 404:
-                        actions_toolkit.info(
-                            f"Can't Update branch protection for {branch_name} because the branch does not exist"
-                        )
-                    else:
-                        errors.append(
-                            {
-                                "type": "bp-update",
-                                "name": branch_name,
-                                "error": f"{ghexc}",
-                            }
-                        )
-                except Exception as exc:  # this should be tighter
-                    errors.append({"type": "bp-update", "name": branch_name, "error": f"{exc}"})
+    errors = {repo_name: result["errors"] for repo_name, result in results.items() if len(result["errors"]) > 0}
+    if len(errors) > 0:
+        actions_toolkit.error(json.dumps(errors))
+        actions_toolkit.set_output("result", f"Errors in {len(errors)} of {len(results)} repos")
+        actions_toolkit.set_failed(f"Errors during {inputs['action']}")
 
-        if config.settings is not None:
-            try:
-                update_settings(inputs["repo_object"], config.settings)
-                actions_toolkit.info("Synced Settings")
-            except Exception as exc:
-                errors.append({"type": "settings-update", "error": f"{exc}"})
+    if inputs["action"] == "check":
+        drifted = [repo_name for repo_name, result in results.items() if not result["check"]]
+        if len(drifted) > 0:
+            actions_toolkit.set_output(
+                "result", f"Check failed, diff detected in {len(drifted)} of {len(results)} repos"
+            )
+            actions_toolkit.set_failed(f"Diff detected in {', '.join(drifted)}")
+        actions_toolkit.set_output("result", f"Check passed for {len(results)} repos")
 
-        commits = []
-        if config.files is not None:
-            for file_config in config.files:
-                # delete files
-                if not file_config.exists:
-                    try:
-                        commits.append(delete_file(inputs["repo_object"], file_config))
-                        actions_toolkit.info(f"Deleted {str(file_config.dest_file)}")
-                    except UnknownObjectException:
-                        target_branch = (
-                            file_config.target_branch
-                            if file_config.target_branch is not None
-                            else inputs["repo_object"].default_branch
-                        )
-                        actions_toolkit.warning(
-                            f"{str(file_config.dest_file)} does not exist in "
-                            + f"{target_branch}"
-                            + " branch. Because this is a delete, not failing run"
-                        )
-                    except Exception as exc:
-                        errors.append({"type": "file-delete", "file": str(file_config.dest_file), "error": f"{exc}"})
-                elif file_config.move:
-                    try:
-                        copy_commit, delete_commit = move_file(inputs["repo_object"], file_config)
-                        commits.append(copy_commit)
-                        commits.append(delete_commit)
-                        actions_toolkit.info(f"Moved {str(file_config.src_file)} to {str(file_config.dest_file)}")
-                    except RemoteSrcNotFoundError:
-                        target_branch = (
-                            file_config.target_branch
-                            if file_config.target_branch is not None
-                            else inputs["repo_object"].default_branch
-                        )
-                        actions_toolkit.warning(
-                            f"{str(file_config.src_file)} does not exist in "
-                            + f"{target_branch}"
-                            + " branch. Because this is a move, not failing run"
-                        )
-                    except Exception as exc:
-                        errors.append(
-                            {
-                                "type": "file-move",
-                                "src_file": str(file_config.src_file),
-                                "dest_file": str(file_config.dest_file),
-                                "error": f"{exc}",
-                            }
-                        )
-                else:
-                    try:
-                        commits.append(copy_file(inputs["repo_object"], file_config))
-                        actions_toolkit.info(
-                            f"Copied{' remote ' if file_config.remote_src else ' '}{str(file_config.src_file)}"
-                            + f" to {str(file_config.dest_file)}"
-                        )
-                    except Exception as exc:
-                        errors.append(
-                            {
-                                "type": "file-copy",
-                                "src_file": str(file_config.src_file),
-                                "dest_file": str(file_config.dest_file),
-                                "error": f"{exc}",
-                            }
-                        )
+    if inputs["action"] == "apply":
+        commits = [commit for result in results.values() for commit in result["commits"]]
         actions_toolkit.info("Commit SHAs: " + ",".join(commits))
+        actions_toolkit.set_output("result", f"Apply successful for {len(results)} repos")
 
-        if len(errors) > 0:
-            actions_toolkit.error(json.dumps(errors))
-            actions_toolkit.set_failed("Errors during apply")
-        actions_toolkit.set_output("result", "Apply successful")
+
+def plan_main(inputs):
+    """Makes the changes in inputs['plan_file'], as written by a check, and sets the outputs"""
+    try:
+        plan = load_plan(inputs["plan_file"])
+    except (OSError, PlanError) as exc:
+        actions_toolkit.set_failed(f"Unable to read plan {inputs['plan_file']} - {exc}")
+    client = get_github_client(
+        inputs["token"],
+        inputs["api_url"],
+        inputs["cache_dir"],
+        inputs["pool"],
+        inputs["trace_file"] is not None,
+        inputs["cache_namespace"],
+    )
+    fingerprints = get_secret_fingerprints(inputs)
+    results = run_plan(client, plan, max_workers=inputs["max_workers"], fingerprints=fingerprints)
+    if fingerprints is not None:
+        fingerprints.save()
+
+    actions_toolkit.debug(
+        json_diff := json.dumps(
+            {repo_name: [step["description"] for step in steps] for repo_name, steps in plan.items()}
+        )
+    )
+    actions_toolkit.set_output("diff", json_diff)
+
+    errors = {repo_name: result["errors"] for repo_name, result in results.items() if len(result["errors"]) > 0}
+    if len(errors) > 0:
+        actions_toolkit.error(json.dumps(errors))
+        actions_toolkit.set_output("result", f"Errors in {len(errors)} of {len(results)} repos")
+        actions_toolkit.set_failed("Errors during apply-plan")
+
+    commits = [commit for result in results.values() for commit in result["commits"]]
+    actions_toolkit.info("Commit SHAs: " + ",".join(commits))
+    actions_toolkit.set_output("result", f"Apply successful for {len(results)} repos")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,563 @@
+from collections.abc import Iterable
+from concurrent.futures import as_completed
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from itertools import islice
+from typing import Any
+
+from actions_toolkit import core as actions_toolkit
+from github import Github
+from github.Repository import Repository
+
+from repo_manager.gh import GithubException
+from repo_manager.gh.branch_protections import check_repo_branch_protections
+from repo_manager.gh.branch_protections import plan_branch_protection
+from repo_manager.gh.branch_protections import protection_url
+from repo_manager.gh.branch_protections import sync_branch_protection
+from repo_manager.gh.files import check_repo_files
+from repo_manager.gh.files import commit_files
+from repo_manager.gh.files import group_files
+from repo_manager.gh.files import plan_commit
+from repo_manager.gh.files import RemoteDestNotFoundError
+from repo_manager.gh.files import RemoteSrcNotFoundError
+from repo_manager.gh.graphql import fetch_repo_states
+from repo_manager.gh.graphql import GRAPHQL_BATCH_SIZE
+from repo_manager.gh.incremental import IncrementalStore
+from repo_manager.gh.labels import check_repo_labels
+from repo_manager.gh.labels import plan_labels
+from repo_manager.gh.labels import reconcile_labels
+from repo_manager.gh.plan import request_step
+from repo_manager.gh.plan import run_step
+from repo_manager.gh.repos import get_repo
+from repo_manager.gh.secrets import check_repo_secrets
+from repo_manager.gh.secrets import plan_secrets
+from repo_manager.gh.secrets import record_planned_fingerprints
+from repo_manager.gh.secrets import SecretFingerprints
+from repo_manager.gh.secrets import sync_secrets
+from repo_manager.gh.settings import check_repo_settings
+from repo_manager.gh.settings import plan_settings
+from repo_manager.gh.settings import update_settings
+from repo_manager.gh.state import RepoState
+from repo_manager.gh.tracing import bind_trace_context
+from repo_manager.gh.tracing import set_trace_attributes
+from repo_manager.gh.tracing import traced
+from repo_manager.schemas import RepoManagerConfig
+
+
+def check_repo(
+    repo: Repository, config: RepoManagerConfig, state: RepoState | None = None
+) -> tuple[bool, dict[str, Any]]:
+    """Checks a repo vs our config
+
+    The checks are independent of each other and bound by network latency, so they run concurrently. Checks whose
+    part of the repo is in state, from prefetch_repo_states, use it rather than fetching it themselves, and the
+    checks fill in state with what they do fetch so apply_repo can reuse it
+
+    Returns:
+        Tuple[bool, Dict[str, Any]]: If the repo matched the config, and the diffs of each check that found any
+    """
+    if state is None:
+        state = RepoState()
+
+    to_run = {
+        check_name: (check, to_check, kwargs)
+        for check, (check_name, to_check, kwargs) in {
+            check_repo_settings: ("settings", config.settings, {"state": state}),
+            check_repo_secrets: ("secrets", config.secrets, {"state": state}),
+            check_repo_labels: ("labels", config.labels, {"state": state}),
+            check_repo_branch_protections: ("branch_protections", config.branch_protections, {"state": state}),
+            check_repo_files: ("files", config.files, {"state": state}),
+        }.items()
+        if to_check is not None
+    }
+
+    check_result = True
+    diffs = {}
+    if len(to_run) == 0:
+        return check_result, diffs
+
+    with ThreadPoolExecutor(max_workers=len(to_run), thread_name_prefix="repo-manager-check") as executor:
+        futures = {
+            check_name: executor.submit(
+                bind_trace_context(check, phase="check", resource=check_name), repo, to_check, **kwargs
+            )
+            for check_name, (check, to_check, kwargs) in to_run.items()
+        }
+        # collect in submission order so the diffs come out in the same order as when the checks ran one by one
+        for check_name, future in futures.items():
+            this_check, this_diffs = future.result()
+            check_result &= this_check
+            if this_diffs is not None:
+                diffs[check_name] = this_diffs
+
+    return check_result, diffs
+
+
+@traced(phase="apply")
+def apply_repo(  # noqa: C901
+    repo: Repository,
+    config: RepoManagerConfig,
+    diffs: dict[str, Any],
+    state: RepoState | None = None,
+    fingerprints: SecretFingerprints | None = None,
+) -> tuple[list[dict], list[str]]:
+    """Applies our config to a repo, using the diffs from check_repo
+
+    The parts of the repo check_repo put in state are reused rather than fetched again. If fingerprints is set,
+    secrets it shows already have their expected value are skipped, and the secrets that are set are recorded in it
+
+    Returns:
+        Tuple[List[Dict], List[str]]: Errors during the apply, and the SHAs of any commits made
+    """
+    if state is None:
+        state = RepoState()
+    errors = []
+
+    # Secrets can't be read back to diff, so every secret is set, unless fingerprints shows it still has our value
+    if config.secrets is not None:
+        set_trace_attributes(resource="secrets")
+        errors += sync_secrets(repo, config.secrets, state, fingerprints)
+
+    labels_diff = diffs.get("labels", None)
+    if labels_diff is not None:
+        set_trace_attributes(resource="labels")
+        errors += reconcile_labels(repo, config.labels_dict, labels_diff, state)
+
+    bp_diff = diffs.get("branch_protections", None)
+    if bp_diff is not None:
+        set_trace_attributes(resource="branch_protections")
+        # delete branch protection
+        for branch_name in bp_diff["extra"]:
+            try:
+                state.get_branch(repo, branch_name).remove_protection()
+            except GithubException as ghexc:
+                if ghexc.status != 404:
+                    # a 404 on a delete is fine, means it isnt protected
+                    errors.append(
+                        {
+                            "type": "bp-delete",
+                            "name": branch_name,
+                            "error": f"{ghexc}",
+                        }
+                    )
+            except Exception as exc:  # this should be tighter
+                errors.append({"type": "bp-delete", "name": branch_name, "error": f"{exc}"})
+
+        # update or create branch protection
+        for branch_name in bp_diff["missing"] + list(bp_diff["diffs"].keys()):
+            try:
+                bp_config = config.branch_protections_dict[branch_name]
+                if bp_config.protection is not None:
+                    changed = sync_branch_protection(repo, branch_name, bp_config.protection, state)
+                    if len(changed) > 0:
+                        actions_toolkit.info(f"Updated branch proection for {branch_name}: {', '.join(changed)}")
+                    else:
+                        actions_toolkit.info(f"Branch protection for {branch_name} already up to date")
+                else:
+                    actions_toolkit.warning(f"Branch protection config for {branch_name} is empty")
+            except GithubException as ghexc:
+                if ghexc.status == 404:
+                    actions_toolkit.info(
+                        f"Can't Update branch protection for {branch_name} because the branch does not exist"
+                    )
+                else:
+                    errors.append(
+                        {
+                            "type": "bp-update",
+                            "name": branch_name,
+                            "error": f"{ghexc}",
+                        }
+                    )
+            except Exception as exc:  # this should be tighter
+                errors.append({"type": "bp-update", "name": branch_name, "error": f"{exc}"})
+
+    if config.settings is not None:
+        set_trace_attributes(resource="settings")
+        try:
+            changed = update_settings(repo, config.settings, state)
+            if len(changed) > 0:
+                actions_toolkit.info(f"Synced Settings: {', '.join(changed.keys())}")
+            else:
+                actions_toolkit.info("Settings already up to date")
+        except Exception as exc:
+            errors.append({"type": "settings-update", "error": f"{exc}"})
+
+    commits = []
+    if config.files is not None:
+        set_trace_attributes(resource="files")
+        # Files with the same commit_key are committed together in one commit
+        for file_configs in group_files(config.files).values():
+            target_branch = (
+                file_configs[0].target_branch if file_configs[0].target_branch is not None else repo.default_branch
+            )
+            try:
+                commit_sha, unchanged, skipped = commit_files(repo, file_configs, target_branch, state)
+            except Exception as exc:  # this should be tighter
+                commit_sha, unchanged, skipped = None, [], [(file_config, exc) for file_config in file_configs]
+            if commit_sha is not None:
+                commits.append(commit_sha)
+
+            unchanged_files = {id(file_config) for file_config in unchanged}
+            skipped_files = {id(file_config): exc for file_config, exc in skipped}
+            for file_config in file_configs:
+                if id(file_config) in unchanged_files:
+                    actions_toolkit.info(f"{str(file_config.dest_file)} is already up to date")
+                    continue
+                exc = skipped_files.get(id(file_config), None)
+                if not file_config.exists:
+                    if exc is None:
+                        actions_toolkit.info(f"Deleted {str(file_config.dest_file)}")
+                    elif isinstance(exc, RemoteDestNotFoundError):
+                        actions_toolkit.warning(
+                            f"{str(file_config.dest_file)} does not exist in "
+                            + f"{target_branch}"
+                            + " branch. Because this is a delete, not failing run"
+                        )
+                    else:
+                        errors.append({"type": "file-delete", "file": str(file_config.dest_file), "error": f"{exc}"})
+                elif file_config.move and file_config.remote_src:
+                    if exc is None:
+                        actions_toolkit.info(f"Moved {str(file_config.src_file)} to {str(file_config.dest_file)}")
+                    elif isinstance(exc, RemoteSrcNotFoundError):
+                        actions_toolkit.warning(
+                            f"{str(file_config.src_file)} does not exist in "
+                            + f"{target_branch}"
+                            + " branch. Because this is a move, not failing run"
+                        )
+                    else:
+                        errors.append(
+                            {
+                                "type": "file-move",
+                                "src_file": str(file_config.src_file),
+                                "dest_file": str(file_config.dest_file),
+                                "error": f"{exc}",
+                            }
+                        )
+                else:
+                    if exc is None:
+                        actions_toolkit.info(
+                            f"Copied{' remote ' if file_config.remote_src else ' '}{str(file_config.src_file)}"
+                            + f" to {str(file_config.dest_file)}"
+                        )
+                    else:
+                        errors.append(
+                            {
+                                "type": "file-copy",
+                                "src_file": str(file_config.src_file),
+                                "dest_file": str(file_config.dest_file),
+                                "error": f"{exc}",
+                            }
+                        )
+
+    return errors, commits
+
+
+@traced(phase="plan")
+def plan_repo(  # noqa: C901
+    repo: Repository,
+    config: RepoManagerConfig,
+    diffs: dict[str, Any],
+    state: RepoState | None = None,
+    fingerprints: SecretFingerprints | None = None,
+) -> tuple[list[dict[str, Any]], list[dict]]:
+    """Works out every request apply_repo would make to fix the diffs from check_repo, without making them
+
+    The steps are in the order apply_repo makes its requests, and apply_plan_repo makes them as they are, so a
+    reviewed plan can be applied without checking the repo again. Like apply_repo, the parts of the repo check_repo
+    put in state are reused, so planning only reads what apply would have had to read anyway
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[Dict]]: The steps, and errors for anything that can't be planned
+    """
+    if state is None:
+        state = RepoState()
+    steps = []
+    errors = []
+
+    if config.secrets is not None:
+        set_trace_attributes(resource="secrets")
+        secret_steps, secret_errors = plan_secrets(repo, config.secrets, state, fingerprints)
+        steps += secret_steps
+        errors += secret_errors
+
+    labels_diff = diffs.get("labels", None)
+    if labels_diff is not None:
+        set_trace_attributes(resource="labels")
+        try:
+            steps += plan_labels(repo, config.labels_dict, labels_diff, state)
+        except Exception as exc:  # this should be tighter
+            errors.append({"type": "label-plan", "error": f"{exc}"})
+
+    bp_diff = diffs.get("branch_protections", None)
+    if bp_diff is not None:
+        set_trace_attributes(resource="branch_protections")
+        for branch_name in bp_diff["extra"]:
+            steps.append(
+                request_step(
+                    "branch_protections",
+                    f"Remove {branch_name}'s protection",
+                    "DELETE",
+                    protection_url(repo, branch_name),
+                )
+            )
+        for branch_name in bp_diff["missing"] + list(bp_diff["diffs"].keys()):
+            bp_config = config.branch_protections_dict[branch_name]
+            if bp_config.protection is None:
+                actions_toolkit.warning(f"Branch protection config for {branch_name} is empty")
+            elif state.branches is not None and branch_name not in state.branches:
+                actions_toolkit.info(
+                    f"Can't plan branch protection for {branch_name} because the branch does not exist"
+                )
+            else:
+                try:
+                    steps += plan_branch_protection(repo, branch_name, bp_config.protection, state)
+                except Exception as exc:  # this should be tighter
+                    errors.append({"type": "bp-plan", "name": branch_name, "error": f"{exc}"})
+
+    if config.settings is not None:
+        set_trace_attributes(resource="settings")
+        try:
+            steps += plan_settings(repo, config.settings, state)
+        except Exception as exc:  # this should be tighter
+            errors.append({"type": "settings-plan", "error": f"{exc}"})
+
+    if config.files is not None:
+        set_trace_attributes(resource="files")
+        for file_configs in group_files(config.files).values():
+            target_branch = (
+                file_configs[0].target_branch if file_configs[0].target_branch is not None else repo.default_branch
+            )
+            try:
+                step, _, skipped = plan_commit(repo, file_configs, target_branch, state)
+            except Exception as exc:  # this should be tighter
+                step, skipped = None, [(file_config, exc) for file_config in file_configs]
+            if step is not None:
+                steps.append(step)
+            for file_config, exc in skipped:
+                if isinstance(exc, (RemoteDestNotFoundError, RemoteSrcNotFoundError)):
+                    # like apply, a delete or move of a file that's already gone doesn't fail the run
+                    actions_toolkit.warning(f"{exc}")
+                else:
+                    errors.append({"type": "file-plan", "file": str(file_config.dest_file), "error": f"{exc}"})
+
+    return steps, errors
+
+
+@traced(phase="apply")
+def apply_plan_repo(
+    client: Github, repo_name: str, steps: list[dict[str, Any]], fingerprints: SecretFingerprints | None = None
+) -> dict[str, Any]:
+    """Makes the requests of one repo's plan, in order
+
+    The repo isn't fetched or checked again. A step that fails is reported and the rest are still made, like apply.
+    A commit step whose branch has moved since the plan was made fails, rather than overwriting the newer commits
+
+    Returns:
+        Dict[str, Any]: The repo's name, and any errors and commits, like run_repo
+    """
+    result = {"repo": repo_name, "check": True, "diffs": {}, "errors": [], "commits": []}
+    set_trace_attributes(repo=repo_name)
+    applied = []
+    heads = {}
+    for step in steps:
+        set_trace_attributes(resource=step["resource"])
+        try:
+            commit_sha = run_step(client.requester, step, heads)
+        except Exception as exc:  # this should be tighter
+            result["errors"].append(
+                {"type": "plan-step", "resource": step["resource"], "step": step["description"], "error": f"{exc}"}
+            )
+            continue
+        applied.append(step)
+        if commit_sha is not None:
+            result["commits"].append(commit_sha)
+        actions_toolkit.info(f"{repo_name}: {step['description']}")
+
+    if fingerprints is not None:
+        set_trace_attributes(resource="secrets")
+        try:
+            record_planned_fingerprints(client.requester, fingerprints, applied)
+        except Exception as exc:  # this should be tighter
+            actions_toolkit.warning(f"{repo_name}: Unable to record fingerprints of secrets: {exc}")
+    return result
+
+
+def run_plan(
+    client: Github,
+    plan: dict[str, list[dict[str, Any]]],
+    max_workers: int = 8,
+    fingerprints: SecretFingerprints | None = None,
+) -> dict[str, dict[str, Any]]:
+    """Applies a plan, from load_plan, to its repos at once, max_workers at a time
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The result of apply_plan_repo for each repo, keyed by the repo's full name
+    """
+    results = {}
+    if len(plan) == 0:
+        return results
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="repo-manager") as executor:
+        futures = [
+            executor.submit(apply_plan_repo, client, repo_name, steps, fingerprints)
+            for repo_name, steps in plan.items()
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result["repo"]] = result
+            if len(result["errors"]) > 0:
+                actions_toolkit.warning(f"{result['repo']}: {len(result['errors'])} errors during apply-plan")
+            else:
+                actions_toolkit.info(f"{result['repo']}: Apply successful")
+    return dict(sorted(results.items()))
+
+
+@traced(phase="prefetch")
+def prefetch_repo_states(
+    client: Github, repos: list[Repository | str], config: RepoManagerConfig
+) -> dict[str, RepoState]:
+    """Fetch the state the settings, labels, and branch protection checks need for many repos in one GraphQL query
+
+    If the query fails, an empty dict is returned and the checks fall back to fetching from the REST api
+
+    Returns:
+        Dict[str, RepoState]: Each repo's state, keyed by its full name
+    """
+    if config.settings is None and config.labels is None and config.branch_protections is None:
+        return {}
+    branch_names = [] if config.branch_protections is None else [bp.name for bp in config.branch_protections]
+    try:
+        return fetch_repo_states(
+            client, [repo if isinstance(repo, str) else repo.full_name for repo in repos], branch_names
+        )
+    except Exception as exc:  # this should be tighter
+        actions_toolkit.warning(f"Unable to fetch repo state with GraphQL, falling back to the REST api: {exc}")
+        return {}
+
+
+def needs_prefetch(repo: Repository | str, config: RepoManagerConfig, incremental: IncrementalStore | None) -> bool:
+    """If any section prefetch_repo_states fetches for is going to be checked on repo
+
+    Repos only known by name haven't been fetched yet, so it isn't known what incremental would skip for them
+    """
+    if incremental is None or isinstance(repo, str):
+        return True
+    unchanged = incremental.unchanged_sections(repo)
+    return any(
+        getattr(config, section) is not None and section not in unchanged
+        for section in ("settings", "labels", "branch_protections")
+    )
+
+
+@traced()
+def run_repo(
+    client: Github,
+    repo: Repository | str,
+    config: RepoManagerConfig,
+    action: str,
+    state: RepoState | None = None,
+    fingerprints: SecretFingerprints | None = None,
+    plan: bool = False,
+    incremental: IncrementalStore | None = None,
+) -> dict[str, Any]:
+    """Runs the check, and for apply the apply, pipeline on one repo of a fleet
+
+    Errors are collected into the result rather than raised, so one bad repo doesn't stop the rest of the fleet. If
+    plan is set, a check also plans what apply would do, into the result's steps. If incremental is set, the sections
+    of our config that are unchanged since they last matched the repo are skipped, and listed in the result's skipped
+
+    Returns:
+        Dict[str, Any]: The repo's name, check result, diffs, and any apply errors and commits
+    """
+    result = {
+        "repo": repo if isinstance(repo, str) else repo.full_name,
+        "check": False,
+        "diffs": {},
+        "errors": [],
+        "commits": [],
+    }
+    set_trace_attributes(repo=result["repo"])
+    try:
+        if isinstance(repo, str):
+            _, repo = get_repo(client, repo)
+        if state is None:
+            state = RepoState()
+        if incremental is not None:
+            config, result["skipped"] = incremental.config_for(repo, config)
+            if len(result["skipped"]) > 0:
+                actions_toolkit.info(f"{result['repo']}: {', '.join(result['skipped'])} unchanged, skipped")
+        result["check"], result["diffs"] = check_repo(repo, config, state)
+        if action == "apply":
+            result["errors"], result["commits"] = apply_repo(repo, config, result["diffs"], state, fingerprints)
+        elif plan:
+            result["steps"], result["errors"] = plan_repo(repo, config, result["diffs"], state, fingerprints)
+        if incremental is not None and len(result["errors"]) == 0:
+            incremental.record_result(repo, result["diffs"], applied=action == "apply")
+    except Exception as exc:  # this should be tighter
+        result["errors"].append({"type": "repo", "error": f"{exc}"})
+
+    return result
+
+
+def run_fleet(
+    client: Github,
+    repos: Iterable[Repository | str],
+    config: RepoManagerConfig,
+    action: str,
+    max_workers: int = 8,
+    fingerprints: SecretFingerprints | None = None,
+    plan: bool = False,
+    incremental: IncrementalStore | None = None,
+) -> dict[str, dict[str, Any]]:
+    """Runs the check/apply pipeline on many repos at once, sharing one client across a bounded pool of workers
+
+    repos can be a stream, like iter_org_repos, and is consumed as the workers get through it. Repos are prefetched
+    in batches of GRAPHQL_BATCH_SIZE with one GraphQL query each. The next batch is fetched while the workers check
+    the last one, but no further ahead, so a long stream of repos isn't listed and prefetched far ahead of the work.
+    Repos that incremental shows have nothing left to prefetch for are left out of the query
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The result of run_repo for each repo, keyed by the repo's full name
+    """
+    results = {}
+
+    def collect(future: Future):
+        result = future.result()
+        results[result["repo"]] = result
+        if len(result["errors"]) > 0:
+            actions_toolkit.warning(f"{result['repo']}: {len(result['errors'])} errors during {action}")
+        elif action == "apply":
+            actions_toolkit.info(f"{result['repo']}: Apply successful")
+        else:
+            actions_toolkit.info(f"{result['repo']}: {'Check passed' if result['check'] else 'Diff detected'}")
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="repo-manager") as executor:
+        pending = set()
+        repos = iter(repos)
+        while len(batch := list(islice(repos, GRAPHQL_BATCH_SIZE))) > 0:
+            states = prefetch_repo_states(
+                client, [repo for repo in batch if needs_prefetch(repo, config, incremental)], config
+            )
+            pending.update(
+                executor.submit(
+                    run_repo,
+                    client,
+                    repo,
+                    config,
+                    action,
+                    states.get(repo if isinstance(repo, str) else repo.full_name, None),
+                    fingerprints,
+                    plan,
+                    incremental,
+                )
+                for repo in batch
+            )
+            while len(pending) > GRAPHQL_BATCH_SIZE:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+        for future in as_completed(pending):
+            collect(future)
+
+    return dict(sorted(results.items()))
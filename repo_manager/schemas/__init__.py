@@ -1,5 +1,8 @@
+from functools import cached_property
+
 import yaml
 from pydantic import BaseModel  # pylint: disable=E0611
+from pydantic import ConfigDict
 
 from .branch_protection import BranchProtection
 from .file import FileConfig
@@ -16,21 +19,32 @@ def empty_list():
 
 
 class RepoManagerConfig(BaseModel):
+    """A validated settings file
+
+    The config is frozen, so one can be shared by every repo of a fleet run. The dict indexes are built once, on
+    first access, and load_config reads every local src_file up front
+
+    The indexes are cached on the instance, and model_copy copies them as they are, so they go stale if the copy
+    changes their section. Drop them from the copy's __dict__ after such a copy, like IncrementalStore.config_for does
+    """
+
+    model_config = ConfigDict(frozen=True)
+
     settings: Settings | None
     branch_protections: list[BranchProtection] = Field(default_factory=empty_list)
     secrets: list[Secret] = Field(default_factory=empty_list)
     labels: list[Label] = Field(default_factory=empty_list)
     files: list[FileConfig] = Field(default_factory=empty_list)
 
-    @property
+    @cached_property
     def secrets_dict(self):
         return {secret.key: secret for secret in self.secrets} if self.secrets is not None else {}
 
-    @property
+    @cached_property
     def labels_dict(self):
         return {label.expected_name: label for label in self.labels} if self.labels is not None else {}
 
-    @property
+    @cached_property
     def branch_protections_dict(self):
         return (
             {branch_protection.name: branch_protection for branch_protection in self.branch_protections}
@@ -38,10 +52,19 @@ class RepoManagerConfig(BaseModel):
             else {}
         )
 
+    def load_src_files(self):
+        """Reads the contents, and blob sha, of every local src_file, so workers share them rather than each
+        reading the files from disk"""
+        for file_config in self.files or []:
+            if file_config.exists and not file_config.remote_src and file_config.src_file_exists:
+                file_config.load()
+
 
 def load_config(filename: str) -> RepoManagerConfig:
     """Loads a yaml file into a RepoManagerconfig"""
     with open(filename) as fh:
         this_dict = yaml.safe_load(fh)
 
-    return RepoManagerConfig.model_validate(this_dict)
+    config = RepoManagerConfig.model_validate(this_dict)
+    config.load_src_files()
+    return config
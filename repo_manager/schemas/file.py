@@ -1,4 +1,6 @@
 import os
+from functools import cached_property
+from hashlib import sha1
 from pathlib import Path
 from typing import Optional
 
@@ -14,6 +16,14 @@ OptStr = Optional[str]
 OptPath = Optional[Path]
 
 
+def git_blob_sha(contents: str | bytes) -> str:
+    """Compute the sha git gives a blob with these contents, to compare local files to files in a repo without
+    downloading them"""
+    if isinstance(contents, str):
+        contents = contents.encode("utf-8")
+    return sha1(b"blob %d\0" % len(contents) + contents, usedforsecurity=False).hexdigest()
+
+
 class FileConfig(BaseModel):
     exists: OptBool = Field(True, description="Set to false to delete dest_file")
     remote_src: OptBool = Field(False, description="If true, src_file is a remote file")
@@ -62,14 +72,26 @@ class FileConfig(BaseModel):
         """Checks if local file exists"""
         return os.path.exists(self.src_file) if self.src_file is not None else None
 
-    @property
+    @cached_property
     def src_file_contents(self) -> str:
-        """Returns the contents of the local file"""
+        """Returns the contents of the local file. The file is read once, on first access
+
+        Like src_file_sha, it is cached on the instance, so a model_copy that changes src_file has to be loaded again
+        """
         if not self.src_file_exists:
             raise ValueError("Local file does not exist")
         with open(self.src_file) as fh:
             return fh.read()
 
+    @cached_property
+    def src_file_sha(self) -> str:
+        """Returns the git blob sha of the local file's contents"""
+        return git_blob_sha(self.src_file_contents)
+
+    def load(self) -> str:
+        """Reads the local src_file, and works out its blob sha, now rather than on first use. Returns the sha"""
+        return self.src_file_sha
+
     @property
     def commit_key(self) -> str:
         """Returns the commit key for this file_config, a combination of commit msg and target_branch"""
@@ -15,10 +15,21 @@ OptStr = Optional[str]
 class SecretEnvError(Exception): ...
 
 
+def validate_secret_type(v: str) -> str:
+    """Checks a secret type is actions, dependabot, or environments/<name>"""
+    if v in ("actions", "dependabot"):
+        return v
+    environment = v.removeprefix("environments/")
+    if environment == v or environment == "" or "/" in environment:
+        raise ValueError(f"{v} is not a valid secret type, use actions, dependabot, or environments/<name>")
+    return v
+
+
 class Secret(BaseModel):
     type: str = Field(
         "actions",
-        description="Type of secret, can be `dependabot` or `actions` or an `environment` path",
+        description="Type of secret, can be `dependabot` or `actions`, or `environments/<name>` for a deployment "
+        + "environment's secret",
     )
     key: str = Field(None, description="Secret's name.")
     env: OptStr = Field(None, description="Environment variable to pull the secret from")
@@ -29,6 +40,10 @@ class Secret(BaseModel):
     )
     exists: OptBool = Field(True, description="Set to false to delete a secret")
 
+    @field_validator("type")
+    def validate_type(cls, v) -> str:
+        return validate_secret_type(v)
+
     @field_validator("value")
     def validate_value(cls, v, info: ValidationInfo) -> OptStr:
         if v is None:
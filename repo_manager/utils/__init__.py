@@ -1,4 +1,5 @@
 import os
+import re
 from typing import Any
 
 from actions_toolkit import core as actions_toolkit
@@ -7,10 +8,12 @@ from actions_toolkit import core as actions_toolkit
 from itertools import repeat
 
 from repo_manager.gh import get_github_client
+from repo_manager.gh import PoolSettings
+from repo_manager.gh.repos import VISIBILITIES
 
 from ._inputs import INPUTS
 
-VALID_ACTIONS = {"validate": None, "check": None, "apply": None}
+VALID_ACTIONS = {"validate": None, "check": None, "apply": None, "apply-plan": None}
 
 
 def get_inputs() -> dict[str, Any]:
@@ -55,18 +58,55 @@ def validate_inputs(parsed_inputs: dict[str, Any]) -> dict[str, Any]:
             + "is not a valid action in {VALID_ACTIONS.keys()}"
         )
 
-    if not os.path.exists(parsed_inputs["settings_file"]):
+    parsed_inputs["plan_file"] = parsed_inputs.get("plan_file") or None
+    if parsed_inputs["action"] == "apply-plan":
+        # the plan has every request to make, so neither the settings file nor the repos are needed
+        if parsed_inputs["plan_file"] is None or not os.path.exists(parsed_inputs["plan_file"]):
+            actions_toolkit.set_failed(
+                f"Error getting inputs. apply-plan needs the plan_file a check wrote, {parsed_inputs['plan_file']} "
+                + "does not exist"
+            )
+    elif not os.path.exists(parsed_inputs["settings_file"]):
         actions_toolkit.set_failed(
             f"Error while loading RepoManager Config. {parsed_inputs['settings_file']} does not exist"
         )
 
-    if parsed_inputs["repo"] != "self":
+    parsed_inputs["org"] = parsed_inputs.get("org") or None
+    if parsed_inputs["org"] is not None:
+        parsed_inputs["repos"] = None
+        parsed_inputs["repo"] = None
+        parsed_inputs["org_topics"] = parse_repos(parsed_inputs.get("org_topics") or "") or None
+        parsed_inputs["org_visibility"] = (parsed_inputs.get("org_visibility") or "all").lower()
+        if parsed_inputs["org_visibility"] not in VISIBILITIES:
+            actions_toolkit.set_failed(
+                f"Error getting inputs. org_visibility {parsed_inputs['org_visibility']} is not one of "
+                + ", ".join(VISIBILITIES)
+            )
+        parsed_inputs["org_archived"] = (parsed_inputs.get("org_archived") or "false").lower() == "true"
+        parsed_inputs["org_name_regex"] = parsed_inputs.get("org_name_regex") or None
+        if parsed_inputs["org_name_regex"] is not None:
+            try:
+                re.compile(parsed_inputs["org_name_regex"])
+            except re.error as exc:
+                actions_toolkit.set_failed(f"Error getting inputs. org_name_regex is not a valid regex: {exc}")
+    elif parsed_inputs.get("repos"):
+        parsed_inputs["repos"] = parse_repos(parsed_inputs["repos"])
+        for repo_name in parsed_inputs["repos"]:
+            if len(repo_name.split("/")) != 2:
+                actions_toolkit.set_failed(
+                    f"Error while loading RepoManager Config. {repo_name} in repos is not a valid github "
+                    + "repo. Please be sure to enter in the style of 'owner/repo-name' or 'owner/glob'."
+                )
+        parsed_inputs["repo"] = None
+    elif parsed_inputs["repo"] != "self":
+        parsed_inputs["repos"] = None
         if len(parsed_inputs["repo"].split("/")) != 2:
             actions_toolkit.set_failed(
                 f"Error while loading RepoManager Config. {parsed_inputs['repo']} is not a valid github "
                 + "repo. Please be sure to enter in the style of 'owner/repo-name'."
             )
     else:
+        parsed_inputs["repos"] = None
         parsed_inputs["repo"] = os.environ.get("GITHUB_REPOSITORY", None)
         if parsed_inputs["repo"] is None:
             actions_toolkit.set_failed(
@@ -89,9 +129,63 @@ def validate_inputs(parsed_inputs: dict[str, Any]) -> dict[str, Any]:
         api_url = parsed_inputs["github_server_url"] + "/api/v3"
 
     actions_toolkit.debug(f"api_url: {api_url}")
+    parsed_inputs["api_url"] = api_url
+    parsed_inputs["cache_dir"] = parsed_inputs.get("cache_dir") or None
+    parsed_inputs["cache_namespace"] = parsed_inputs.get("cache_namespace") or None
+    parsed_inputs["trace_file"] = parsed_inputs.get("trace_file") or None
+    parsed_inputs["secret_fingerprint_key"] = parsed_inputs.get("secret_fingerprint_key") or None
+    if parsed_inputs["secret_fingerprint_key"] is not None and parsed_inputs["cache_dir"] is None:
+        actions_toolkit.warning("secret_fingerprint_key is set without a cache_dir, every secret will be set")
+        parsed_inputs["secret_fingerprint_key"] = None
+    parsed_inputs["incremental"] = (parsed_inputs.get("incremental") or "false").lower() == "true"
+    if parsed_inputs["incremental"] and parsed_inputs["cache_dir"] is None:
+        actions_toolkit.warning("incremental is set without a cache_dir, every repo will be checked in full")
+        parsed_inputs["incremental"] = False
+
+    try:
+        parsed_inputs["max_workers"] = int(parsed_inputs.get("max_workers") or 8)
+    except ValueError:
+        actions_toolkit.set_failed(f"Error getting inputs. max_workers {parsed_inputs['max_workers']} is not a number")
+    if parsed_inputs["max_workers"] < 1:
+        actions_toolkit.set_failed("Error getting inputs. max_workers must be at least 1")
+
+    pool_settings = {}
+    for input_name, setting, parse in (
+        ("http_pool_size", "pool_size", int),
+        ("http_max_connections_per_host", "max_connections_per_host", int),
+        ("http_connect_timeout", "connect_timeout", float),
+        ("http_read_timeout", "read_timeout", float),
+    ):
+        value = parsed_inputs.get(input_name) or None
+        if value is None:
+            continue
+        try:
+            pool_settings[setting] = parse(value)
+        except ValueError:
+            actions_toolkit.set_failed(f"Error getting inputs. {input_name} {value} is not a number")
+        if pool_settings[setting] <= 0:
+            actions_toolkit.set_failed(f"Error getting inputs. {input_name} must be more than 0")
+    pool_settings["keep_alive"] = (parsed_inputs.get("http_keep_alive") or "true").lower() == "true"
+    parsed_inputs["pool"] = PoolSettings(**pool_settings)
+
+    # in fleet mode, repos are fetched by the workers that manage them, and apply-plan doesn't fetch them at all
+    if (
+        parsed_inputs["repos"] is not None
+        or parsed_inputs["org"] is not None
+        or parsed_inputs["action"] == "apply-plan"
+    ):
+        parsed_inputs["repo_object"] = None
+        return parsed_inputs
 
     try:
-        repo = get_github_client(parsed_inputs["token"], api_url=api_url).get_repo(parsed_inputs["repo"])
+        repo = get_github_client(
+            parsed_inputs["token"],
+            api_url,
+            parsed_inputs["cache_dir"],
+            parsed_inputs["pool"],
+            parsed_inputs["trace_file"] is not None,
+            parsed_inputs["cache_namespace"],
+        ).get_repo(parsed_inputs["repo"])
     except Exception as exc:  # this should be tighter
         actions_toolkit.set_failed(f"Error while retriving {parsed_inputs['repo']} from Github. {exc}")
 
@@ -100,6 +194,19 @@ def validate_inputs(parsed_inputs: dict[str, Any]) -> dict[str, Any]:
     return parsed_inputs
 
 
+def parse_repos(repos: str) -> list[str]:
+    """Parse the repos input, a newline or comma separated list of repos, into a list of repo names
+
+    Duplicates are removed, keeping the first occurence's position
+    """
+    parsed = []
+    for repo_name in repos.replace(",", "\n").splitlines():
+        repo_name = repo_name.strip()
+        if repo_name != "" and repo_name not in parsed:
+            parsed.append(repo_name)
+    return parsed
+
+
 def attr_to_kwarg(attr_name: str, obj: Any, kwargs: dict, transform_key: str = None):
     value = getattr(obj, attr_name, None)
     if value is not None:
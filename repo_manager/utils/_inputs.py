@@ -3,7 +3,7 @@
 ###START_INPUT_AUTOMATION###
 INPUTS = {
     "action": {
-        "description": "What action to take with this action. One of validate, check, or apply. Validate will validate your settings file, but not touch your repo. Check will check your repo with your settings file and output a report of any drift. Apply will apply the settings in your settings file to your repo",
+        "description": "What action to take with this action. One of validate, check, apply, or apply-plan. Validate will validate your settings file, but not touch your repo. Check will check your repo with your settings file and output a report of any drift. Apply will apply the settings in your settings file to your repo. Apply-plan will make the changes in the plan_file a check wrote, without checking again",
         "default": "check",
     },
     "settings_file": {
@@ -18,6 +18,72 @@ INPUTS = {
         "description": "Set a custom github server url for github api operations. Useful if you're running on GHE. Will try to autodiscover from env.GITHUB_SERVER_URL if left at default",
         "default": "none",
     },
+    "repos": {
+        "description": "Newline or comma separated list of repos to run this action against in one invocation, in the style of 'owner/repo-name'. The repo name can be a glob, like 'owner/*' or 'owner/service-*', to match every repo of that owner. When set, repo is ignored and the repos are managed concurrently",
+        "default": "",
+    },
+    "org": {
+        "description": "Organization, or user, to run this action against every repo of, in one invocation. The repos can be narrowed down with the org_ filters, and are managed concurrently as they are listed. When set, repo and repos are ignored",
+        "default": "",
+    },
+    "org_topics": {
+        "description": "Newline or comma separated list of topics. When set, only the org's repos with all of these topics are managed",
+        "default": "",
+    },
+    "org_visibility": {
+        "description": "Only manage the org's repos with this visibility. One of all, public, private, or internal",
+        "default": "all",
+    },
+    "org_archived": {"description": "Set to true to also manage the org's archived repos", "default": "false"},
+    "org_name_regex": {
+        "description": "Regular expression the names of the org's repos to manage must match, like '^service-'",
+        "default": "",
+    },
+    "max_workers": {
+        "description": "How many repos to manage at the same time when repos or org is set",
+        "default": "8",
+    },
+    "http_pool_size": {
+        "description": "How many hosts to keep pools of open connections to the Github api for",
+        "default": "10",
+    },
+    "http_max_connections_per_host": {
+        "description": "Most connections to keep open to each host. Requests past this many at once wait for a free connection rather than opening a new one, so set it to at least max_workers",
+        "default": "32",
+    },
+    "http_keep_alive": {
+        "description": "Set to false to close each connection to the Github api after its request, rather than reusing it for the next one",
+        "default": "true",
+    },
+    "http_connect_timeout": {
+        "description": "Seconds to wait for a connection to the Github api to open",
+        "default": "15",
+    },
+    "http_read_timeout": {"description": "Seconds to wait for the Github api to answer a request", "default": "15"},
+    "cache_dir": {
+        "description": "Directory to cache Github api responses in. When set, repeat requests are sent with their ETag and unchanged responses are replayed from the cache, which does not count against the rate limit. Save and restore this directory with actions/cache to reuse it across runs",
+        "default": "",
+    },
+    "cache_namespace": {
+        "description": "Name to share cache_dir's cached responses under. By default they are kept per token, and a workflow's GITHUB_TOKEN changes every run, so set this to reuse them across runs with it. Cached responses unused for a week are pruned",
+        "default": "",
+    },
+    "secret_fingerprint_key": {
+        "description": "Secret to key HMAC fingerprints of secret values with. When set along with cache_dir, a fingerprint of each secret's value is kept in cache_dir, and apply skips secrets whose value and updated_at haven't changed since it last set them, rather than setting every secret on every run. Pass it from a repository secret",
+        "default": "",
+    },
+    "incremental": {
+        "description": "Set to true to skip the parts of the settings file that haven't changed since they last matched a repo, as long as the repo's updated_at and pushed_at haven't moved either. What matched is kept in cache_dir, so this needs cache_dir. Secrets are only skipped when secret_fingerprint_key is also set",
+        "default": "false",
+    },
+    "trace_file": {
+        "description": "File to write a trace of every Github api request to, as json, with each request's phase, resource, status, latency, size and rate limit cost. An OpenTelemetry (OTLP/JSON) span dump is written next to it, with a .otlp.json suffix",
+        "default": "",
+    },
+    "plan_file": {
+        "description": "File check writes a plan of the changes apply would make to, as json, with every api request to make for each repo. Apply-plan reads the plan from this file and makes those requests. Secrets in the plan are encrypted with each repo's public key, so only GitHub can read them",
+        "default": "",
+    },
     "token": {"description": "What github token to use with this action.", "required": True},
 }
 ###END_INPUT_AUTOMATION###
@@ -0,0 +1,240 @@
+import asyncio
+import json
+
+import pytest
+from github.GithubException import UnknownObjectException
+
+from repo_manager.gh import secrets
+from repo_manager.gh.ratelimit import RequestScheduler
+from repo_manager.gh.state import RepoState
+from repo_manager.schemas import FileConfig
+from repo_manager.schemas import RepoManagerConfig
+from repo_manager.schemas.branch_protection import ProtectionOptions
+from repo_manager.schemas.label import Label
+
+httpx = pytest.importorskip("httpx")
+aio = pytest.importorskip("repo_manager.gh.aio")
+
+API_URL = "https://api.github.com"
+REPO_URL = f"{API_URL}/repos/owner/repo"
+
+
+def repo_json(**settings):
+    return {
+        "name": "repo",
+        "full_name": "owner/repo",
+        "url": REPO_URL,
+        "default_branch": "main",
+        "description": "A repo",
+        "topics": ["python"],
+        "has_issues": True,
+        **settings,
+    }
+
+
+def run_api(routes, coro_func, scheduler=None):
+    """Run coro_func(gh) against routes, path -> response or list of responses, returning its result and the requests
+    that were sent
+
+    Each response is (status, json) or (status, json, headers). A route with a list answers with the next one each time
+    """
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        route = routes.get(f"{request.method} {request.url.path}", (404, {"message": "Not Found"}))
+        if isinstance(route, list):
+            route = route.pop(0)
+        status, payload, headers = route if len(route) == 3 else (*route, {})
+        return httpx.Response(status, json=payload, headers=headers)
+
+    async def run():
+        async with aio.AsyncGithub("token", API_URL, scheduler=scheduler, transport=httpx.MockTransport(handler)) as gh:
+            return await coro_func(gh)
+
+    return asyncio.run(run()), sent
+
+
+def test_request_retries_server_errors():
+    routes = {"GET /repos/owner/repo": [(502, {"message": "Bad Gateway"}), (200, repo_json())]}
+    repo, sent = run_api(routes, lambda gh: gh.get_repo("owner/repo"), RequestScheduler(backoff_base=0.0))
+
+    assert repo.full_name == "owner/repo"
+    assert len(sent) == 2
+
+
+def test_request_raises_github_exceptions():
+    with pytest.raises(UnknownObjectException):
+        run_api({}, lambda gh: gh.get_repo("owner/missing"))
+
+
+def test_paginate():
+    routes = {
+        "GET /repos/owner/repo/actions/secrets": [
+            (200, {"secrets": [{"name": "A"}]}, {"Link": f'<{REPO_URL}/actions/secrets?page=2>; rel="next"'}),
+            (200, {"secrets": [{"name": "B"}]}),
+        ]
+    }
+    items, sent = run_api(routes, lambda gh: gh.paginate(f"{REPO_URL}/actions/secrets", key="secrets"))
+
+    assert [item["name"] for item in items] == ["A", "B"]
+    assert sent[1].url.params["page"] == "2"
+
+
+def test_check_repo():
+    config = RepoManagerConfig(
+        settings={"description": "A repo", "topics": ["python", "async"], "has_issues": True, "default_branch": "main"},
+        labels=[{"name": "bug", "color": "d73a4a"}, {"name": "new"}],
+        branch_protections=[
+            {
+                "name": "main",
+                "protection": {"enforce_admins": True, "pr_options": {"required_approving_review_count": 2}},
+            },
+            {"name": "gone"},
+        ],
+        secrets=[{"key": "A", "value": "a"}, {"key": "OLD", "exists": False}],
+        files=[{"src_file": "README.md", "dest_file": "README.md"}],
+    )
+    routes = {
+        "GET /repos/owner/repo": (200, repo_json()),
+        "GET /repos/owner/repo/labels": (200, [{"name": "bug", "color": "ffffff", "url": f"{REPO_URL}/labels/bug"}]),
+        "GET /repos/owner/repo/branches/main": (
+            200,
+            {"name": "main", "protected": True, "protection_url": f"{REPO_URL}/branches/main/protection"},
+        ),
+        "GET /repos/owner/repo/branches/main/protection": (
+            200,
+            {
+                "url": f"{REPO_URL}/branches/main/protection",
+                "enforce_admins": {"enabled": False},
+                "required_linear_history": {"enabled": False},
+                "allow_force_pushes": {"enabled": False},
+                "allow_deletions": {"enabled": False},
+                "block_creations": {"enabled": False},
+                "required_conversation_resolution": {"enabled": False},
+                "required_signatures": {"enabled": False},
+                "required_pull_request_reviews": {
+                    "dismiss_stale_reviews": False,
+                    "require_code_owner_reviews": False,
+                    "required_approving_review_count": 2,
+                },
+            },
+        ),
+        "GET /repos/owner/repo/actions/secrets": (200, {"secrets": [{"name": "OLD"}]}),
+        "GET /repos/owner/repo/dependabot/secrets": (200, {"secrets": []}),
+        "GET /repos/owner/repo/git/trees/main": (200, {"sha": "tree", "tree": [], "truncated": False}),
+    }
+
+    async def check(gh):
+        state = RepoState()
+        repo = await gh.get_repo("owner/repo")
+        return await aio.check_repo(gh, repo, config, state), state
+
+    ((check_result, diffs), state), sent = run_api(routes, check)
+
+    assert check_result is False
+    assert diffs["settings"] == ["topics -- Expected: '['python', 'async']' Found: '['python']'"]
+    assert diffs["labels"]["missing"] == ["new"]
+    assert list(diffs["labels"]["diffs"].keys()) == ["bug"]
+    assert diffs["branch_protections"]["missing"] == ["gone"]
+    assert list(diffs["branch_protections"]["diffs"].keys()) == ["main"]
+    assert diffs["secrets"] == {"missing": ["A"], "extra": ["OLD"]}
+    assert diffs["files"]["missing"] == ["README.md"]
+    # what the checks fetched is left in state for apply, every request went through the async client
+    assert list(state.branch_objects.keys()) == ["main"]
+    assert list(state.trees.keys()) == ["main"]
+    assert len(sent) == len(routes) + 1
+
+
+def test_check_repos_collects_errors():
+    routes = {"GET /repos/owner/repo": (200, repo_json())}
+    # just the settings, which the repo already has
+    config = RepoManagerConfig(
+        settings={"description": "A repo", "topics": ["python"], "has_issues": True, "default_branch": "main"}
+    ).model_copy(update={"branch_protections": None, "secrets": None, "labels": None, "files": None})
+    results, _ = run_api(routes, lambda gh: aio.check_repos(gh, ["owner/repo", "owner/missing"], config))
+
+    assert results[0] == {"repo": "owner/repo", "check": True, "diffs": {"settings": []}, "errors": [], "commits": []}
+    assert results[1]["repo"] == "owner/missing"
+    assert results[1]["errors"][0]["type"] == "repo"
+
+
+def test_create_secret(mocker):
+    mocker.patch.dict(secrets._PUBLIC_KEYS, clear=True)
+    mocker.patch.object(aio.PublicKey, "encrypt", side_effect=lambda value: f"encrypted-{value}")
+    routes = {
+        "GET /repos/owner/repo/actions/secrets/public-key": (200, {"key_id": "1234", "key": "key"}),
+        "PUT /repos/owner/repo/actions/secrets/A": (201, {}),
+        "PUT /repos/owner/repo/actions/secrets/B": (201, {}),
+    }
+
+    async def create(gh):
+        repo = aio.Repository(gh.requester, {}, repo_json(), completed=True)
+        return [await aio.create_secret(gh, repo, name, "value") for name in ("A", "B")]
+
+    created, sent = run_api(routes, create)
+
+    assert created == [True, True]
+    # the public key is fetched once
+    assert [request.method for request in sent] == ["GET", "PUT", "PUT"]
+    assert json.loads(sent[1].content) == {"key_id": "1234", "encrypted_value": "encrypted-value"}
+
+
+def test_update_label():
+    routes = {
+        "GET /repos/owner/repo/labels/old": (200, {"name": "old", "color": "ffffff", "url": f"{REPO_URL}/labels/old"}),
+        "PATCH /repos/owner/repo/labels/old": (200, {}),
+    }
+
+    async def update(gh):
+        repo = aio.Repository(gh.requester, {}, repo_json(), completed=True)
+        await aio.update_label(gh, repo, Label(name="old", new_name="new"))
+
+    _, sent = run_api(routes, update)
+
+    # the label's color is left as it is
+    assert json.loads(sent[1].content) == {"name": "new", "color": "ffffff"}
+
+
+def test_update_branch_protection():
+    routes = {
+        "PUT /repos/owner/repo/branches/main/protection": (200, {}),
+        "POST /repos/owner/repo/branches/main/protection/required_signatures": (200, {}),
+    }
+    protection = ProtectionOptions(enforce_admins=True, require_signed_commits=True)
+
+    async def update(gh):
+        repo = aio.Repository(gh.requester, {}, repo_json(), completed=True)
+        branch = aio.Branch(
+            gh.requester, {}, {"name": "main", "protection_url": f"{REPO_URL}/branches/main/protection"}
+        )
+        await aio.update_branch_protection(gh, repo, "main", protection, branch)
+
+    _, sent = run_api(routes, update)
+
+    assert [request.method for request in sent] == ["PUT", "POST"]
+    assert json.loads(sent[0].content)["enforce_admins"] is True
+
+
+def test_commit_files():
+    this_config = FileConfig(src_file="README.md", dest_file="README.md", commit_msg="Sync README")
+    routes = {
+        "GET /repos/owner/repo/git/ref/heads/main": (200, {"ref": "refs/heads/main", "object": {"sha": "parent"}}),
+        "GET /repos/owner/repo/git/commits/parent": (200, {"sha": "parent", "tree": {"sha": "tree"}}),
+        "GET /repos/owner/repo/git/trees/tree": (200, {"sha": "tree", "tree": [], "truncated": False}),
+        "POST /repos/owner/repo/git/trees": (201, {"sha": "new-tree"}),
+        "POST /repos/owner/repo/git/commits": (201, {"sha": "new-commit"}),
+        "PATCH /repos/owner/repo/git/refs/heads/main": (200, {}),
+    }
+
+    async def commit(gh):
+        repo = aio.Repository(gh.requester, {}, repo_json(), completed=True)
+        return await aio.commit_files(gh, repo, [this_config], "main")
+
+    (commit_sha, unchanged, skipped), sent = run_api(routes, commit)
+
+    assert commit_sha == "new-commit"
+    assert unchanged == [] and skipped == []
+    assert json.loads(sent[3].content)["tree"][0]["path"] == "README.md"
+    assert json.loads(sent[4].content)["parents"] == ["parent"]
+    assert json.loads(sent[5].content) == {"sha": "new-commit", "force": False}
@@ -0,0 +1,209 @@
+from github.BranchProtection import BranchProtection as GithubBranchProtection
+from github.GithubException import GithubException
+
+from repo_manager.gh import branch_protections
+from repo_manager.gh.branch_protections import check_repo_branch_protections
+from repo_manager.gh.branch_protections import plan_branch_protection
+from repo_manager.gh.branch_protections import protection_changes
+from repo_manager.gh.branch_protections import sync_branch_protection
+from repo_manager.gh.state import RepoState
+from repo_manager.schemas.branch_protection import BranchProtection
+from repo_manager.schemas.branch_protection import ProtectionOptions
+
+
+def test_check_repo_branch_protections_targeted_lookup(mocker):
+    mock_repo = mocker.MagicMock()
+    unprotected = mocker.MagicMock(protected=False)
+
+    def get_branch(name):
+        if name == "missing":
+            raise GithubException(status=404, data={"message": "Branch not found"}, headers={})
+        return unprotected
+
+    mock_repo.get_branch.side_effect = get_branch
+    old_release = mocker.MagicMock()
+    get_protected = mocker.patch.object(
+        branch_protections, "get_protected_branches", return_value={"old-release": old_release, "main": unprotected}
+    )
+
+    config = [
+        BranchProtection(name="main", protection={}),
+        BranchProtection(name="missing", protection={}),
+        BranchProtection(name="old-release", exists=False),
+        BranchProtection(name="never-protected", exists=False),
+    ]
+    state = RepoState()
+    check_result, diffs = check_repo_branch_protections(mock_repo, config, state)
+
+    assert check_result is False
+    assert diffs["missing"] == ["missing"]
+    assert diffs["extra"] == ["old-release"]
+    assert diffs["diffs"] == {"main": ["Branch is not protected"]}
+    assert mock_repo.get_branches.call_count == 0
+    # only the branches that should be protected are looked up directly
+    assert [call.args[0] for call in mock_repo.get_branch.call_args_list] == ["main", "missing"]
+    assert get_protected.call_count == 1
+    # the branches looked up are kept for apply
+    assert state.branch_objects == {"main": unprotected, "old-release": old_release}
+    assert state.get_branch(mock_repo, "old-release") is old_release
+    # and so are the protections compared, for apply to diff against
+    assert state.branches == {"main": None}
+
+
+def make_protection(mocker, **changes):
+    attributes = {
+        "url": "https://api.github.com/repos/owner/repo/branches/main/protection",
+        "required_status_checks": {"strict": True, "contexts": ["lint", "test"]},
+        "enforce_admins": {"enabled": True},
+        "required_pull_request_reviews": {"dismiss_stale_reviews": True, "required_approving_review_count": 2},
+        "required_linear_history": {"enabled": False},
+        "allow_force_pushes": {"enabled": False},
+        "allow_deletions": {"enabled": False},
+        "block_creations": {"enabled": False},
+        "required_conversation_resolution": {"enabled": False},
+        "required_signatures": {"enabled": False},
+        **changes,
+    }
+    return GithubBranchProtection(mocker.MagicMock(), {}, attributes, completed=True)
+
+
+PROTECTION = {
+    "pr_options": {"required_approving_review_count": 2, "dismiss_stale_reviews": True},
+    "required_status_checks": {"strict": True, "checks": ["test", "lint"]},
+    "enforce_admins": True,
+    "require_signed_commits": False,
+}
+
+
+def test_protection_changes(mocker):
+    mock_repo = mocker.MagicMock(organization=None)
+
+    def changes(this_protection, **config):
+        return protection_changes(mock_repo, ProtectionOptions(**{**PROTECTION, **config}), this_protection)
+
+    assert changes(make_protection(mocker)) == []
+    assert changes(make_protection(mocker), required_status_checks={"strict": True, "checks": ["test"]}) == [
+        "required_status_checks"
+    ]
+    assert changes(make_protection(mocker), enforce_admins=False, require_signed_commits=True) == [
+        "enforce_admins",
+        "required_signatures",
+    ]
+    assert changes(make_protection(mocker), pr_options={"required_approving_review_count": 3}) == [
+        "required_pull_request_reviews"
+    ]
+    # options without their own endpoint need the whole protection PUT, which covers the rest but signatures
+    assert changes(make_protection(mocker), require_linear_history=True, enforce_admins=False) == ["protection"]
+    assert changes(make_protection(mocker, required_pull_request_reviews=None)) == ["protection"]
+    assert changes(None, require_signed_commits=True) == ["protection", "required_signatures"]
+    assert changes(None) == ["protection"]
+
+
+def test_sync_branch_protection(mocker):
+    mock_repo = mocker.MagicMock(organization=None)
+    this_branch = mocker.MagicMock()
+    state = RepoState(branches={"main": make_protection(mocker)}, branch_objects={"main": this_branch})
+    put = mocker.patch.object(branch_protections, "update_branch_protection")
+    config = ProtectionOptions(**{**PROTECTION, "pr_options": {"required_approving_review_count": 3}})
+
+    assert sync_branch_protection(mock_repo, "main", config, state) == ["required_pull_request_reviews"]
+    this_branch.edit_required_pull_request_reviews.assert_called_once_with(required_approving_review_count=3)
+    assert this_branch.edit_required_status_checks.call_count == 0
+    assert this_branch.remove_required_signatures.call_count == 0
+    assert put.call_count == 0
+
+    # nothing drifted, so nothing is sent
+    this_branch.reset_mock()
+    assert sync_branch_protection(mock_repo, "main", ProtectionOptions(**PROTECTION), state) == []
+    assert this_branch.method_calls == []
+    assert mock_repo.get_branch.call_count == 0
+
+
+def test_sync_branch_protection_puts_unknown_protections(mocker):
+    mock_repo = mocker.MagicMock(organization=None)
+    put = mocker.patch.object(branch_protections, "update_branch_protection")
+    config = ProtectionOptions(**PROTECTION)
+
+    # not protected yet, signatures are off by default so only the PUT is needed
+    state = RepoState(branches={"main": None})
+    assert sync_branch_protection(mock_repo, "main", config, state) == ["protection"]
+    put.assert_called_once_with(mock_repo, "main", config, mock_repo.get_branch.return_value, update_signatures=False)
+
+    # without a protection to diff against, everything is sent
+    put.reset_mock()
+    assert sync_branch_protection(mock_repo, "main", config, RepoState()) == ["protection", "required_signatures"]
+    put.assert_called_once_with(mock_repo, "main", config, mock_repo.get_branch.return_value)
+
+
+def test_plan_branch_protection(mocker):
+    mock_repo = mocker.MagicMock(organization=None, url="https://api.github.com/repos/owner/repo")
+    state = RepoState(branches={"main": make_protection(mocker)})
+    config = ProtectionOptions(
+        **{**PROTECTION, "pr_options": {"required_approving_review_count": 3}, "enforce_admins": False}
+    )
+
+    steps = plan_branch_protection(mock_repo, "main", config, state)
+
+    url = f"{mock_repo.url}/branches/main/protection"
+    assert [(step["method"], step["url"], step.get("input", None)) for step in steps] == [
+        ("PATCH", f"{url}/required_pull_request_reviews", {"required_approving_review_count": 3}),
+        ("DELETE", f"{url}/enforce_admins", None),
+    ]
+    assert mock_repo.get_branch.call_count == 0
+
+    # an unprotected branch is protected with one PUT of the whole protection
+    steps = plan_branch_protection(
+        mock_repo, "main", ProtectionOptions(**PROTECTION), RepoState(branches={"main": None})
+    )
+    assert [(step["method"], step["url"]) for step in steps] == [("PUT", url)]
+    assert steps[0]["input"]["required_status_checks"] == {"strict": True, "contexts": ["test", "lint"]}
+
+
+def test_restrictions(mocker):
+    mock_repo = mocker.MagicMock(url="https://api.github.com/repos/owner/repo")
+    reviews = {
+        **make_protection(mocker).raw_data["required_pull_request_reviews"],
+        "require_code_owner_reviews": False,
+        "dismissal_restrictions": {"users": [{"login": "octocat", "name": "The Octocat"}], "teams": []},
+    }
+    restrictions = {
+        "users_url": "https://api.github.com/repos/owner/repo/branches/main/protection/restrictions/users",
+        "teams_url": "https://api.github.com/repos/owner/repo/branches/main/protection/restrictions/teams",
+        "users": [{"login": "octocat", "name": "The Octocat"}],
+        "teams": [{"slug": "admins"}],
+    }
+    this_protection = make_protection(mocker, required_pull_request_reviews=reviews, restrictions=restrictions)
+    this_branch = mocker.MagicMock()
+    state = RepoState(branches={"main": this_protection}, branch_objects={"main": this_branch})
+    config = {
+        **PROTECTION,
+        "pr_options": {**PROTECTION["pr_options"], "dismissal_restrictions": {"users": ["octocat"], "teams": []}},
+        "restrictions": {"users": ["octocat"], "teams": ["admins"]},
+    }
+
+    # users are compared by login when checking and when syncing
+    check_result, diffs = check_repo_branch_protections(
+        mock_repo, [BranchProtection(name="main", protection=config)], state
+    )
+    assert diffs["diffs"] == {}
+    assert protection_changes(mock_repo, ProtectionOptions(**config), this_protection) == []
+
+    config["restrictions"] = {"users": ["octocat", "hubot"], "teams": ["admins"]}
+    check_result, diffs = check_repo_branch_protections(
+        mock_repo, [BranchProtection(name="main", protection=config)], state
+    )
+    assert diffs["diffs"] == {"main": ["restrictions::users -- Expected: ['hubot', 'octocat'] Found: ['octocat']"]}
+    assert sync_branch_protection(mock_repo, "main", ProtectionOptions(**config), state) == ["restrictions"]
+    this_branch.replace_user_push_restrictions.assert_called_once_with("octocat", "hubot")
+    this_branch.replace_team_push_restrictions.assert_called_once_with("admins")
+
+    url = f"{mock_repo.url}/branches/main/protection"
+    steps = plan_branch_protection(mock_repo, "main", ProtectionOptions(**config), state)
+    assert [(step["method"], step["url"], step["input"]) for step in steps] == [
+        ("PUT", f"{url}/restrictions/users", {"users": ["octocat", "hubot"]}),
+        ("PUT", f"{url}/restrictions/teams", {"teams": ["admins"]}),
+    ]
+
+    # restrictions can only be added to a branch without them by the PUT of the whole protection
+    this_protection = make_protection(mocker, required_pull_request_reviews=reviews)
+    assert protection_changes(mock_repo, ProtectionOptions(**config), this_protection) == ["protection"]
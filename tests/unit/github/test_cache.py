@@ -0,0 +1,108 @@
+import json
+import os
+import time
+
+from requests import Request
+from requests import Response
+
+from repo_manager.gh.cache import ResponseCache
+from repo_manager.gh.transport import build_github_client
+
+
+def make_response(status_code, body=b"", headers=None):
+    response = Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers or {})
+    return response
+
+
+def prepare(method="GET", url="https://api.github.com/repos/owner/repo"):
+    return Request(method, url, headers={"Authorization": "token 1234"}).prepare()
+
+
+def test_response_cache_replays_not_modified(tmp_path):
+    cache = ResponseCache(tmp_path)
+    sent = []
+
+    def send(request, **kwargs):
+        sent.append(request)
+        if "If-None-Match" in request.headers:
+            return make_response(304, headers={"ETag": '"abc"', "X-RateLimit-Remaining": "4999"})
+        return make_response(200, b'{"name": "repo"}', {"ETag": '"abc"', "X-RateLimit-Remaining": "5000"})
+
+    first = cache(prepare(), send)
+    assert first.status_code == 200
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+    second = cache(prepare(), send)
+    assert sent[1].headers["If-None-Match"] == '"abc"'
+    assert second.status_code == 200
+    assert second.json() == {"name": "repo"}
+    assert second.headers["X-RateLimit-Remaining"] == "4999"
+
+
+def test_response_cache_skips_writes_and_other_tokens(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache(prepare(), lambda request, **kwargs: make_response(200, b"{}", {"ETag": '"abc"'}))
+
+    post = prepare("POST")
+    cache(post, lambda request, **kwargs: make_response(201, b"{}", {"ETag": '"def"'}))
+    assert "If-None-Match" not in post.headers
+
+    other_token = prepare()
+    other_token.headers["Authorization"] = "token 5678"
+    cache(other_token, lambda request, **kwargs: make_response(200, b"{}"))
+    assert "If-None-Match" not in other_token.headers
+
+
+def test_response_cache_namespace(tmp_path):
+    cache = ResponseCache(tmp_path, namespace="owner")
+    cache(prepare(), lambda request, **kwargs: make_response(200, b"{}", {"ETag": '"abc"'}))
+
+    # the next run's token shares the namespace's entries
+    next_run = prepare()
+    next_run.headers["Authorization"] = "token 5678"
+    ResponseCache(tmp_path, namespace="owner")(next_run, lambda request, **kwargs: make_response(304))
+    assert next_run.headers["If-None-Match"] == '"abc"'
+
+    other_namespace = prepare()
+    ResponseCache(tmp_path, namespace="other")(other_namespace, lambda request, **kwargs: make_response(200, b"{}"))
+    assert "If-None-Match" not in other_namespace.headers
+
+
+def test_response_cache_prunes_unused_entries(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache(prepare(), lambda request, **kwargs: make_response(200, b"{}", {"ETag": '"abc"'}))
+    cache(
+        prepare(url="https://api.github.com/repos/owner/old"),
+        lambda r, **kwargs: make_response(200, b"{}", {"ETag": '"d"'}),
+    )
+    (tmp_path / "partial.tmp").write_text("{")
+    week_ago = time.time() - 8 * 24 * 60 * 60
+    for path in tmp_path.iterdir():
+        os.utime(path, (week_ago, week_ago))
+
+    # replaying an entry marks it as used
+    cache(prepare(), lambda request, **kwargs: make_response(304))
+
+    # opening the cache again prunes the rest, so there's nothing left to prune after
+    assert ResponseCache(tmp_path).prune() == 0
+    assert [path.name for path in tmp_path.iterdir()] == [f"{cache.key(prepare())}.json"]
+
+
+def test_build_github_client_uses_middlewares():
+    requested = []
+
+    def middleware(request, send, **kwargs):
+        requested.append(request.url)
+        return make_response(
+            200,
+            json.dumps({"full_name": "owner/repo", "url": "http://localhost/api/v3/repos/owner/repo"}).encode(),
+            {"Content-Type": "application/json"},
+        )
+
+    client = build_github_client("1234", "http://localhost/api/v3", [middleware])
+    repo = client.get_repo("owner/repo")
+    assert repo.full_name == "owner/repo"
+    assert requested == ["http://localhost:80/api/v3/repos/owner/repo"]
@@ -1,9 +1,11 @@
 import pytest
+from github.GithubException import GithubException
 from github.GithubException import UnknownObjectException
 
 from repo_manager.gh import files
 from repo_manager.gh.files import copy_file
 from repo_manager.gh.files import RemoteSrcNotFoundError
+from repo_manager.gh.state import RepoState
 from repo_manager.schemas import FileConfig
 
 VALID_CONFIG = {
@@ -52,8 +54,8 @@ def test_copy_file_update_remote_file(mocker):
 
 
 def test_move_file(mocker):
-    files.copy_file = mocker.MagicMock(return_value="1234")
-    files.delete_file = mocker.MagicMock(return_value="1234")
+    mocker.patch.object(files, "copy_file", return_value="1234")
+    mocker.patch.object(files, "delete_file", return_value="1234")
     this_config = FileConfig(**VALID_CONFIG, target_branch="test")
     copy, delete = files.move_file(mocker.MagicMock(), this_config)
     assert copy == "1234"
@@ -67,3 +69,219 @@ def test_delete_file(mocker):
     this_config = FileConfig(**VALID_CONFIG, target_branch="test")
     result = files.delete_file(mock_repo, this_config)
     assert result == "1234"
+
+
+def mock_tree_repo(mocker, paths):
+    mock_repo = mocker.MagicMock()
+    mock_repo.get_git_tree.return_value = mocker.MagicMock(
+        tree=[mocker.MagicMock(path=path, sha=f"{path}-sha", mode="100644", type="blob") for path in paths],
+        raw_data={"truncated": False},
+    )
+    mock_repo.create_git_commit.return_value = mocker.MagicMock(sha="5678")
+    return mock_repo
+
+
+def test_group_files():
+    configs = [
+        FileConfig(**VALID_CONFIG),
+        FileConfig(**VALID_CONFIG, target_branch="test"),
+        FileConfig(src_file="README.md", dest_file="README.md"),
+    ]
+    groups = files.group_files(configs)
+    assert list(groups.keys()) == ["repo_manager file commit_", "repo_manager file commit_test"]
+    assert groups["repo_manager file commit_"] == [configs[0], configs[2]]
+
+
+def test_commit_files_one_commit(mocker):
+    mock_repo = mock_tree_repo(mocker, ["old", "remote/src", "test"])
+    configs = [
+        FileConfig(**VALID_CONFIG),
+        FileConfig(src_file="README.md", dest_file="old", exists=False),
+        FileConfig(src_file="remote://remote/src", dest_file="remote/dest", remote_src=True, move=True),
+    ]
+    commit_sha, unchanged, skipped = files.commit_files(mock_repo, configs, "main")
+
+    assert commit_sha == "5678"
+    assert skipped == []
+    assert mock_repo.create_git_tree.call_count == 1
+    assert mock_repo.create_git_commit.call_count == 1
+    mock_repo.get_git_ref.assert_called_once_with("heads/main")
+    mock_repo.get_git_ref.return_value.edit.assert_called_once_with("5678")
+    # no per file contents api calls
+    assert mock_repo.get_contents.call_count == 0
+    assert mock_repo.update_file.call_count == 0
+
+    tree = {element._identity["path"]: element._identity for element in mock_repo.create_git_tree.call_args.args[0]}
+    assert tree["test"]["content"] == configs[0].src_file_contents
+    assert tree["old"]["sha"] is None
+    assert tree["remote/dest"]["sha"] == "remote/src-sha"
+    assert tree["remote/src"]["sha"] is None
+
+
+def test_commit_files_skips_missing(mocker):
+    mock_repo = mock_tree_repo(mocker, [])
+    configs = [
+        FileConfig(src_file="README.md", dest_file="old", exists=False),
+        FileConfig(src_file="remote://remote/src", dest_file="remote/dest", remote_src=True, move=True),
+    ]
+    commit_sha, unchanged, skipped = files.commit_files(mock_repo, configs, "main")
+
+    assert commit_sha is None
+    assert isinstance(skipped[0][1], files.RemoteDestNotFoundError)
+    assert isinstance(skipped[1][1], files.RemoteSrcNotFoundError)
+    assert mock_repo.create_git_commit.call_count == 0
+
+
+def test_commit_files_retries_moved_branch(mocker):
+    mock_repo = mock_tree_repo(mocker, [])
+    moved = GithubException(status=422, data={"message": "Update is not a fast forward"}, headers={})
+    mock_repo.get_git_ref.return_value.edit.side_effect = [moved, None]
+
+    commit_sha, unchanged, skipped = files.commit_files(mock_repo, [FileConfig(**VALID_CONFIG)], "main")
+
+    assert commit_sha == "5678"
+    # the ref is read again, and the commit rebuilt on its new head
+    assert mock_repo.get_git_ref.call_count == 2
+    assert mock_repo.create_git_commit.call_count == 2
+
+    mock_repo.get_git_ref.return_value.edit.side_effect = moved
+    with pytest.raises(GithubException):
+        files.commit_files(mock_repo, [FileConfig(**VALID_CONFIG)], "main")
+
+
+def test_commit_files_signed_branch(mocker):
+    mock_repo = mock_tree_repo(mocker, ["old"])
+    mock_repo.default_branch = "main"
+    mock_repo.get_git_ref.return_value.edit.side_effect = GithubException(
+        status=422,
+        data={"message": "Protected branch update failed for refs/heads/main. Commits must have verified signatures."},
+        headers={},
+    )
+    mock_repo.get_contents.side_effect = UnknownObjectException(status=404, data={}, headers={})
+    mock_repo.create_file.return_value = {"commit": mocker.MagicMock(sha="created")}
+    configs = [FileConfig(**VALID_CONFIG), FileConfig(src_file="README.md", dest_file="missing", exists=False)]
+
+    commit_sha, unchanged, skipped = files.commit_files(mock_repo, configs, "main")
+
+    # the files are committed through the contents api, which GitHub signs
+    assert commit_sha == "created"
+    assert mock_repo.create_file.call_args.kwargs == {"branch": "main"}
+    assert isinstance(skipped[0][1], files.RemoteDestNotFoundError)
+    assert mock_repo.get_git_ref.call_count == 1
+
+
+def test_commit_files_reuses_checked_tree(mocker):
+    this_config = FileConfig(**VALID_CONFIG)
+    mock_repo = mock_tree_repo(mocker, ["README.md"])
+    mock_repo.default_branch = "main"
+    state = RepoState()
+    files.check_repo_files(mock_repo, [this_config], state)
+    checked_tree = mock_repo.get_git_tree.return_value
+    checked_tree.sha = "tree-sha"
+
+    mock_repo.get_git_commit.return_value.tree.sha = "tree-sha"
+    commit_sha, unchanged, skipped = files.commit_files(mock_repo, [this_config], "main", state)
+    assert commit_sha == "5678"
+    assert mock_repo.get_git_tree.call_count == 1
+    assert mock_repo.create_git_tree.call_args.args[1] is checked_tree
+
+    # the branch moved since the check, so its tree is fetched again
+    mock_repo.get_git_commit.return_value.tree.sha = "new-tree-sha"
+    files.commit_files(mock_repo, [this_config], "main", state)
+    mock_repo.get_git_tree.assert_called_with("new-tree-sha", recursive=True)
+
+
+def test_plan_commit(mocker):
+    mock_repo = mock_tree_repo(mocker, ["old"])
+    mock_repo.url = "https://api.github.com/repos/owner/repo"
+    mock_repo.get_git_commit.return_value = mocker.MagicMock(sha="parent-sha")
+    mock_repo.get_git_tree.return_value.sha = "tree-sha"
+    mock_repo.get_git_commit.return_value.tree.sha = "tree-sha"
+    configs = [FileConfig(**VALID_CONFIG), FileConfig(src_file="README.md", dest_file="old", exists=False)]
+
+    step, unchanged, skipped = files.plan_commit(mock_repo, configs, "main")
+
+    assert step["commit"]["parent"] == "parent-sha"
+    assert step["commit"]["base_tree"] == "tree-sha"
+    assert step["commit"]["branch"] == "main"
+    tree = {element["path"]: element for element in step["commit"]["tree"]}
+    assert tree["test"]["content"] == configs[0].src_file_contents
+    assert tree["old"]["sha"] is None
+    # nothing is written until the plan is applied
+    assert mock_repo.create_git_tree.call_count == 0
+    assert mock_repo.create_git_commit.call_count == 0
+
+
+def test_git_blob_sha():
+    # matches `echo -n "test" | git hash-object --stdin`
+    assert files.git_blob_sha("test") == "30d74d258442c7c65512eafab474568dd706c430"
+
+
+def test_commit_files_unchanged(mocker):
+    this_config = FileConfig(**VALID_CONFIG)
+    mock_repo = mock_tree_repo(mocker, [])
+    mock_repo.get_git_tree.return_value.tree = [
+        mocker.MagicMock(path="test", sha=files.git_blob_sha(this_config.src_file_contents), mode="100644", type="blob")
+    ]
+    commit_sha, unchanged, skipped = files.commit_files(mock_repo, [this_config], "main")
+
+    assert commit_sha is None
+    assert unchanged == [this_config]
+    assert skipped == []
+    assert mock_repo.create_git_tree.call_count == 0
+    assert mock_repo.get_git_ref.return_value.edit.call_count == 0
+
+
+def test_check_repo_files(mocker):
+    this_config = FileConfig(**VALID_CONFIG)
+    mock_repo = mock_tree_repo(mocker, ["old", "README.md"])
+    mock_repo.default_branch = "main"
+    mock_repo.get_git_tree.return_value.tree.append(
+        mocker.MagicMock(path="same", sha=files.git_blob_sha(this_config.src_file_contents), mode="100644", type="blob")
+    )
+    check_result, diffs = files.check_repo_files(
+        mock_repo,
+        [
+            this_config,
+            FileConfig(src_file=VALID_CONFIG["src_file"], dest_file="same"),
+            FileConfig(src_file="README.md", dest_file="README.md"),
+            FileConfig(src_file="README.md", dest_file="old", exists=False),
+        ],
+    )
+
+    assert check_result is False
+    assert diffs["missing"] == ["test"]
+    assert diffs["extra"] == ["old"]
+    assert list(diffs["diffs"].keys()) == ["README.md"]
+    # one tree request for the default branch
+    assert mock_repo.get_git_tree.call_count == 1
+
+
+def test_check_repo_files_missing_branch(mocker):
+    mock_repo = mocker.MagicMock(default_branch="main")
+    statuses = {"main": 409, "gone": 404}
+
+    def get_git_tree(branch, recursive):
+        raise GithubException(status=statuses[branch], data={}, headers={})
+
+    mock_repo.get_git_tree.side_effect = get_git_tree
+    check_result, diffs = files.check_repo_files(
+        mock_repo,
+        [
+            FileConfig(**VALID_CONFIG),
+            FileConfig(src_file="README.md", dest_file="old", exists=False),
+            FileConfig(src_file="README.md", dest_file="README.md", target_branch="gone"),
+        ],
+    )
+
+    assert check_result is False
+    # the repo is empty, so every file is missing and there's nothing to delete
+    assert diffs["missing"] == ["test"]
+    assert diffs["extra"] == []
+    assert diffs["diffs"] == {"README.md": ["Target branch gone not found"]}
+    # each branch is only tried once
+    assert mock_repo.get_git_tree.call_count == 2
+
+    mock_repo.get_git_tree.side_effect = GithubException(status=500, data={}, headers={})
+    with pytest.raises(GithubException):
+        files.check_repo_files(mock_repo, [FileConfig(**VALID_CONFIG)])
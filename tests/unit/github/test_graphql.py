@@ -0,0 +1,195 @@
+from repo_manager.gh.branch_protections import check_repo_branch_protections
+from repo_manager.gh.branch_protections import protection_changes
+from repo_manager.gh.graphql import build_repo_states_query
+from repo_manager.gh.graphql import fetch_repo_states
+from repo_manager.gh.labels import check_repo_labels
+from repo_manager.gh.settings import check_repo_settings
+from repo_manager.schemas.branch_protection import BranchProtection
+from repo_manager.schemas.branch_protection import ProtectionOptions
+from repo_manager.schemas.label import Label
+from repo_manager.schemas.settings import Settings
+
+RULE = {
+    "requiresApprovingReviews": True,
+    "requiredApprovingReviewCount": 2,
+    "dismissesStaleReviews": True,
+    "requiresCodeOwnerReviews": False,
+    "restrictsReviewDismissals": False,
+    "reviewDismissalAllowances": {"nodes": []},
+    "restrictsPushes": False,
+    "pushAllowances": {"nodes": []},
+    "requiresStatusChecks": True,
+    "requiresStrictStatusChecks": True,
+    "requiredStatusCheckContexts": ["test", "lint"],
+    "isAdminEnforced": True,
+    "requiresLinearHistory": False,
+    "allowsForcePushes": False,
+    "allowsDeletions": False,
+    "blocksCreations": False,
+    "requiresConversationResolution": True,
+    "requiresCommitSignatures": False,
+}
+
+
+def repo_data(name, labels_page=None, **branches):
+    return {
+        "nameWithOwner": f"owner/{name}",
+        "description": "A repo",
+        "homepageUrl": None,
+        "isPrivate": False,
+        "hasIssuesEnabled": True,
+        "hasProjectsEnabled": False,
+        "hasWikiEnabled": False,
+        "defaultBranchRef": {"name": "main"},
+        "squashMergeAllowed": True,
+        "mergeCommitAllowed": False,
+        "rebaseMergeAllowed": True,
+        "deleteBranchOnMerge": True,
+        "repositoryTopics": {"nodes": [{"topic": {"name": "python"}}]},
+        "labels": labels_page
+        or {
+            "pageInfo": {"hasNextPage": False, "endCursor": None},
+            "nodes": [{"name": "bug", "color": "d73a4a", "description": "Something isn't working"}],
+        },
+        **branches,
+    }
+
+
+def mock_client(mocker, data, label_pages=()):
+    client = mocker.MagicMock()
+    client.requester.base_url = "https://api.github.com"
+    client.requester.requestJsonAndCheck.return_value = ({}, {"data": data})
+    client.requester.graphql_query.side_effect = [
+        ({}, {"data": {"repository": {"labels": page}}}) for page in label_pages
+    ]
+    return client
+
+
+def test_build_repo_states_query():
+    query = build_repo_states_query(2, 1)
+    assert "$owner0: String!, $name0: String!, $owner1: String!, $name1: String!, $branch0: String!" in query
+    assert query.count("branch0: ref(qualifiedName: $branch0)") == 2
+    assert "fragment RefFields on Ref" in query
+
+
+def test_fetch_repo_states(mocker):
+    client = mock_client(
+        mocker,
+        {
+            "repo0": repo_data("a", branch0={"name": "main", "branchProtectionRule": RULE}),
+            # the token can't see this repo, it is left for the REST api
+            "repo1": None,
+            "repo2": repo_data("c", branch0={"name": "main", "branchProtectionRule": None}, branch1=None),
+        },
+    )
+    states = fetch_repo_states(client, ["owner/a", "owner/b", "owner/c"], ["main", "release"])
+
+    assert list(states.keys()) == ["owner/a", "owner/c"]
+    variables = client.requester.requestJsonAndCheck.call_args.kwargs["input"]["variables"]
+    assert variables["owner1"] == "owner" and variables["name1"] == "b"
+    assert variables["branch1"] == "refs/heads/release"
+
+    state = states["owner/a"]
+    assert state.settings["topics"] == ["python"]
+    assert state.settings["default_branch"] == "main"
+    assert "has_downloads" not in state.settings
+    assert state.labels["bug"].color == "d73a4a"
+    assert state.labels["bug"].url == "https://api.github.com/repos/owner/a/labels/bug"
+    protection = state.branches["main"]
+    assert protection.required_pull_request_reviews.required_approving_review_count == 2
+    assert protection.required_status_checks.contexts == ["test", "lint"]
+    assert protection.raw_data["required_conversation_resolution"]["enabled"] is True
+
+    assert states["owner/c"].branches == {"main": None}
+
+
+def test_fetch_repo_states_pages_labels(mocker):
+    first_page = {
+        "pageInfo": {"hasNextPage": True, "endCursor": "abc"},
+        "nodes": [{"name": "bug", "color": "d73a4a", "description": None}],
+    }
+    second_page = {
+        "pageInfo": {"hasNextPage": False, "endCursor": None},
+        "nodes": [{"name": "docs", "color": "0075ca", "description": None}],
+    }
+    client = mock_client(mocker, {"repo0": repo_data("a", labels_page=first_page)}, [second_page])
+    states = fetch_repo_states(client, ["owner/a"], [])
+    assert list(states["owner/a"].labels.keys()) == ["bug", "docs"]
+    assert client.requester.graphql_query.call_args.args[1]["after"] == "abc"
+
+
+def test_checks_use_prefetched_state(mocker):
+    client = mock_client(
+        mocker,
+        {"repo0": repo_data("a", branch0={"name": "main", "branchProtectionRule": RULE}, branch1=None)},
+    )
+    state = fetch_repo_states(client, ["owner/a"], ["main", "release"])["owner/a"]
+    mock_repo = mocker.MagicMock(has_downloads=True)
+
+    check_result, drift = check_repo_settings(
+        mock_repo, Settings(topics=["python"], has_wiki=True, has_downloads=True), state
+    )
+    assert check_result is False
+    assert "has_wiki -- Expected: 'True' Found: 'False'" in drift
+    # has_downloads isn't in GraphQL, so it's read from the repo
+    assert not any(d.startswith("has_downloads") or d.startswith("topics") for d in drift)
+
+    check_result, diffs = check_repo_labels(mock_repo, [Label(name="bug", color="#d73a4a"), Label(name="docs")], state)
+    assert diffs["missing"] == ["docs"]
+    assert diffs["diffs"] == {}
+
+    check_result, diffs = check_repo_branch_protections(
+        mock_repo,
+        [
+            BranchProtection(
+                name="main",
+                protection={
+                    "pr_options": {"required_approving_review_count": 3},
+                    "required_status_checks": {"strict": True, "checks": ["lint", "test"]},
+                },
+            ),
+            BranchProtection(name="release", protection={}),
+        ],
+        state,
+    )
+    assert diffs["missing"] == ["release"]
+    assert diffs["diffs"] == {"main": ["required_approving_review_count -- Expected: 3 Found: 2"]}
+
+    # has_downloads was read from the repo, and kept for apply
+    assert state.settings["has_downloads"] is True
+    assert (
+        state.branch_objects["main"].protection_url == "https://api.github.com/repos/owner/a/branches/main/protection"
+    )
+
+    # everything else came from the prefetched state
+    assert mock_repo.get_topics.call_count == 0
+    assert mock_repo.get_labels.call_count == 0
+    assert mock_repo.get_branch.call_count == 0
+
+
+def test_prefetched_push_restrictions(mocker):
+    rule = {
+        **RULE,
+        "restrictsPushes": True,
+        "pushAllowances": {
+            "nodes": [
+                {"actor": {"__typename": "User", "login": "alice"}},
+                {"actor": {"__typename": "Team", "slug": "admins"}},
+                {"actor": {"__typename": "App", "slug": "deploy-bot"}},
+            ]
+        },
+    }
+    client = mock_client(mocker, {"repo0": repo_data("a", branch0={"name": "main", "branchProtectionRule": rule})})
+    state = fetch_repo_states(client, ["owner/a"], ["main"])["owner/a"]
+    mock_repo = mocker.MagicMock()
+    protection = {
+        "pr_options": {"required_approving_review_count": 2},
+        "required_status_checks": {"strict": True, "checks": ["lint", "test"]},
+        "restrictions": {"users": ["alice"], "teams": ["admins"]},
+    }
+
+    check_result, diffs = check_repo_branch_protections(
+        mock_repo, [BranchProtection(name="main", protection=protection)], state
+    )
+    assert diffs["diffs"] == {}
+    assert protection_changes(mock_repo, ProtectionOptions(**protection), state.branches["main"]) == []
@@ -0,0 +1,88 @@
+from datetime import datetime
+from datetime import timezone
+
+from repo_manager.gh.incremental import clean
+from repo_manager.gh.incremental import config_fingerprints
+from repo_manager.gh.incremental import IncrementalStore
+from repo_manager.schemas import RepoManagerConfig
+
+CONFIG = {
+    "settings": {"has_wiki": True},
+    "labels": [{"name": "bug", "color": "#d73a4a"}],
+    "secrets": [{"key": "TOKEN", "value": "hunter2"}],
+    "files": [{"src_file": "README.md", "dest_file": "README.md"}],
+}
+
+
+def mock_repo(mocker, updated_at=1, pushed_at=1):
+    return mocker.MagicMock(
+        full_name="owner/repo",
+        updated_at=datetime(2024, 1, 1, 0, 0, updated_at, tzinfo=timezone.utc),
+        pushed_at=datetime(2024, 1, 1, 0, 0, pushed_at, tzinfo=timezone.utc),
+    )
+
+
+def test_config_fingerprints():
+    fingerprints = config_fingerprints(RepoManagerConfig(**CONFIG), "key")
+    assert list(fingerprints.keys()) == ["settings", "secrets", "labels", "branch_protections", "files"]
+
+    changed = config_fingerprints(
+        RepoManagerConfig(**{**CONFIG, "labels": [{"name": "bug", "color": "#000000"}]}), "key"
+    )
+    assert [section for section in fingerprints if fingerprints[section] != changed[section]] == ["labels"]
+    # a secret's value changing changes the secrets' fingerprint, which is keyed, so it can't be guessed
+    changed = config_fingerprints(RepoManagerConfig(**{**CONFIG, "secrets": [{"key": "TOKEN", "value": "x"}]}), "key")
+    assert changed["secrets"] != fingerprints["secrets"]
+    assert config_fingerprints(RepoManagerConfig(**CONFIG), "other")["secrets"] != fingerprints["secrets"]
+    # without a key, secrets aren't fingerprinted, so they're always checked
+    assert "secrets" not in config_fingerprints(RepoManagerConfig(**CONFIG))
+
+
+def test_clean():
+    assert clean(None)
+    assert clean({"missing": [], "extra": [], "diffs": {}})
+    assert not clean({"missing": ["bug"], "extra": [], "diffs": {}})
+    assert not clean(["has_wiki: False != True"])
+
+
+def test_incremental_store(mocker, tmp_path):
+    fingerprints = config_fingerprints(RepoManagerConfig(**CONFIG), "key")
+    store = IncrementalStore(tmp_path / "incremental.json", fingerprints)
+    repo = mock_repo(mocker)
+    assert store.unchanged_sections(repo) == []
+
+    # a check can't tell what secrets are set to, and labels drifted, so neither is recorded
+    store.record_result(repo, {"labels": {"missing": ["bug"], "extra": [], "diffs": {}}}, applied=False)
+    assert store.unchanged_sections(repo) == ["settings", "branch_protections", "files"]
+    config, skipped = store.config_for(repo, RepoManagerConfig(**CONFIG))
+    assert skipped == ["settings", "branch_protections", "files"]
+    assert config.settings is None and config.files is None
+    assert config.labels is not None
+
+    # an index read before the copy doesn't bring a skipped section back
+    store.record(repo, ["labels"])
+    full_config = RepoManagerConfig(**CONFIG)
+    assert list(full_config.labels_dict.keys()) == ["bug"]
+    config, skipped = store.config_for(repo, full_config)
+    assert config.labels is None
+    assert config.labels_dict == {}
+    assert list(full_config.labels_dict.keys()) == ["bug"]
+
+    # an apply without errors records every section
+    store.record_result(repo, {}, applied=True)
+    store.save()
+    store = IncrementalStore(tmp_path / "incremental.json", fingerprints)
+    assert store.unchanged_sections(repo) == ["settings", "secrets", "labels", "branch_protections", "files"]
+
+    # once the repo changes, only the secrets, which don't move its markers, are still skipped
+    assert store.unchanged_sections(mock_repo(mocker, updated_at=2)) == ["secrets"]
+    assert store.unchanged_sections(mock_repo(mocker, pushed_at=2)) == ["secrets"]
+
+    # as is every section of the config that changed
+    changed = config_fingerprints(RepoManagerConfig(**{**CONFIG, "settings": {"has_wiki": False}}), "key")
+    assert IncrementalStore(tmp_path / "incremental.json", changed).unchanged_sections(repo) == [
+        "secrets",
+        "labels",
+        "branch_protections",
+        "files",
+    ]
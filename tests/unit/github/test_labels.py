@@ -0,0 +1,92 @@
+from github import GithubObject
+
+from repo_manager.gh.labels import plan_labels
+from repo_manager.gh.labels import reconcile_labels
+from repo_manager.gh.labels import update_label
+from repo_manager.gh.state import RepoState
+from repo_manager.schemas.label import Label
+
+
+def test_update_label_keeps_description(mocker):
+    this_label = mocker.MagicMock(color="ffffff", description="Something isn't working")
+    mock_repo = mocker.MagicMock()
+
+    update_label(mock_repo, Label(name="bug", color="#d73a4a"), this_label)
+
+    this_label.edit.assert_called_once_with("bug", "d73a4a", GithubObject.NotSet)
+    assert mock_repo.get_label.call_count == 0
+
+
+def test_reconcile_labels(mocker):
+    repo_labels = {name: mocker.MagicMock(color="ffffff", description=None) for name in ("old", "docs", "wontfix")}
+    mock_repo = mocker.MagicMock()
+    config_labels = {
+        label.expected_name: label
+        for label in [
+            Label(name="old", new_name="renamed"),
+            Label(name="bug", color="#d73a4a", description="Broken"),
+            Label(name="docs", color="#0075ca"),
+            Label(name="wontfix", exists=False),
+        ]
+    }
+    labels_diff = {"missing": ["renamed", "bug"], "extra": ["wontfix"], "diffs": {"docs": ["color"]}}
+
+    errors = reconcile_labels(mock_repo, config_labels, labels_diff, RepoState(labels=repo_labels), max_workers=2)
+
+    assert errors == []
+    repo_labels["wontfix"].delete.assert_called_once_with()
+    repo_labels["old"].edit.assert_called_once_with("renamed", "ffffff", GithubObject.NotSet)
+    repo_labels["docs"].edit.assert_called_once_with("docs", "0075ca", GithubObject.NotSet)
+    mock_repo.create_label.assert_called_once_with("bug", "d73a4a", "Broken")
+    # the labels from the check were reused
+    assert mock_repo.get_label.call_count == 0
+    assert mock_repo.get_labels.call_count == 0
+
+
+def test_reconcile_labels_collects_errors(mocker):
+    docs = mocker.MagicMock(color="ffffff", description=None)
+    docs.edit.side_effect = Exception("Validation Failed")
+    mock_repo = mocker.MagicMock()
+    mock_repo.get_labels.return_value = [mocker.MagicMock(), docs]
+    mock_repo.get_labels.return_value[1].name = "docs"
+    mock_repo.create_label.side_effect = Exception("Already exists")
+    config_labels = {label.expected_name: label for label in [Label(name="bug"), Label(name="docs", color="#0075ca")]}
+
+    errors = reconcile_labels(mock_repo, config_labels, {"missing": ["bug"], "extra": [], "diffs": {"docs": []}})
+
+    assert errors == [
+        {"type": "label-create", "name": "bug", "error": "Already exists"},
+        {"type": "label-update", "name": "docs", "error": "Validation Failed"},
+    ]
+    # without labels from the check, they are listed once
+    assert mock_repo.get_labels.call_count == 1
+    assert mock_repo.get_label.call_count == 0
+
+
+def test_plan_labels(mocker):
+    repo_labels = {name: mocker.MagicMock(color="ffffff", description=None) for name in ("old", "docs", "wontfix")}
+    mock_repo = mocker.MagicMock(url="https://api.github.com/repos/owner/repo")
+    config_labels = {
+        label.expected_name: label
+        for label in [
+            Label(name="old", new_name="renamed"),
+            Label(name="good first issue", color="#7057ff", description="Good for newcomers"),
+            Label(name="docs", color="#0075ca"),
+            Label(name="wontfix", exists=False),
+        ]
+    }
+    labels_diff = {"missing": ["renamed", "good first issue"], "extra": ["wontfix"], "diffs": {"docs": ["color"]}}
+
+    steps = plan_labels(mock_repo, config_labels, labels_diff, RepoState(labels=repo_labels))
+
+    assert [(step["method"], step["url"], step.get("input", None)) for step in steps] == [
+        ("DELETE", f"{mock_repo.url}/labels/wontfix", None),
+        ("PATCH", f"{mock_repo.url}/labels/old", {"new_name": "renamed", "color": "ffffff"}),
+        (
+            "POST",
+            f"{mock_repo.url}/labels",
+            {"name": "good first issue", "color": "7057ff", "description": "Good for newcomers"},
+        ),
+        ("PATCH", f"{mock_repo.url}/labels/docs", {"new_name": "docs", "color": "0075ca"}),
+    ]
+    assert mock_repo.get_labels.call_count == 0
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+from github.GithubException import GithubException
+
+from repo_manager.gh.plan import commit_step
+from repo_manager.gh.plan import load_plan
+from repo_manager.gh.plan import PlanError
+from repo_manager.gh.plan import request_step
+from repo_manager.gh.plan import run_step
+from repo_manager.gh.plan import write_plan
+
+
+def test_plan_round_trip(tmp_path):
+    steps = [request_step("labels", "Delete bug", "DELETE", "https://api.github.com/repos/owner/repo/labels/bug")]
+    write_plan(tmp_path / "plans" / "plan.json", {"owner/repo": steps, "owner/empty": []})
+
+    assert load_plan(tmp_path / "plans" / "plan.json") == {"owner/empty": [], "owner/repo": steps}
+    assert [path.name for path in (tmp_path / "plans").iterdir()] == ["plan.json"]
+
+
+def test_load_plan_checks_version(tmp_path):
+    (tmp_path / "old.json").write_text(json.dumps({"version": 0, "repos": {}}))
+    with pytest.raises(PlanError):
+        load_plan(tmp_path / "old.json")
+
+    (tmp_path / "bad.json").write_text("not json")
+    with pytest.raises(PlanError):
+        load_plan(tmp_path / "bad.json")
+
+
+def test_run_step_chains_commits(mocker):
+    url = "https://api.github.com/repos/owner/repo"
+    requester = mocker.MagicMock()
+    requester.requestJsonAndCheck.side_effect = [
+        ({}, {"sha": "tree-1"}),
+        ({}, {"sha": "commit-1"}),
+        ({}, {}),
+        ({}, {"sha": "tree-2"}),
+        ({}, {"sha": "commit-2"}),
+        ({}, {}),
+    ]
+    tree = [{"path": "README.md", "mode": "100644", "type": "blob", "content": "hello"}]
+    heads = {}
+
+    assert (
+        run_step(requester, commit_step("first", url, "main", "head", "head-tree", "first", tree), heads) == "commit-1"
+    )
+    assert run_step(requester, commit_step("second", url, "main", "head", "head-tree", "second", tree), heads) == (
+        "commit-2"
+    )
+
+    calls = requester.requestJsonAndCheck.call_args_list
+    assert calls[0].args == ("POST", f"{url}/git/trees")
+    assert calls[0].kwargs["input"]["base_tree"] == "head-tree"
+    assert calls[1].kwargs["input"]["parents"] == ["head"]
+    assert calls[2].args == ("PATCH", f"{url}/git/refs/heads/main")
+    # the ref is only ever fast forwarded, so a branch that moved since the plan isn't overwritten
+    assert calls[2].kwargs["input"] == {"sha": "commit-1", "force": False}
+    # the second commit to the branch is made on top of the first
+    assert calls[3].kwargs["input"]["base_tree"] == "tree-1"
+    assert calls[4].kwargs["input"]["parents"] == ["commit-1"]
+
+
+def test_run_step_unprotected_branch(mocker):
+    url = "https://api.github.com/repos/owner/repo/branches/main/protection"
+    requester = mocker.MagicMock()
+    requester.requestJsonAndCheck.side_effect = GithubException(status=404, data={"message": "Not Found"}, headers={})
+
+    # the branch isn't protected, so there's no protection left to remove
+    assert run_step(requester, request_step("branch_protections", "Remove main's protection", "DELETE", url)) is None
+
+    with pytest.raises(GithubException):
+        run_step(requester, request_step("labels", "Delete bug", "DELETE", "https://api.github.com/labels/bug"))
+    with pytest.raises(GithubException):
+        run_step(requester, request_step("branch_protections", "Protect main", "PUT", url, input={}))
@@ -0,0 +1,135 @@
+import time
+
+import pytest
+from requests import Request
+from requests import Response
+from requests.exceptions import ConnectionError
+
+from repo_manager.gh import ratelimit
+from repo_manager.gh.ratelimit import RequestScheduler
+from repo_manager.gh.ratelimit import rate_limit_resource
+
+
+def make_response(status_code, body=b"", headers=None):
+    response = Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers or {})
+    return response
+
+
+def prepare(method="GET", url="https://api.github.com/repos/owner/repo"):
+    return Request(method, url).prepare()
+
+
+def sequence_send(*responses):
+    """A send that returns (or raises) responses in order"""
+    sent = []
+
+    def send(request, **kwargs):
+        result = responses[len(sent)]
+        sent.append(request)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    send.sent = sent
+    return send
+
+
+@pytest.fixture
+def scheduler(mocker):
+    mocker.patch.object(ratelimit.actions_toolkit, "warning")
+    return RequestScheduler(max_concurrency=10, sleep=mocker.Mock())
+
+
+def test_rate_limit_resource():
+    assert rate_limit_resource(prepare()) == "core"
+    assert rate_limit_resource(prepare("POST", "https://api.github.com/graphql")) == "graphql"
+    assert rate_limit_resource(prepare(url="https://api.github.com/search/repositories?q=org:owner")) == "search"
+
+
+def test_concurrency_shrinks_as_budget_drains(scheduler):
+    assert scheduler.concurrency() == 10
+    send = sequence_send(
+        make_response(
+            200,
+            headers={"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "1000", "X-RateLimit-Reset": "0"},
+        )
+    )
+    scheduler(prepare(), send)
+    assert scheduler.budgets["core"] == (5000, 1000, 0.0)
+    assert scheduler.concurrency() == 2
+    assert scheduler.concurrency("search") == 10
+
+    scheduler.budgets["core"] = (5000, 0, 0.0)
+    assert scheduler.concurrency() == 1
+
+
+def test_scheduler_pauses_when_budget_is_spent(scheduler):
+    reset = time.time() + 30
+    send = sequence_send(
+        make_response(
+            200,
+            headers={"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset)},
+        )
+    )
+    scheduler(prepare(), send)
+    assert scheduler._paused_until >= reset
+
+
+def test_scheduler_retries_retry_after(scheduler, mocker):
+    pause = mocker.patch.object(scheduler, "pause")
+    send = sequence_send(
+        make_response(403, b'{"message": "You have exceeded a secondary rate limit"}', {"Retry-After": "7"}),
+        make_response(200),
+    )
+    response = scheduler(prepare("POST"), send)
+    assert response.status_code == 200
+    assert len(send.sent) == 2
+    pause.assert_called_once_with(7.0, "Github core rate limited")
+
+
+def test_scheduler_retries_secondary_rate_limit(scheduler, mocker):
+    pause = mocker.patch.object(scheduler, "pause")
+    send = sequence_send(
+        make_response(403, b'{"message": "You have exceeded a secondary rate limit"}'),
+        make_response(200),
+    )
+    assert scheduler(prepare(), send).status_code == 200
+    pause.assert_called_once_with(ratelimit.SECONDARY_RATE_LIMIT_WAIT, "Github core rate limited")
+
+
+def test_scheduler_does_not_retry_forbidden(scheduler):
+    send = sequence_send(make_response(403, b'{"message": "Resource not accessible by integration"}'))
+    assert scheduler(prepare(), send).status_code == 403
+    assert len(send.sent) == 1
+
+
+def test_scheduler_backs_off_server_errors(scheduler):
+    send = sequence_send(make_response(502), make_response(503), make_response(200))
+    assert scheduler(prepare(), send).status_code == 200
+    assert scheduler.sleep.call_count == 2
+
+
+def test_scheduler_does_not_retry_non_idempotent_server_errors(scheduler):
+    send = sequence_send(make_response(502))
+    assert scheduler(prepare("POST"), send).status_code == 502
+    assert scheduler.sleep.call_count == 0
+
+
+def test_scheduler_retries_connection_errors(scheduler):
+    send = sequence_send(ConnectionError("reset"), make_response(200))
+    assert scheduler(prepare(), send).status_code == 200
+
+    send = sequence_send(ConnectionError("reset"))
+    with pytest.raises(ConnectionError):
+        scheduler(prepare("POST"), send)
+
+
+def test_scheduler_gives_up_after_max_retries(scheduler):
+    scheduler.max_retries = 2
+    send = sequence_send(make_response(502), make_response(502), make_response(502))
+    assert scheduler(prepare(), send).status_code == 502
+    assert len(send.sent) == 3
+    assert scheduler._in_flight == 0
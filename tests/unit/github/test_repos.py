@@ -0,0 +1,75 @@
+from github.GithubException import UnknownObjectException
+
+from repo_manager.gh import repos
+from repo_manager.gh.repos import iter_org_repos
+from repo_manager.gh.repos import resolve_repos
+from repo_manager.gh.repos import search_query
+
+
+def mock_repo(mocker, full_name):
+    repo = mocker.MagicMock(full_name=full_name)
+    # name is a reserved argument of MagicMock, so it has to be set after creation
+    repo.name = full_name.split("/")[1]
+    return repo
+
+
+def test_resolve_repos_glob(mocker):
+    client = mocker.MagicMock()
+    client.get_organization.return_value.get_repos.return_value = [
+        mock_repo(mocker, f"owner/{name}") for name in ["service-a", "service-b", "docs"]
+    ]
+    resolved = list(resolve_repos(client, ["owner/service-*", "owner/service-a", "other/repo"]))
+    assert [repo.full_name for repo in resolved[:2]] == ["owner/service-a", "owner/service-b"]
+    assert resolved[2:] == ["other/repo"]
+
+
+def test_resolve_repos_user_glob(mocker):
+    client = mocker.MagicMock()
+    client.get_organization.side_effect = UnknownObjectException(status=404, data={}, headers={})
+    client.get_user.return_value.get_repos.return_value = [mock_repo(mocker, "user/repo")]
+    resolved = list(resolve_repos(client, ["user/*"]))
+    assert [repo.full_name for repo in resolved] == ["user/repo"]
+
+
+def test_search_query():
+    assert search_query("owner") == "user:owner fork:true archived:false"
+    assert search_query("owner", ["python", "actions"], "private", archived=True) == (
+        "user:owner fork:true topic:python topic:actions is:private"
+    )
+
+
+def test_iter_org_repos(mocker):
+    client = mocker.MagicMock()
+    client.requester.requestJsonAndCheck.return_value = ({}, {"total_count": 3, "items": []})
+    paginated_list = mocker.patch.object(
+        repos,
+        "PaginatedList",
+        return_value=[mock_repo(mocker, f"owner/{name}") for name in ["service-a", "docs", "service-b"]],
+    )
+
+    matched = list(iter_org_repos(client, "owner", topics=["python"], name_regex="^service-"))
+    assert [repo.full_name for repo in matched] == ["owner/service-a", "owner/service-b"]
+    client.requester.requestJsonAndCheck.assert_called_once_with(
+        "GET",
+        "/search/repositories",
+        parameters={"q": "user:owner fork:true topic:python archived:false", "per_page": 100},
+    )
+    # the rest of the pages carry on from the first
+    assert paginated_list.call_args.kwargs["firstData"] == {"total_count": 3, "items": []}
+    assert client.get_organization.call_count == 0
+
+
+def test_iter_org_repos_lists_past_search_limit(mocker):
+    client = mocker.MagicMock()
+    client.requester.requestJsonAndCheck.return_value = ({}, {"total_count": 1500, "items": []})
+    warning = mocker.patch.object(repos.actions_toolkit, "warning")
+    listed = [mock_repo(mocker, f"owner/repo-{i}") for i in range(4)]
+    for i, repo in enumerate(listed):
+        repo.topics = ["python"] if i % 2 == 0 else []
+        repo.visibility = "private"
+        repo.archived = i == 2
+    client.get_organization.return_value.get_repos.return_value = listed
+
+    matched = list(iter_org_repos(client, "owner", topics=["python"], visibility="private"))
+    assert [repo.full_name for repo in matched] == ["owner/repo-0"]
+    warning.assert_called_once()
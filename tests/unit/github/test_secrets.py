@@ -0,0 +1,241 @@
+import pytest
+
+from repo_manager.gh import secrets
+from repo_manager.gh.secrets import check_repo_secrets
+from repo_manager.gh.secrets import create_secret
+from repo_manager.gh.secrets import delete_secret
+from repo_manager.gh.secrets import encrypt_secrets
+from repo_manager.gh.secrets import iter_repo_secrets
+from repo_manager.gh.secrets import plan_secrets
+from repo_manager.gh.secrets import record_planned_fingerprints
+from repo_manager.gh.secrets import SecretFingerprints
+from repo_manager.gh.secrets import sync_secrets
+from repo_manager.gh.state import RepoState
+from repo_manager.schemas.secret import Secret
+
+
+def mock_repo(mocker, url):
+    mock_repo = mocker.MagicMock(url=url)
+    mock_repo._requester.requestJsonAndCheck.return_value = ({}, {"key_id": "1234", "key": "key"})
+    mock_repo._requester.requestJson.return_value = (201, {}, "")
+    return mock_repo
+
+
+def test_public_key_is_cached(mocker):
+    mocker.patch.dict(secrets._PUBLIC_KEYS, clear=True)
+    mocker.patch.object(secrets.PublicKey, "encrypt", side_effect=lambda value: f"encrypted-{value}")
+    this_repo = mock_repo(mocker, "https://api.github.com/repos/owner/repo")
+
+    for secret_name in ["A", "B", "C"]:
+        assert create_secret(this_repo, secret_name, "value")
+    create_secret(this_repo, "D", "value", secret_type="dependabot")
+
+    # one public key fetch for actions, one for dependabot
+    assert this_repo._requester.requestJsonAndCheck.call_count == 2
+    assert this_repo._requester.requestJson.call_count == 4
+
+    # another client fetches its own keys
+    other_repo = mock_repo(mocker, "https://api.github.com/repos/owner/repo")
+    create_secret(other_repo, "A", "value")
+    assert other_repo._requester.requestJsonAndCheck.call_count == 1
+
+
+def test_secret_types(mocker):
+    mocker.patch.dict(secrets._PUBLIC_KEYS, clear=True)
+    mocker.patch.object(secrets.PublicKey, "encrypt", side_effect=lambda value: f"encrypted-{value}")
+    this_repo = mock_repo(mocker, "https://api.github.com/repos/owner/repo")
+
+    # the is_dependabot bool these took is still taken, for now
+    with pytest.warns(DeprecationWarning):
+        assert create_secret(this_repo, "A", "value", True)
+    this_repo._requester.requestJsonAndCheck.assert_called_once_with(
+        "GET", f"{this_repo.url}/dependabot/secrets/public-key"
+    )
+    this_repo._requester.requestJson.return_value = (204, {}, "")
+    with pytest.warns(DeprecationWarning):
+        assert delete_secret(this_repo, "A", False)
+    assert this_repo._requester.requestJson.call_args.args == ("DELETE", f"{this_repo.url}/actions/secrets/A")
+
+    for secret_type in ("codespaces", "environments/", "environments/a/b"):
+        with pytest.raises(ValueError):
+            create_secret(this_repo, "A", "value", secret_type)
+        with pytest.raises(ValueError):
+            delete_secret(this_repo, "A", secret_type)
+
+
+def test_encrypt_secrets(mocker):
+    mocker.patch.dict(secrets._PUBLIC_KEYS, clear=True)
+    mocker.patch.object(secrets.PublicKey, "encrypt", side_effect=lambda value: f"encrypted-{value}")
+    this_repo = mock_repo(mocker, "https://api.github.com/repos/owner/other")
+
+    payloads = encrypt_secrets(this_repo, {"A": "a", "B": "b"})
+    assert payloads == {
+        "A": {"key_id": "1234", "encrypted_value": "encrypted-a"},
+        "B": {"key_id": "1234", "encrypted_value": "encrypted-b"},
+    }
+    assert this_repo._requester.requestJsonAndCheck.call_count == 1
+
+
+def test_secret_fingerprints(tmp_path):
+    fingerprints = SecretFingerprints(tmp_path / "fingerprints.json", "key")
+    assert not fingerprints.unchanged("owner/repo", "actions", "A", "value", "2024-01-01T00:00:00Z")
+
+    fingerprints.record("owner/repo", "actions", "A", "value", "2024-01-01T00:00:00Z")
+    fingerprints.save()
+
+    reloaded = SecretFingerprints(tmp_path / "fingerprints.json", "key")
+    assert reloaded.unchanged("owner/repo", "actions", "A", "value", "2024-01-01T00:00:00Z")
+    # a new value, or the secret being set by someone else since
+    assert not reloaded.unchanged("owner/repo", "actions", "A", "other", "2024-01-01T00:00:00Z")
+    assert not reloaded.unchanged("owner/repo", "actions", "A", "value", "2024-02-01T00:00:00Z")
+    assert not reloaded.unchanged("owner/repo", "actions", "A", "value", None)
+    # fingerprints made with another key never match
+    assert not SecretFingerprints(tmp_path / "fingerprints.json", "other").unchanged(
+        "owner/repo", "actions", "A", "value", "2024-01-01T00:00:00Z"
+    )
+    # the value is never stored
+    assert "value" not in (tmp_path / "fingerprints.json").read_text()
+
+
+def test_iter_repo_secrets_follows_pages(mocker):
+    this_repo = mock_repo(mocker, "https://api.github.com/repos/owner/repo")
+    next_url = "https://api.github.com/repos/owner/repo/actions/secrets?per_page=100&page=2"
+    this_repo._requester.requestJsonAndCheck.side_effect = [
+        ({"link": f'<{next_url}>; rel="next", <{next_url}>; rel="last"'}, {"secrets": [{"name": "A"}]}),
+        ({}, {"secrets": [{"name": "B", "updated_at": "2024-01-01T00:00:00Z"}]}),
+    ]
+
+    assert list(iter_repo_secrets(this_repo)) == [("A", None), ("B", "2024-01-01T00:00:00Z")]
+    assert [call.args[1] for call in this_repo._requester.requestJsonAndCheck.call_args_list] == [
+        "https://api.github.com/repos/owner/repo/actions/secrets",
+        next_url,
+    ]
+    assert this_repo._requester.requestJsonAndCheck.call_args_list[0].kwargs == {"parameters": {"per_page": 100}}
+
+
+def test_check_repo_secrets_fills_state(mocker):
+    this_repo = mock_repo(mocker, "https://api.github.com/repos/owner/repo")
+    listings = {
+        "actions": [{"name": "A", "updated_at": "2024-01-01T00:00:00Z"}, {"name": "OLD"}],
+        "dependabot": [],
+        "environments/production": [{"name": "DEPLOY_KEY"}],
+    }
+    this_repo._requester.requestJsonAndCheck.side_effect = lambda verb, url, parameters: (
+        {},
+        {"secrets": listings[url.removeprefix(f"{this_repo.url}/").removesuffix("/secrets")]},
+    )
+    state = RepoState()
+    config = [
+        Secret(key="A", value="a"),
+        Secret(key="B", value="b", type="dependabot"),
+        Secret(key="OLD", exists=False),
+        Secret(key="DEPLOY_KEY", value="key", type="environments/production"),
+    ]
+
+    check_result, diff = check_repo_secrets(this_repo, config, state)
+
+    assert check_result is False
+    assert diff == {"missing": ["B"], "extra": ["OLD"]}
+    assert state.secrets == {
+        "actions": {"A": "2024-01-01T00:00:00Z", "OLD": None},
+        "dependabot": {},
+        "environments/production": {"DEPLOY_KEY": None},
+    }
+
+    # secret types already in state aren't listed again
+    this_repo._requester.requestJsonAndCheck.reset_mock()
+    check_repo_secrets(this_repo, config, state)
+    assert this_repo._requester.requestJsonAndCheck.call_count == 0
+
+
+def test_sync_secrets_by_environment(mocker):
+    mocker.patch.dict(secrets._PUBLIC_KEYS, clear=True)
+    mocker.patch.object(secrets.PublicKey, "encrypt", side_effect=lambda value: f"encrypted-{value}")
+    this_repo = mock_repo(mocker, "https://api.github.com/repos/owner/environments")
+    config = [
+        Secret(key=f"SECRET_{i}", value="value", type=f"environments/{environment}")
+        for environment in ("staging", "production eu")
+        for i in range(3)
+    ]
+    config.append(Secret(key="OLD", type="environments/staging", exists=False))
+    this_repo._requester.requestJson.side_effect = lambda verb, url, input=None: (
+        204 if verb == "DELETE" else 201,
+        {},
+        "",
+    )
+
+    assert sync_secrets(this_repo, config, max_workers=2) == []
+
+    # one public key per environment
+    assert sorted(call.args[1] for call in this_repo._requester.requestJsonAndCheck.call_args_list) == [
+        f"{this_repo.url}/environments/production%20eu/secrets/public-key",
+        f"{this_repo.url}/environments/staging/secrets/public-key",
+    ]
+    requests = {(call.args[0], call.args[1]) for call in this_repo._requester.requestJson.call_args_list}
+    assert len(requests) == 7
+    assert ("DELETE", f"{this_repo.url}/environments/staging/secrets/OLD") in requests
+    assert ("PUT", f"{this_repo.url}/environments/production%20eu/secrets/SECRET_2") in requests
+
+
+def test_sync_secrets_skips_fingerprinted_secrets(mocker, tmp_path):
+    this_repo = mocker.MagicMock(full_name="owner/repo")
+    fingerprints = SecretFingerprints(tmp_path / "fingerprints.json", "key")
+    fingerprints.record("owner/repo", "actions", "SAME", "same", "2024-01-01T00:00:00Z")
+    fingerprints.record("owner/repo", "actions", "CHANGED", "old", "2024-01-01T00:00:00Z")
+    state = RepoState(secrets={"actions": {"SAME": "2024-01-01T00:00:00Z", "CHANGED": "2024-01-01T00:00:00Z"}})
+    encrypt_secrets = mocker.patch.object(
+        secrets, "encrypt_secrets", side_effect=lambda repo, values, secret_type: {key: {} for key in values}
+    )
+    put_secret = mocker.patch.object(secrets, "put_secret")
+    mocker.patch.object(secrets, "iter_repo_secrets", return_value=iter([("CHANGED", "2024-03-01T00:00:00Z")]))
+    config = [Secret(key="SAME", value="same"), Secret(key="CHANGED", value="new")]
+
+    assert sync_secrets(this_repo, config, state, fingerprints) == []
+
+    assert encrypt_secrets.call_args.args[1] == {"CHANGED": "new"}
+    assert [call.args[1] for call in put_secret.call_args_list] == ["CHANGED"]
+    assert fingerprints.unchanged("owner/repo", "actions", "CHANGED", "new", "2024-03-01T00:00:00Z")
+
+
+def test_plan_secrets(mocker, tmp_path):
+    mocker.patch.dict(secrets._PUBLIC_KEYS, clear=True)
+    mocker.patch.object(secrets.PublicKey, "encrypt", side_effect=lambda value: f"encrypted-{value}")
+    this_repo = mock_repo(mocker, "https://api.github.com/repos/owner/plan")
+    this_repo.full_name = "owner/plan"
+    fingerprints = SecretFingerprints(tmp_path / "fingerprints.json", "key")
+    fingerprints.record("owner/plan", "actions", "SAME", "same", "2024-01-01T00:00:00Z")
+    state = RepoState(secrets={"actions": {"SAME": "2024-01-01T00:00:00Z"}})
+    config = [Secret(key="SAME", value="same"), Secret(key="NEW", value="new"), Secret(key="OLD", exists=False)]
+
+    steps, errors = plan_secrets(this_repo, config, state, fingerprints)
+
+    assert errors == []
+    assert [(step["method"], step["url"], step.get("input", None)) for step in steps] == [
+        ("DELETE", f"{this_repo.url}/actions/secrets/OLD", None),
+        ("PUT", f"{this_repo.url}/actions/secrets/NEW", {"key_id": "1234", "encrypted_value": "encrypted-new"}),
+    ]
+    # the plan holds the fingerprint, never the value
+    assert "new" not in steps[1]["secret"].values()
+    assert this_repo._requester.requestJson.call_count == 0
+
+    # once applied, the fingerprint is recorded with the secret's new updated_at
+    requester = mocker.MagicMock()
+    requester.requestJsonAndCheck.return_value = ({}, {"secrets": [{"name": "NEW", "updated_at": "2024-02-01"}]})
+    record_planned_fingerprints(requester, fingerprints, steps)
+    assert fingerprints.unchanged("owner/plan", "actions", "NEW", "new", "2024-02-01")
+
+
+def test_plan_secrets_quotes_environments(mocker):
+    mocker.patch.dict(secrets._PUBLIC_KEYS, clear=True)
+    mocker.patch.object(secrets.PublicKey, "encrypt", side_effect=lambda value: f"encrypted-{value}")
+    this_repo = mock_repo(mocker, "https://api.github.com/repos/owner/plan")
+    state = RepoState(secrets={"environments/release candidate": {}})
+    config = [Secret(key="NEW", value="new", type="environments/release candidate")]
+
+    steps, errors = plan_secrets(this_repo, config, state)
+
+    assert errors == []
+    assert [step["url"] for step in steps] == [f"{this_repo.url}/environments/release%20candidate/secrets/NEW"]
+    assert this_repo._requester.requestJsonAndCheck.call_args.args[1] == (
+        f"{this_repo.url}/environments/release%20candidate/secrets/public-key"
+    )
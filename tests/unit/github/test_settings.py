@@ -0,0 +1,78 @@
+from github.GithubException import UnknownObjectException
+
+from repo_manager.gh.settings import check_repo_settings
+from repo_manager.gh.settings import plan_settings
+from repo_manager.gh.settings import settings_patch
+from repo_manager.gh.settings import update_settings
+from repo_manager.gh.state import RepoState
+from repo_manager.schemas.settings import Settings
+
+
+def mock_repo(mocker, **settings):
+    repo = mocker.MagicMock(url="https://api.github.com/repos/owner/repo", **settings)
+    repo.get_topics.return_value = ["python", "actions"]
+    repo._requester.requestJsonAndCheck.return_value = ({}, {})
+    return repo
+
+
+def test_settings_patch(mocker):
+    repo = mock_repo(mocker, has_wiki=True, has_issues=False, has_downloads=True)
+    settings = Settings(topics=["actions", "python"], has_wiki=True, has_issues=True, has_downloads=False)
+    state = RepoState()
+    check_repo_settings(repo, settings, state)
+
+    # topics are in a different order, but the same
+    assert settings_patch(repo, settings, state) == {"has_issues": True, "has_downloads": False}
+
+
+def test_update_settings_only_sends_changes(mocker):
+    repo = mock_repo(mocker, has_wiki=True, has_issues=False, has_downloads=True)
+    state = RepoState()
+    settings = Settings(topics=["python", "actions", "docs"], has_wiki=True, has_issues=True, has_downloads=False)
+    check_repo_settings(repo, settings, state)
+
+    assert update_settings(repo, settings, state) == {
+        "topics": ["python", "actions", "docs"],
+        "has_issues": True,
+        "has_downloads": False,
+    }
+    repo._requester.requestJsonAndCheck.assert_called_once_with(
+        "PATCH", repo.url, input={"has_issues": True, "has_downloads": False}
+    )
+    repo.replace_topics.assert_called_once_with(["python", "actions", "docs"])
+    assert repo.edit.call_count == 0
+
+    # the snapshot is kept up to date, so applying again is a no-op
+    repo.reset_mock()
+    assert update_settings(repo, settings, state) == {}
+    assert repo._requester.requestJsonAndCheck.call_count == 0
+    assert repo.replace_topics.call_count == 0
+
+
+def test_update_settings_reads_toggles(mocker):
+    repo = mock_repo(mocker)
+    repo.get_vulnerability_alert.return_value = True
+    repo.get_automated_security_fixes.side_effect = UnknownObjectException(404, {}, {})
+    settings = Settings(enable_vulnerability_alerts=True, enable_automated_security_fixes=True)
+
+    assert update_settings(repo, settings, RepoState(settings={})) == {"enable_automated_security_fixes": True}
+    repo.enable_automated_security_fixes.assert_called_once_with()
+    assert repo.enable_vulnerability_alert.call_count == 0
+    assert repo._requester.requestJsonAndCheck.call_count == 0
+
+
+def test_plan_settings(mocker):
+    repo = mock_repo(mocker, has_wiki=True, has_issues=False)
+    repo.get_vulnerability_alert.return_value = True
+    settings = Settings(topics=["python"], has_issues=True, enable_vulnerability_alerts=False)
+    state = RepoState()
+    check_repo_settings(repo, settings, state)
+
+    steps = plan_settings(repo, settings, state)
+
+    assert [(step["method"], step["url"], step.get("input", None)) for step in steps] == [
+        ("PATCH", repo.url, {"has_issues": True}),
+        ("DELETE", f"{repo.url}/vulnerability-alerts", None),
+        ("PUT", f"{repo.url}/topics", {"names": ["python"]}),
+    ]
+    assert repo._requester.requestJsonAndCheck.call_count == 0
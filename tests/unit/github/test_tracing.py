@@ -0,0 +1,158 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from requests import Request
+from requests import Response
+from requests.exceptions import ConnectionError
+
+from repo_manager import gh
+from repo_manager.gh.tracing import bind_trace_context
+from repo_manager.gh.tracing import set_trace_attributes
+from repo_manager.gh.tracing import traced
+from repo_manager.gh.tracing import tracer as shared_tracer
+from repo_manager.gh.tracing import Tracer
+from repo_manager.gh.tracing import url_template
+
+
+def make_response(status_code, body=b"", headers=None):
+    response = Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers or {})
+    return response
+
+
+def prepare(method="GET", url="https://api.github.com/repos/owner/repo", body=None):
+    return Request(method, url, data=body).prepare()
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://api.github.com/repos/owner/repo/labels/good%20first", "/repos/{owner}/{repo}/labels/{name}"),
+        (
+            "https://ghe.example.com/api/v3/repos/owner/repo/branches/feat/x/protection/required_status_checks",
+            "/repos/{owner}/{repo}/branches/{branch}/protection/required_status_checks",
+        ),
+        (
+            "https://api.github.com/repos/owner/repo/actions/secrets/public-key",
+            "/repos/{owner}/{repo}/actions/secrets/public-key",
+        ),
+        (
+            "https://api.github.com/repos/owner/repo/dependabot/secrets/TOKEN",
+            "/repos/{owner}/{repo}/dependabot/secrets/{name}",
+        ),
+        ("https://api.github.com/repos/owner/repo/contents/src/a.py?ref=main", "/repos/{owner}/{repo}/contents/{path}"),
+        ("https://api.github.com/repos/owner/repo/git/trees/abc123", "/repos/{owner}/{repo}/git/trees/{sha}"),
+        ("https://api.github.com/orgs/my-org/repos?per_page=100", "/orgs/{owner}/repos"),
+        ("https://api.github.com/graphql", "/graphql"),
+    ],
+)
+def test_url_template(url, expected):
+    assert url_template(url) == expected
+
+
+def test_tracer_records_span():
+    tracer = Tracer()
+
+    @traced(phase="apply")
+    def apply():
+        set_trace_attributes(resource="labels")
+        return tracer(
+            prepare("PATCH", "https://api.github.com/repos/owner/repo/labels/bug", body=b'{"color": "ffffff"}'),
+            send=lambda request, **kwargs: make_response(
+                200, b'{"name": "bug"}', {"X-RateLimit-Remaining": "4999", "X-RateLimit-Used": "1"}
+            ),
+        )
+
+    apply()
+    # attributes set by a traced function don't outlive it
+    tracer(prepare(), send=lambda request, **kwargs: make_response(304))
+
+    span, not_modified = tracer.spans
+    assert span.name == "PATCH /repos/{owner}/{repo}/labels/{name}"
+    assert span.status == 200
+    assert span.request_bytes == 19
+    assert span.response_bytes == 15
+    assert span.rate_limit_remaining == 4999
+    assert span.rate_limit_cost == 1
+    assert span.attributes == {"phase": "apply", "resource": "labels"}
+    assert not_modified.attributes == {}
+    assert not_modified.rate_limit_cost == 0
+
+
+def test_tracer_graphql_cost():
+    tracer = Tracer()
+    for used in ("10", "15"):
+        tracer(
+            prepare("POST", "https://api.github.com/graphql", body=b"{}"),
+            send=lambda request, used=used, **kwargs: make_response(200, b"{}", {"X-RateLimit-Used": used}),
+        )
+    assert [span.rate_limit_cost for span in tracer.spans] == [1, 5]
+    assert tracer.spans[0].rate_limit_resource == "graphql"
+
+
+def test_tracer_records_errors():
+    tracer = Tracer()
+
+    def send(request, **kwargs):
+        raise ConnectionError("reset by peer")
+
+    with pytest.raises(ConnectionError):
+        tracer(prepare(), send=send)
+    assert tracer.spans[0].status is None
+    assert tracer.spans[0].error == "reset by peer"
+    assert tracer.summary()[0]["statuses"] == {"error": 1}
+
+
+def test_bind_trace_context_crosses_threads():
+    tracer = Tracer()
+
+    @traced(repo="owner/repo")
+    def check():
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for resource in ("settings", "labels"):
+                executor.submit(
+                    bind_trace_context(tracer, phase="check", resource=resource),
+                    prepare(),
+                    send=lambda request, **kwargs: make_response(200),
+                ).result()
+
+    check()
+    assert [span.attributes for span in tracer.spans] == [
+        {"repo": "owner/repo", "phase": "check", "resource": "settings"},
+        {"repo": "owner/repo", "phase": "check", "resource": "labels"},
+    ]
+
+
+def test_tracer_export(tmp_path):
+    tracer = Tracer()
+    set_labels = bind_trace_context(tracer, phase="check", resource="labels")
+    set_labels(prepare(), send=lambda request, **kwargs: make_response(404))
+
+    tracer.export(tmp_path / "trace.json")
+
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    assert trace["spans"][0]["template"] == "/repos/{owner}/{repo}"
+    assert trace["summary"][0]["phase"] == "check"
+    assert trace["summary"][0]["statuses"] == {"404": 1}
+
+    otlp = json.loads((tmp_path / "trace.otlp.json").read_text())
+    span = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert span["name"] == "GET /repos/{owner}/{repo}"
+    assert span["status"] == {"code": 2}
+    attributes = {attribute["key"]: attribute["value"] for attribute in span["attributes"]}
+    assert attributes["http.response.status_code"] == {"intValue": "404"}
+    assert attributes["repo_manager.resource"] == {"stringValue": "labels"}
+
+
+def test_tracer_is_only_installed_to_trace(mocker):
+    build_github_client = mocker.patch.object(gh, "build_github_client")
+
+    gh.get_github_client("untraced-token", "https://api.github.com")
+    gh.get_github_client("traced-token", "https://api.github.com", trace=True)
+
+    untraced, traced = [call.args[2] for call in build_github_client.call_args_list]
+    assert shared_tracer not in untraced
+    assert traced[-1] is shared_tracer
@@ -0,0 +1,86 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from repo_manager.gh import transport
+from repo_manager.gh.transport import build_github_client
+from repo_manager.gh.transport import ConnectionStats
+from repo_manager.gh.transport import PoolSettings
+
+
+class RepoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        full_name = self.path.removeprefix("/api/v3/repos/")
+        body = json.dumps({"full_name": full_name, "url": f"http://{self.headers['Host']}{self.path}"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RepoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("keep_alive,connections", [(True, 1), (False, 3)])
+def test_connections_are_reused(mocker, api_url, keep_alive, connections):
+    mocker.patch.object(transport, "connection_stats", ConnectionStats())
+    client = build_github_client("1234", api_url, pool=PoolSettings(keep_alive=keep_alive))
+
+    for _ in range(3):
+        assert client.get_repo("owner/repo").full_name == "owner/repo"
+
+    assert transport.connection_stats.summary() == {
+        "requests": 3,
+        "connections": connections,
+        "reused": 3 - connections,
+        "reuse_ratio": round((3 - connections) / 3, 3),
+    }
+
+
+def test_pool_settings_reach_the_adapter(mocker, api_url):
+    sent = []
+
+    def middleware(request, send, **kwargs):
+        sent.append((request.headers.get("Connection"), kwargs["timeout"]))
+        return send(request, **kwargs)
+
+    pool = PoolSettings(pool_size=2, max_connections_per_host=4, keep_alive=False, connect_timeout=1.5)
+    client = build_github_client("1234", api_url, [middleware], pool)
+    client.get_repo("owner/repo")
+
+    adapter = client.requester._Requester__connection.session.get_adapter(api_url)
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 4
+    assert sent == [("close", (1.5, 15.0))]
+
+
+def test_threads_share_a_client(api_url):
+    client = build_github_client("1234", api_url)
+    connection = client.requester._Requester__createConnection()
+    # both threads make their request before either sends it, as a thread switch between the two can do
+    both_requested = threading.Barrier(2)
+
+    def get_repo(repo_name):
+        connection.request("GET", f"/api/v3/repos/{repo_name}", None, {})
+        both_requested.wait()
+        return json.loads(connection.getresponse().read())["full_name"]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert list(executor.map(get_repo, ["owner/a", "owner/b"])) == ["owner/a", "owner/b"]
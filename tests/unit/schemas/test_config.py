@@ -0,0 +1,36 @@
+import pytest
+from pydantic import ValidationError
+
+from repo_manager.schemas import load_config
+
+
+def test_load_config(tmp_path, mocker):
+    (tmp_path / "workflow.yml").write_text("name: test\n")
+    settings_file = tmp_path / "settings.yml"
+    settings_file.write_text(
+        f"""
+settings: {{}}
+labels:
+  - name: bug
+secrets:
+  - key: TOKEN
+    value: foo
+files:
+  - src_file: {tmp_path / "workflow.yml"}
+    dest_file: .github/workflows/workflow.yml
+  - src_file: remote://README.md
+    dest_file: README.rst
+"""
+    )
+    config = load_config(str(settings_file))
+
+    # local files are read as the config is loaded
+    opened = mocker.patch("builtins.open")
+    assert config.files[0].src_file_contents == "name: test\n"
+    assert opened.call_count == 0
+    # the indexes are built once
+    assert config.labels_dict is config.labels_dict
+    assert list(config.secrets_dict.keys()) == ["TOKEN"]
+
+    with pytest.raises(ValidationError):
+        config.labels = []
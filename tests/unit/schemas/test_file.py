@@ -8,6 +8,7 @@ import yaml
 from pydantic import ValidationError
 
 from repo_manager.schemas import FileConfig
+from repo_manager.schemas.file import git_blob_sha
 
 
 VALID_CONFIG = {
@@ -75,3 +76,15 @@ def test_file_commit_key():
 
     this_file_config.target_branch = "develop"
     assert this_file_config.commit_key == "repo_manager file commit_develop"
+
+
+def test_file_src_file_read_once(mocker):
+    this_file_config = FileConfig(**VALID_CONFIG)
+    with open(VALID_CONFIG["src_file"]) as fh:
+        contents = fh.read()
+    assert this_file_config.load() == git_blob_sha(contents)
+
+    opened = mocker.patch("builtins.open")
+    assert this_file_config.src_file_contents == contents
+    assert this_file_config.src_file_sha == git_blob_sha(contents)
+    assert opened.call_count == 0
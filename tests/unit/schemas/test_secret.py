@@ -62,3 +62,10 @@ def test_example_works():
     assert len(example_data["secrets"]) > 0
     for secret in example_data["secrets"]:
         Secret(**secret)
+
+
+def test_secret_validate_type():
+    assert Secret(key="test", value="test", type="environments/production").type == "environments/production"
+    for secret_type in ["environment", "environments/", "environments/a/b", "org"]:
+        with pytest.raises(ValidationError):
+            Secret(key="test", value="test", type=secret_type)
@@ -0,0 +1,118 @@
+from repo_manager import runner
+from repo_manager.gh.plan import request_step
+from repo_manager.schemas import RepoManagerConfig
+
+
+def test_run_repo_collects_errors(mocker):
+    mocker.patch.object(runner, "get_repo", side_effect=Exception("bad token"))
+    result = runner.run_repo(mocker.MagicMock(), "owner/repo", RepoManagerConfig(settings=None), "check")
+    assert result["repo"] == "owner/repo"
+    assert result["check"] is False
+    assert result["errors"] == [{"type": "repo", "error": "bad token"}]
+
+
+def test_run_fleet(mocker):
+    mock_repo = mocker.MagicMock(full_name="owner/repo-a")
+    mocker.patch.object(runner, "get_repo", return_value=(True, mocker.MagicMock(full_name="owner/repo-b")))
+    check_repo = mocker.patch.object(runner, "check_repo", return_value=(True, {}))
+    apply_repo = mocker.patch.object(runner, "apply_repo", return_value=([], ["1234"]))
+    state = runner.RepoState(settings={})
+    fetch_repo_states = mocker.patch.object(runner, "fetch_repo_states", return_value={"owner/repo-b": state})
+
+    results = runner.run_fleet(
+        mocker.MagicMock(), [mock_repo, "owner/repo-b"], RepoManagerConfig(settings=None), "apply", max_workers=2
+    )
+    assert list(results.keys()) == ["owner/repo-a", "owner/repo-b"]
+    assert check_repo.call_count == 2
+    assert apply_repo.call_count == 2
+    assert all(result["commits"] == ["1234"] for result in results.values())
+    # both repos were prefetched in one batch
+    fetch_repo_states.assert_called_once()
+    assert fetch_repo_states.call_args.args[1] == ["owner/repo-a", "owner/repo-b"]
+    states = {call.args[0].full_name: call.args[2] for call in check_repo.call_args_list}
+    assert states["owner/repo-b"] is state
+    assert states["owner/repo-a"] == runner.RepoState()
+    # apply reads the same snapshot the check filled in
+    assert all(call.args[3] is states[call.args[0].full_name] for call in apply_repo.call_args_list)
+
+
+def test_run_fleet_streams_repos(mocker):
+    checked = []
+
+    def stream():
+        for i in range(runner.GRAPHQL_BATCH_SIZE * 6):
+            # repos are only listed up to a couple of batches ahead of the repos that are done
+            assert i - len(checked) < runner.GRAPHQL_BATCH_SIZE * 2
+            yield f"owner/repo-{i:03d}"
+
+    def check_repo(repo, config, state):
+        checked.append(repo.full_name)
+        return True, {}
+
+    mocker.patch.object(runner, "get_repo", side_effect=lambda client, name: (True, mocker.MagicMock(full_name=name)))
+    mocker.patch.object(runner, "check_repo", side_effect=check_repo)
+    mocker.patch.object(runner, "fetch_repo_states", return_value={})
+
+    results = runner.run_fleet(mocker.MagicMock(), stream(), RepoManagerConfig(settings=None), "check", max_workers=4)
+    assert len(results) == runner.GRAPHQL_BATCH_SIZE * 6
+    assert all(result["check"] for result in results.values())
+
+
+def test_prefetch_repo_states_falls_back(mocker):
+    mocker.patch.object(runner, "fetch_repo_states", side_effect=Exception("graphql is down"))
+    warning = mocker.patch.object(runner.actions_toolkit, "warning")
+    assert runner.prefetch_repo_states(mocker.MagicMock(), ["owner/repo"], RepoManagerConfig(settings={})) == {}
+    warning.assert_called_once()
+
+
+def test_check_repo(mocker):
+    mocker.patch.object(runner, "check_repo_settings", return_value=(True, []))
+    mocker.patch.object(runner, "check_repo_secrets", return_value=(True, {"missing": [], "extra": []}))
+    mocker.patch.object(
+        runner, "check_repo_labels", return_value=(False, {"missing": ["bug"], "extra": [], "diffs": {}})
+    )
+    mocker.patch.object(runner, "check_repo_branch_protections", return_value=(True, None))
+    mocker.patch.object(runner, "check_repo_files", return_value=(True, {"missing": [], "extra": [], "diffs": {}}))
+
+    check_result, diffs = runner.check_repo(mocker.MagicMock(), RepoManagerConfig(settings={}))
+    assert check_result is False
+    assert list(diffs.keys()) == ["settings", "secrets", "labels", "files"]
+    assert diffs["labels"]["missing"] == ["bug"]
+
+
+def test_apply_plan_repo(mocker):
+    client = mocker.MagicMock()
+    client.requester.requestJsonAndCheck.side_effect = [Exception("Not Found"), ({}, {})]
+    steps = [
+        request_step("labels", "Delete bug", "DELETE", "https://api.github.com/repos/owner/repo/labels/bug"),
+        request_step("settings", "Update has_wiki", "PATCH", "https://api.github.com/repos/owner/repo"),
+    ]
+
+    result = runner.apply_plan_repo(client, "owner/repo", steps)
+
+    # a failed step doesn't stop the rest of the plan
+    assert client.requester.requestJsonAndCheck.call_count == 2
+    assert result["errors"] == [{"type": "plan-step", "resource": "labels", "step": "Delete bug", "error": "Not Found"}]
+    # the repo isn't fetched or checked again
+    assert client.get_repo.call_count == 0
+
+
+def test_run_repo_incremental(mocker):
+    mock_repo = mocker.MagicMock(full_name="owner/repo")
+    check_repo = mocker.patch.object(runner, "check_repo", return_value=(True, {}))
+    incremental = mocker.MagicMock()
+    config = RepoManagerConfig(settings={}, labels=[{"name": "bug"}])
+    incremental.config_for.return_value = (config.model_copy(update={"settings": None}), ["settings"])
+
+    result = runner.run_repo(mocker.MagicMock(), mock_repo, config, "check", incremental=incremental)
+
+    assert result["skipped"] == ["settings"]
+    assert check_repo.call_args.args[1].settings is None
+    assert check_repo.call_args.args[1].labels is not None
+    incremental.record_result.assert_called_once_with(mock_repo, {}, applied=False)
+
+    # nothing is recorded for a repo that had errors
+    incremental.reset_mock()
+    check_repo.side_effect = Exception("Server Error")
+    runner.run_repo(mocker.MagicMock(), mock_repo, config, "check", incremental=incremental)
+    assert incremental.record_result.call_count == 0